@@ -0,0 +1,97 @@
+"""
+Benchmark websocket frame decoding.
+
+Compares the previous path (json.loads into dicts, then float() on every price
+and size) against poly_data.decoding with each installed JSON backend, on
+synthetic book and price_change frames shaped like the market channel.
+
+    uv run python -m benchmarks.decode_benchmark
+"""
+import json
+import random
+import time
+
+import poly_data.decoding as decoding
+from poly_data.orderbook import price_to_tick
+
+MARKET = "0x5f65177b394277fd294cd75650044e32ba009a95022d88a0c1d565897d72f8f1"
+ASSET = "71321045679252212594626385532706912750332728571942532289631379312455583992563"
+
+
+def _levels(count, start, step):
+    return [{"price": f"{start + i * step:.3f}".rstrip('0'), "size": f"{random.uniform(1, 5000):.2f}"}
+            for i in range(count)]
+
+
+def make_frames(n_frames=2000, book_depth=60, changes_per_frame=8):
+    frames = []
+    for i in range(n_frames):
+        if i % 50 == 0:
+            data = [{
+                "event_type": "book", "market": MARKET, "asset_id": ASSET,
+                "bids": _levels(book_depth, 0.01, 0.007), "asks": _levels(book_depth, 0.53, 0.007),
+                "hash": "0x" + "ab" * 20, "timestamp": str(1750000000000 + i),
+            }]
+        else:
+            data = {
+                "event_type": "price_change", "market": MARKET, "timestamp": str(1750000000000 + i),
+                "price_changes": [{
+                    "asset_id": ASSET, "price": f"{random.randint(1, 99) / 100:.2f}",
+                    "size": f"{random.choice([0, random.uniform(1, 5000)]):.2f}",
+                    "side": random.choice(["BUY", "SELL"]), "hash": "0x" + "cd" * 20,
+                    "best_bid": "0.48", "best_ask": "0.52",
+                } for _ in range(changes_per_frame)],
+            }
+        frames.append(json.dumps(data))
+    return frames
+
+
+def baseline(frames):
+    for raw in frames:
+        data = json.loads(raw)
+        for message in data if isinstance(data, list) else [data]:
+            if message['event_type'] == 'book':
+                [(price_to_tick(float(l['price'])), float(l['size'])) for l in message['bids']]
+                [(price_to_tick(float(l['price'])), float(l['size'])) for l in message['asks']]
+            else:
+                for change in message['price_changes']:
+                    side = 'bids' if change['side'] == 'BUY' else 'asks'
+                    price_to_tick(float(change['price']))
+                    float(change['size'])
+
+
+def schema_decode(frames):
+    for raw in frames:
+        decoding.decode_market_frame(raw)
+
+
+def timed(fn, frames, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(frames)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    random.seed(7)
+    frames = make_frames()
+    total_bytes = sum(len(f) for f in frames)
+
+    base = timed(baseline, frames)
+    print(f"{len(frames)} frames, {total_bytes / 1e6:.1f} MB")
+    print(f"{'json.loads + float()':<28}{base * 1e6 / len(frames):8.1f} us/frame")
+
+    for backend in ('json', 'ujson', 'orjson'):
+        try:
+            decoding.set_json_backend(backend)
+        except ValueError:
+            continue
+        elapsed = timed(schema_decode, frames)
+        print(f"{'decoding (' + backend + ')':<28}{elapsed * 1e6 / len(frames):8.1f} us/frame"
+              f"   {base / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
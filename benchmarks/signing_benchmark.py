@@ -0,0 +1,83 @@
+"""
+Benchmark EIP-712 order signing.
+
+Signs a batch of synthetic orders with a throwaway key, first inline on this
+process (what ClobClient.create_order does) and then through
+poly_data.signing_service with 1 up to the number of CPU cores worker
+processes, and reports signatures per second for each.
+
+    uv run python -m benchmarks.signing_benchmark [n_orders]
+"""
+import os
+import random
+import sys
+import time
+
+from eth_account import Account
+from py_clob_client.clob_types import CreateOrderOptions, OrderArgs
+from py_clob_client.constants import POLYGON
+from py_clob_client.order_builder.builder import OrderBuilder
+from py_clob_client.signer import Signer
+
+from poly_data.signing_service import SigningService
+
+TOKEN = "71321045679252212594626385532706912750332728571942532289631379312455583992563"
+
+
+def make_jobs(n_orders):
+    jobs = []
+    for _ in range(n_orders):
+        order_args = OrderArgs(
+            token_id=TOKEN,
+            price=random.randint(10, 90) / 100,
+            size=round(random.uniform(5, 500), 2),
+            side=random.choice(["BUY", "SELL"]),
+        )
+        jobs.append((order_args, "0.01", random.random() < 0.5))
+    return jobs
+
+
+def inline(key, funder, jobs):
+    builder = OrderBuilder(Signer(key, POLYGON), sig_type=2, funder=funder)
+    start = time.perf_counter()
+    for order_args, tick_size, neg_risk in jobs:
+        builder.create_order(order_args, CreateOrderOptions(tick_size=tick_size, neg_risk=neg_risk))
+    return time.perf_counter() - start
+
+
+def pooled(key, funder, jobs, workers):
+    service = SigningService(key, funder, workers=workers)
+    try:
+        service.warm_up()
+        start = time.perf_counter()
+        service.sign(jobs)
+        return time.perf_counter() - start
+    finally:
+        service.close()
+
+
+def main():
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    random.seed(7)
+
+    key = Account.create().key.hex()
+    funder = Account.create().address
+    jobs = make_jobs(n_orders)
+    cores = os.cpu_count() or 1
+
+    base = inline(key, funder, jobs)
+    print(f"{n_orders} orders, {cores} cores")
+    print(f"{'inline':<16}{n_orders / base:10.1f} sig/s")
+
+    workers = 1
+    while workers <= cores:
+        elapsed = pooled(key, funder, jobs, workers)
+        print(f"{str(workers) + ' workers':<16}{n_orders / elapsed:10.1f} sig/s   {base / elapsed:.2f}x")
+        workers *= 2
+    if workers // 2 != cores:
+        elapsed = pooled(key, funder, jobs, cores)
+        print(f"{str(cores) + ' workers':<16}{n_orders / elapsed:10.1f} sig/s   {base / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,34 @@
 import gc                      # Garbage collection
 import time                    # Time functions
 import asyncio                 # Asynchronous I/O
-import traceback               # Exception handling
 import threading               # Thread management
+import os                      # Environment configuration
+import queue                   # Supervisor inbox timeouts
+from concurrent.futures import Future
 
 from poly_data.polymarket_client import PolymarketClient
-from poly_data.data_utils import update_markets, update_positions, update_orders
-from poly_data.websocket_handlers import connect_market_websocket, connect_user_websocket
+from poly_data.data_utils import load_markets, reconcile_report, update_markets, update_positions, update_orders
+from poly_data.websocket_handlers import maintain_user_websocket, MarketFeed
+from poly_data.journal import FeedRecorder
+from poly_data.feed_thread import FeedHandoff, FeedThread
+import poly_data.clock as clock
 import poly_data.global_state as global_state
-from poly_data.data_processing import remove_from_performing
+from poly_data.data_processing import process_user_data, remove_from_pending
+from poly_data.supervisor import Supervisor
+from poly_data.state_reducer import state_reducer
+from poly_data.book_integrity import book_integrity
+from poly_data.order_gateway import order_gateway
+from poly_data.latency import latency_tracer
+from poly_data.metrics import start_metrics_server
+from poly_data.live_state import StatePublisher, StateReader, start_state_server, state_names
+from poly_data.log import get_logger, install_state_dump, setup_logging
+from strategies.scheduler import trigger_scheduler
 from dotenv import load_dotenv
 
 load_dotenv()
 
+log = get_logger(__name__)
+
 def update_once():
     """
     Initialize the application state by fetching market data, positions, and orders.
@@ -21,95 +37,270 @@ def update_once():
     update_positions()  # Get current positions from Polymarket
     update_orders()     # Get current orders from Polymarket
 
-def remove_from_pending():
+def run_on_loop(loop, func, *args):
     """
-    Clean up stale trades that have been pending for too long (>15 seconds).
-    This prevents the system from getting stuck on trades that may have failed.
+    Call func(*args) on the event loop and return its result.
+
+    Orders and positions are only written on the loop, where the user channel
+    applies its events, so threads hand REST snapshots over with this rather
+    than applying them themselves. Called on the loop itself, func runs directly.
     """
     try:
-        current_time = time.time()
-            
-        # Iterate through all performing trades
-        for col in list(global_state.performing.keys()):
-            for trade_id in list(global_state.performing[col]):
-                
-                try:
-                    # If trade has been pending for more than 15 seconds, remove it
-                    if current_time - global_state.performing_timestamps[col].get(trade_id, current_time) > 15:
-                        print(f"Removing stale entry {trade_id} from {col} after 15 seconds")
-                        remove_from_performing(col, trade_id)
-                        print("After removing: ", global_state.performing, global_state.performing_timestamps)
-                except:
-                    print("Error in remove_from_pending")
-                    print(traceback.format_exc())                
-    except:
-        print("Error in remove_from_pending")
-        print(traceback.format_exc())
-
-def update_periodically():
+        on_loop = asyncio.get_running_loop() is loop
+    except RuntimeError:
+        on_loop = False
+    if on_loop:
+        return func(*args)
+
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+
+    loop.call_soon_threadsafe(run)
+    return future.result()
+
+def update_periodically(loop):
     """
     Background thread function that periodically updates market data, positions and orders.
-    - Positions and orders are updated every 5 seconds
-    - Market data is updated every 30 seconds (every 6 cycles)
-    - Stale pending trades are removed each cycle
+    - Orders and positions follow the user channel; they are audited against REST
+      every REST_AUDIT_SECONDS (60 by default) and right after the user channel reconnects.
+      Snapshots are fetched here and applied on the event loop
+    - Market data is updated every 30 seconds
+    - Stale pending trades are removed every 5 seconds
     """
-    i = 1
+    audit_seconds = float(os.getenv("REST_AUDIT_SECONDS", "60"))
+    last_audit = last_markets = time.time()
+
     while True:
-        time.sleep(5)  # Update every 5 seconds
-        
+        audit_requested = state_reducer.wait_for_audit_request(5)
+
         try:
             # Clean up stale trades
             remove_from_pending()
-            
-            # Update positions and orders every cycle
-            update_positions(avgOnly=True)  # Only update average price, not position size
-            update_orders()
 
-            # Update market data every 6th cycle (30 seconds)
-            if i % 6 == 0:
+            now = time.time()
+            if audit_requested or now - last_audit >= audit_seconds:
+                pos_df = global_state.client.get_all_positions()
+                run_on_loop(loop, update_positions, True, pos_df)  # Only update average price, not position size
+                fetched_at = clock.time()
+                all_orders = global_state.client.get_all_orders()
+                run_on_loop(loop, update_orders, all_orders, fetched_at)
+                last_audit = now
+
+            # Update market data every 30 seconds
+            if now - last_markets >= 30:
                 update_markets()
-                i = 1
-                    
+                log_reports()
+                last_markets = now
+
             gc.collect()  # Force garbage collection to free memory
-            i += 1
-        except:
-            print("Error in update_periodically")
-            print(traceback.format_exc())
-            
+        except Exception:
+            log.error("Error in update_periodically", exc_info=True)
+
+def log_reports():
+    """Log the feed, strategy, gateway and latency counters. Called every 30 seconds."""
+    log.info("Strategy triggers", report=trigger_scheduler.stats())
+    log.info("Market shards", report=global_state.market_feed.report())
+    log.info("Book integrity", report=book_integrity.report())
+    log.info("Order gateway", report=order_gateway.report())
+    log.info("Latency", report=latency_tracer.report())
+    log.info("Position reconciliation", report=reconcile_report())
+    log.info("Order and position state", report=state_reducer.report())
+    if global_state.client.order_cache is not None:
+        global_state.client.order_cache.expire()
+        log.info("Order cache", report=global_state.client.order_cache.report())
+    if global_state.feed_handoff is not None:
+        log.info("Feed handoff", report=global_state.feed_handoff.report())
+    if global_state.state_publisher is not None:
+        log.info("State publisher", report=global_state.state_publisher.report())
+
+def apply_message(message, loop):
+    """
+    Apply one message from the supervisor to this worker process.
+
+    Sheet reloads are applied on the calling thread, as update_periodically
+    does; user channel rows and position and order snapshots are applied on the
+    event loop, where the user websocket and the REST audit apply theirs.
+    """
+    kind = message[0]
+
+    if kind == 'user':
+        loop.call_soon_threadsafe(process_user_data, message[1])
+    elif kind == 'markets':
+        load_markets(message[1], message[2])
+        if global_state.market_feed is not None:
+            log_reports()
+        gc.collect()
+    elif kind == 'positions':
+        run_on_loop(loop, update_positions, message[2], message[1])
+    elif kind == 'orders':
+        run_on_loop(loop, update_orders, message[1], message[2])
+
+def apply_inbox(inbox, loop):
+    """Background thread of a worker process applying what the supervisor sends it."""
+    last_cleanup = time.time()
+    while True:
+        try:
+            message = inbox.get(timeout=5)
+        except queue.Empty:
+            message = None
+
+        try:
+            if message is not None:
+                apply_message(message, loop)
+
+            # Clean up stale trades every 5 seconds, as update_periodically does
+            if time.time() - last_cleanup >= 5:
+                remove_from_pending()
+                last_cleanup = time.time()
+        except Exception:
+            log.error("Error applying message from the supervisor", kind=message[0] if message else 'cleanup',
+                      exc_info=True)
+
+async def receive_snapshot(inbox):
+    """Wait for the markets, positions and orders the supervisor sends a new worker."""
+    loop = asyncio.get_running_loop()
+    received = set()
+    while not {'markets', 'positions', 'orders'} <= received:
+        message = await loop.run_in_executor(None, inbox.get)
+        apply_message(message, loop)
+        received.add(message[0])
+
+def run_worker(index, workers, inbox, store):
+    """
+    Entry point of one worker process of the supervisor, trading the markets
+    market_owner() assigns to index.
+
+    Args:
+        index (int): This worker's index
+        workers (int): Number of workers
+        inbox (multiprocessing.Queue): Messages from the supervisor
+        store (SharedStore): Shared positions, orders and risk-off state
+    """
+    setup_logging()
+    install_state_dump()
+
+    global_state.shard = (index, workers)
+    global_state.store = store
+    asyncio.run(trade(inbox))
+
 async def main():
     """
     Main application entry point. Initializes client, data, and manages websocket connections.
     """
+    # Queue log records to a background writer; kill -USR1 dumps the trading state
+    setup_logging()
+    install_state_dump()
+
+    # Optionally serve the state published to shared memory (by every worker, under a supervisor)
+    state_reader = StateReader.from_env()
+    state_port = int(os.getenv("STATE_PORT", "0"))
+    if state_reader is not None and state_port > 0:
+        start_state_server(state_reader, state_port)
+
+    # Optionally split the markets across worker processes under a supervisor
+    workers = int(os.getenv("MARKET_WORKERS", "1"))
+    if workers > 1:
+        await Supervisor(workers, run_worker, audit_interval=float(os.getenv("REST_AUDIT_SECONDS", "60"))).run()
+    else:
+        await trade()
+
+async def trade(inbox=None):
+    """
+    Trade the selected markets: on its own in a single process, or as one worker
+    of the supervisor when inbox is given.
+
+    Args:
+        inbox (multiprocessing.Queue, optional): Messages from the supervisor, which
+            replace polling the sheet and REST APIs and the user websocket
+    """
     # Initialize client
     global_state.client = PolymarketClient()
-    
+
+    # Tick-to-trade latency histograms are on unless LATENCY_TRACING=0
+    latency_tracer.enabled = os.getenv("LATENCY_TRACING", "1") != "0"
+
+    # Optionally sign orders on worker processes. Started before any other
+    # thread since the workers are forked from this process.
+    signing_workers = int(os.getenv("SIGNING_WORKERS", "0"))
+    if signing_workers > 0:
+        global_state.client.enable_signing_service(signing_workers)
+
+    # Optionally sign orders in the background at the prices around each quote
+    presign_levels = int(os.getenv("PRESIGN_LEVELS", "0"))
+    if presign_levels > 0 and signing_workers > 0:
+        global_state.client.enable_order_cache(levels=presign_levels)
+    elif presign_levels > 0:
+        log.warning("PRESIGN_LEVELS needs SIGNING_WORKERS, not presigning orders", presign_levels=presign_levels)
+
     # Initialize state and fetch initial data
     global_state.all_tokens = []
-    update_once()
-    print("After initial updates: ", global_state.orders, global_state.positions)
+    if inbox is None:
+        update_once()
+    else:
+        global_state.store.start_publisher()
+        await receive_snapshot(inbox)
+    log.debug("After initial updates", orders=repr(global_state.orders), positions=repr(global_state.positions))
+
+    log.info("Starting to trade", markets=len(global_state.df), positions=len(global_state.positions),
+             orders=len(global_state.orders))
+
+    # Optionally journal every raw websocket frame for replay and incident analysis
+    journal_dir = os.getenv("FEED_JOURNAL_DIR")
+    if journal_dir:
+        if global_state.shard is not None:
+            journal_dir = os.path.join(journal_dir, f"worker-{global_state.shard[0]}")
+        global_state.recorder = FeedRecorder(journal_dir)
+        global_state.recorder.start()
+
+    # Market shards and the user socket each reconnect on their own. Market set
+    # changes from update_markets are applied to the live subscriptions.
+    tokens_per_shard = int(os.getenv("MARKET_WS_TOKENS_PER_SHARD", "0"))
+
+    # Optionally receive and decode market data on a dedicated thread, handing
+    # decoded frames to this loop through a ring buffer
+    if os.getenv("MARKET_FEED_THREAD", "0") == "1":
+        global_state.feed_handoff = FeedHandoff()
+    global_state.market_feed = MarketFeed(tokens_per_shard, global_state.feed_handoff)
 
-    print("\n")
-    print(f'There are {len(global_state.df)} market, {len(global_state.positions)} positions and {len(global_state.orders)} orders. Starting positions: {global_state.positions}')
+    # Optionally serve Prometheus metrics on a local port
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if metrics_port > 0:
+        # Workers serve on the ports after the configured one
+        start_metrics_server(metrics_port + (global_state.shard[0] + 1 if global_state.shard else 0))
 
     # Start background update thread
-    update_thread = threading.Thread(target=update_periodically, daemon=True)
+    if inbox is None:
+        update_thread = threading.Thread(target=update_periodically, args=(asyncio.get_running_loop(),),
+                                         daemon=True)
+    else:
+        update_thread = threading.Thread(target=apply_inbox, args=(inbox, asyncio.get_running_loop()), daemon=True)
     update_thread.start()
-    
-    # Main loop - maintain websocket connections
-    while True:
-        try:
-            # Connect to market and user websockets simultaneously
-            await asyncio.gather(
-                connect_market_websocket(global_state.all_tokens), 
-                connect_user_websocket()
-            )
-            print("Reconnecting to the websocket")
-        except:
-            print("Error in main loop")
-            print(traceback.format_exc())
-            
-        await asyncio.sleep(1)
-        gc.collect()  # Clean up memory
+
+    if global_state.feed_handoff is not None:
+        FeedThread(global_state.market_feed).start(global_state.all_tokens)
+        market_data = global_state.feed_handoff.run()
+    else:
+        market_data = global_state.market_feed.run(list(global_state.all_tokens))
+
+    tasks = [market_data, book_integrity.monitor()]
+
+    # Optionally publish books, positions and orders to shared memory for sidecar processes
+    state_name = os.getenv("STATE_SHM_NAME")
+    if state_name:
+        if global_state.shard is not None:
+            state_name = state_names(state_name, global_state.shard[1])[global_state.shard[0]]
+        global_state.state_publisher = StatePublisher(state_name)
+        tasks.append(global_state.state_publisher.run(float(os.getenv("STATE_PUBLISH_INTERVAL", "0.5"))))
+    if inbox is None:
+        # Workers get their user channel rows from the supervisor
+        tasks.append(maintain_user_websocket())
+
+    await asyncio.gather(*tasks)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,247 @@
+import asyncio
+from collections import Counter
+
+import poly_data.clock as clock
+import poly_data.global_state as global_state
+from poly_data.log import get_logger
+from poly_data.orderbook import OrderBook, price_to_tick
+from strategies.scheduler import trigger_scheduler
+
+log = get_logger(__name__)
+
+
+class MarketIntegrity:
+    """Integrity state of the order book of one market."""
+
+    __slots__ = ('asset_id', 'last_timestamp', 'last_hash', 'last_update', 'resyncing', 'generation',
+                 'buffer', 'counters')
+
+    def __init__(self, asset_id=None):
+        self.asset_id = asset_id
+        self.last_timestamp = 0
+        self.last_hash = None
+        self.last_update = clock.time()
+        self.resyncing = False
+        self.generation = 0
+        self.buffer = []
+        self.counters = Counter()
+
+
+class BookIntegrity:
+    """
+    Checks every market channel frame before it is applied to the order books.
+
+    The feed carries no sequence numbers, so problems are inferred from the
+    fields it does send:
+
+    - frame timestamps must not go backwards; an older delta means updates were
+      reordered or lost in between (gap),
+    - a frame whose hash equals the last applied one is a duplicate and skipped,
+    - deltas for a market without a snapshot are a gap,
+    - a crossed book after applying a frame means an update was missed,
+    - a book with no update for stale_seconds is assumed stale.
+
+    Any of these resyncs just the affected asset from
+    PolymarketClient.get_order_book_snapshot and holds strategy triggers for the
+    market until the fresh book is applied. Deltas received while the request is
+    in flight are buffered and replayed on top of the REST snapshot, except those
+    timestamped at or before it, which the snapshot already includes. A websocket
+    book snapshot arriving in the meantime supersedes the REST request.
+
+    Args:
+        stale_seconds (float): Resync a book that has not changed for this long
+        resync_timeout (float): Timeout of one REST order book request
+        retry_seconds (float): Delay before retrying a failed resync
+        resync (bool): Fetch books over REST; when False problems are only counted
+    """
+
+    def __init__(self, stale_seconds=300, resync_timeout=10, retry_seconds=5, resync=True, scheduler=None):
+        self.stale_seconds = stale_seconds
+        self.resync_timeout = resync_timeout
+        self.retry_seconds = retry_seconds
+        self.resync = resync
+        self.scheduler = scheduler or trigger_scheduler
+        self.markets = {}
+
+    def _state(self, market, asset_id=None):
+        state = self.markets.get(market)
+        if state is None:
+            state = self.markets[market] = MarketIntegrity(asset_id)
+        return state
+
+    def accept_book(self, market, message):
+        """Return True if a book snapshot should be applied."""
+        state = self._state(market, message.asset_id)
+
+        if message.timestamp and message.timestamp < state.last_timestamp:
+            state.counters['out_of_order'] += 1
+            return False
+
+        state.counters['books'] += 1
+        if state.resyncing:
+            # A full snapshot from the socket is at least as fresh as the REST one
+            self._finish_resync(market, state)
+        return True
+
+    def accept_price_change(self, market, message):
+        """Return True if a price_change frame should be applied."""
+        # Frames carry changes for both tokens; the book is kept for token1
+        state = self._state(market, global_state.MARKET_TOKENS.get(market))
+
+        if market not in global_state.all_data and not state.resyncing:
+            state.counters['missing_snapshot'] += 1
+            self.request_resync(market, 'missing_snapshot')
+
+        if state.resyncing:
+            state.buffer.append(message)
+            state.counters['buffered'] += 1
+            return False
+
+        if market not in global_state.all_data:
+            return False
+
+        if message.timestamp and message.timestamp < state.last_timestamp:
+            state.counters['out_of_order'] += 1
+            self.request_resync(market, 'gap')
+            return False
+
+        frame_hash = price_change_hash(message, state.asset_id)
+        if frame_hash is not None and frame_hash == state.last_hash:
+            state.counters['duplicates'] += 1
+            return False
+
+        state.counters['deltas'] += 1
+        return True
+
+    def applied(self, market, book, timestamp, frame_hash):
+        """Record a frame that was applied and check the resulting book."""
+        state = self._state(market)
+        state.asset_id = book.asset_id
+        state.last_timestamp = max(state.last_timestamp, timestamp or 0)
+        state.last_hash = frame_hash
+        state.last_update = clock.time()
+
+        if is_crossed(book):
+            state.counters['crossed'] += 1
+            self.request_resync(market, 'crossed')
+
+    def request_resync(self, market, reason):
+        """Hold the market's strategy triggers and refetch its book over REST."""
+        state = self._state(market)
+        if state.resyncing:
+            return
+
+        state.resyncing = True
+        state.generation += 1
+        state.buffer = []
+        state.counters['resyncs'] += 1
+        log.warning("Order book needs a resync", market=market, reason=reason)
+
+        self.scheduler.hold(market)
+
+        if not self.resync or state.asset_id is None:
+            self._finish_resync(market, state)
+            return
+
+        asyncio.create_task(self._resync(market, state, state.generation))
+
+    async def _resync(self, market, state, generation):
+        loop = asyncio.get_running_loop()
+
+        while state.generation == generation:
+            try:
+                bids, asks, snapshot_timestamp = await asyncio.wait_for(
+                    loop.run_in_executor(None, global_state.client.get_order_book_snapshot, state.asset_id),
+                    self.resync_timeout,
+                )
+                break
+            except Exception as ex:
+                state.counters['resync_failures'] += 1
+                log.warning("Order book resync failed", market=market, error=repr(ex))
+                await clock.sleep(self.retry_seconds)
+        else:
+            return  # Superseded by a websocket snapshot
+
+        if state.generation != generation or market not in self.markets:
+            return
+
+        book = global_state.all_data.get(market)
+        if book is None:
+            book = global_state.all_data[market] = OrderBook()
+        book.reset(state.asset_id, _levels(bids), _levels(asks))
+        state.last_timestamp = max(state.last_timestamp, snapshot_timestamp)
+
+        for message in state.buffer:
+            if message.timestamp and message.timestamp <= snapshot_timestamp:
+                # Already in the snapshot; applying it again would undo later changes to its levels
+                state.counters['buffered_dropped'] += 1
+                continue
+            for asset_id, side, tick, size, _ in message.price_changes:
+                if asset_id == book.asset_id:
+                    book.set_level(side, tick, size)
+            state.last_timestamp = max(state.last_timestamp, message.timestamp)
+        book.refresh()
+
+        if is_crossed(book):
+            state.counters['crossed'] += 1
+            log.warning("Order book is still crossed after resync", market=market)
+
+        self._finish_resync(market, state)
+
+    def _finish_resync(self, market, state):
+        state.resyncing = False
+        state.generation += 1
+        state.buffer = []
+        state.last_update = clock.time()
+        self.scheduler.release(market)
+
+    def check_stale(self):
+        """Resync every book that has not been updated for stale_seconds."""
+        now = clock.time()
+        for market, state in list(self.markets.items()):
+            if not state.resyncing and now - state.last_update > self.stale_seconds:
+                state.counters['stale'] += 1
+                self.request_resync(market, 'stale')
+
+    async def monitor(self, interval=30):
+        while True:
+            await clock.sleep(interval)
+            self.check_stale()
+
+    def forget(self, market):
+        """Drop the state of a market that is no longer subscribed."""
+        state = self.markets.pop(market, None)
+        if state is not None and state.resyncing:
+            state.generation += 1
+            self.scheduler.release(market)
+
+    def report(self):
+        """Return the counters of every market that recorded a problem, plus totals."""
+        totals = Counter()
+        markets = {}
+        for market, state in self.markets.items():
+            totals.update(state.counters)
+            if state.resyncing or state.counters['resyncs'] or state.counters['duplicates']:
+                markets[market] = dict(state.counters, resyncing=state.resyncing)
+        return {'totals': dict(totals), 'markets': markets}
+
+
+def price_change_hash(message, asset_id):
+    """Hash of the book of asset_id after a price_change frame, None if the frame has no change for it."""
+    for change_asset_id, _, _, _, change_hash in reversed(message.price_changes):
+        if change_asset_id == asset_id:
+            return change_hash
+    return None
+
+
+def is_crossed(book):
+    return book.best_bid_tick >= 0 and book.best_bid_tick >= book.best_ask_tick
+
+
+def _levels(df):
+    if len(df) == 0:
+        return []
+    return [(price_to_tick(price), size) for price, size in zip(df['price'], df['size'])]
+
+
+book_integrity = BookIntegrity()
@@ -0,0 +1,95 @@
+import asyncio
+import heapq
+import itertools
+import time as _time
+
+import pandas as pd
+
+
+class Clock:
+    """Wall clock used in live trading."""
+
+    def time(self):
+        return _time.time()
+
+    def utcnow(self):
+        return pd.Timestamp.utcnow().tz_localize(None)
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class SimulatedClock(Clock):
+    """
+    Clock driven by a replay instead of wall time.
+
+    sleep() does not wait in real time: it registers a timer that fires once the
+    replay advances simulated time past its deadline. Other simulated events
+    (order acknowledgements, fills) are scheduled on the same timeline with call_at().
+
+    Args:
+        start (float): Initial simulated time as a unix timestamp in seconds
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self._timers = []
+        self._sequence = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def utcnow(self):
+        return pd.Timestamp(self.now, unit='s')
+
+    def call_at(self, when, callback, *args):
+        heapq.heappush(self._timers, (when, next(self._sequence), callback, args))
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        self.call_at(self.now + seconds, _resolve, future)
+        await future
+
+    def next_deadline(self):
+        return self._timers[0][0] if self._timers else None
+
+    def pop_due(self, until):
+        """Advance to the earliest timer due at or before until, returning its callback and args."""
+        if not self._timers or self._timers[0][0] > until:
+            return None
+        when, _, callback, args = heapq.heappop(self._timers)
+        self.now = max(self.now, when)
+        return callback, args
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+_clock = Clock()
+
+
+def set_clock(clock):
+    """Replace the process-wide clock, e.g. with a SimulatedClock for replay."""
+    global _clock
+    _clock = clock
+
+
+def get_clock():
+    return _clock
+
+
+def time():
+    """Current time in seconds since the epoch, like time.time()."""
+    return _clock.time()
+
+
+def utcnow():
+    """Current UTC time as a naive pd.Timestamp, like pd.Timestamp.utcnow().tz_localize(None)."""
+    return _clock.utcnow()
+
+
+async def sleep(seconds):
+    """Sleep on the current clock, like asyncio.sleep()."""
+    await _clock.sleep(seconds)
@@ -1,68 +1,91 @@
 import json
-from sortedcontainers import SortedDict
+import time
 import poly_data.global_state as global_state
 import poly_data.CONSTANTS as CONSTANTS
+from poly_data.orderbook import OrderBook
+from poly_data.book_integrity import book_integrity, price_change_hash
+from poly_data.latency import latency_tracer
+from poly_data.log import get_logger
 
-from strategies.manager import strategy_manager
-import time
+from strategies.scheduler import trigger_scheduler
 import asyncio
+import poly_data.clock as clock
 from poly_data.data_utils import set_position, set_order, update_positions
 
+log = get_logger(__name__)
 
-def queue_trade(market):
-    try:
-        market_data = global_state.df[global_state.df['condition_id'] == market].iloc[0]
-    except IndexError:
-        print(f"No market data found for {market}")
-        return
 
-    asyncio.create_task(strategy_manager.execute_strategies(market, market_data))
+def queue_trade(market):
+    # Marks the market dirty; repeated triggers before it runs are coalesced
+    trigger_scheduler.schedule(market)
 
-def process_book_data(asset, json_data):
-    global_state.all_data[asset] = {
-        'asset_id': json_data['asset_id'],  # token_id for the Yes token
-        'bids': SortedDict(),
-        'asks': SortedDict()
-    }
+def process_book_data(asset, message):
+    book = global_state.all_data.get(asset)
+    if book is None:
+        book = OrderBook()
+        global_state.all_data[asset] = book
 
-    global_state.all_data[asset]['bids'].update({float(entry['price']): float(entry['size']) for entry in json_data['bids']})
-    global_state.all_data[asset]['asks'].update({float(entry['price']): float(entry['size']) for entry in json_data['asks']})
+    # Levels arrive already parsed to (tick, size); reuse the preallocated arrays
+    book.reset(message.asset_id, message.bids, message.asks)  # asset_id is the token_id for the Yes token
 
-def process_price_change(asset, side, price_level, new_size):
-    if asset_id != global_state.all_data[asset]['asset_id']:
+def process_price_change(asset, asset_id, side, tick, new_size):
+    book = global_state.all_data[asset]
+    if asset_id != book.asset_id:
         return  # skip updates for the No token to prevent duplicated updates
-    if side == 'bids':
-        book = global_state.all_data[asset]['bids']
-    else:
-        book = global_state.all_data[asset]['asks']
 
-    if new_size == 0:
-        if price_level in book:
-            del book[price_level]
-    else:
-        book[price_level] = new_size
+    book.set_level(side, tick, new_size)
 
-def process_data(json_datas, trade=True):
+def process_data(messages, trade=True, received=None):
+    """
+    Apply decoded market channel messages (see poly_data.decoding) to the order books.
 
-    for json_data in json_datas:
-        event_type = json_data['event_type']
-        asset = json_data['market']
+    Every frame is checked by book_integrity first; frames that are duplicated, out
+    of order or arrive while the book is being resynced are not applied, nor are
+    frames of markets no longer traded.
+
+    Args:
+        messages (list): Decoded messages of one frame
+        trade (bool): Trigger the strategies of the updated markets
+        received (float, optional): time.perf_counter() when the frame was received,
+            for latency tracing
+    """
+
+    for message in messages:
+        started = time.perf_counter()
+        event_type = message.event_type
+        asset = message.market
+
+        if asset not in global_state.MARKET_TOKENS:
+            # Frames of a released market still in flight; applying them would bring its book back
+            continue
 
         if event_type == 'book':
-            process_book_data(asset, json_data)
+            if not book_integrity.accept_book(asset, message):
+                continue
+
+            process_book_data(asset, message)
+            book_integrity.applied(asset, global_state.all_data[asset], message.timestamp, message.hash)
 
             if trade:
+                latency_tracer.applied(asset, received, started)
                 queue_trade(asset)
                 
         elif event_type == 'price_change':
-            for data in json_data['price_changes']:
-                side = 'bids' if data['side'] == 'BUY' else 'asks'
-                price_level = float(data['price'])
-                new_size = float(data['size'])
-                process_price_change(asset, side, price_level, new_size)
-
-                if trade:
-                    queue_trade(asset)
+            if not book_integrity.accept_price_change(asset, message):
+                continue
+
+            for asset_id, side, tick, new_size, _ in message.price_changes:
+                process_price_change(asset, asset_id, side, tick, new_size)
+
+            # Bring the cached top-of-book aggregates up to date once per frame
+            book = global_state.all_data[asset]
+            book.refresh()
+
+            book_integrity.applied(asset, book, message.timestamp, price_change_hash(message, book.asset_id))
+
+            if trade:
+                latency_tracer.applied(asset, received, started)
+                queue_trade(asset)
         
 
         # pretty_print(f'Received book update for {asset}:', global_state.all_data[asset])
@@ -76,7 +99,7 @@ def add_to_performing(col, id):
 
     # Add the trade ID and track its timestamp
     global_state.performing[col].add(id)
-    global_state.performing_timestamps[col][id] = time.time()
+    global_state.performing_timestamps[col][id] = clock.time()
 
 def remove_from_performing(col, id):
     if col in global_state.performing:
@@ -85,6 +108,29 @@ def remove_from_performing(col, id):
     if col in global_state.performing_timestamps:
         global_state.performing_timestamps[col].pop(id, None)
 
+def remove_from_pending():
+    """
+    Clean up stale trades that have been pending for too long (>15 seconds).
+    This prevents the system from getting stuck on trades that may have failed.
+    """
+    try:
+        current_time = clock.time()
+
+        # Iterate through all performing trades
+        for col in list(global_state.performing.keys()):
+            for trade_id in list(global_state.performing[col]):
+
+                try:
+                    # If trade has been pending for more than 15 seconds, remove it
+                    if current_time - global_state.performing_timestamps[col].get(trade_id, current_time) > 15:
+                        remove_from_performing(col, trade_id)
+                        log.info("Removed stale performing entry after 15 seconds", id=trade_id, side=col,
+                                 remaining=len(global_state.performing[col]))
+                except Exception:
+                    log.error("Error in remove_from_pending", side=col, id=trade_id, exc_info=True)
+    except Exception:
+        log.error("Error in remove_from_pending", exc_info=True)
+
 def process_user_data(rows):
 
     for row in rows:
@@ -105,9 +151,8 @@ def process_user_data(rows):
                 is_user_maker = False
                 for maker_order in row['maker_orders']:
                     if maker_order['maker_address'].lower() == global_state.client.browser_wallet.lower():
-                        print("User is maker")
-                        size = float(maker_order['matched_amount'])
-                        price = float(maker_order['price'])
+                        size = maker_order['matched_amount']
+                        price = maker_order['price']
                         
                         is_user_maker = True
                         maker_outcome = maker_order['outcome'] #this is curious
@@ -118,45 +163,45 @@ def process_user_data(rows):
                             token = global_state.REVERSE_TOKENS[token]
                 
                 if not is_user_maker:
-                    size = float(row['size'])
-                    price = float(row['price'])
-                    print("User is taker")
+                    size = row['size']
+                    price = row['price']
 
-                print("TRADE EVENT FOR: ", row['market'], "ID: ", row['id'], "STATUS: ", row['status'], " SIDE: ", row['side'], "  MAKER OUTCOME: ", maker_outcome, " TAKER OUTCOME: ", taker_outcome, " PROCESSED SIDE: ", side, " SIZE: ", size) 
+                log.info("Trade event", market=market, id=row['id'], status=row['status'], side=row['side'],
+                         maker=is_user_maker, maker_outcome=maker_outcome, taker_outcome=taker_outcome,
+                         processed_side=side, size=size, sample=False)
 
 
                 if row['status'] == 'CONFIRMED' or row['status'] == 'FAILED' :
                     if row['status'] == 'FAILED':
-                        print(f"Trade failed for {token}, decreasing")
+                        log.warning("Trade failed, refreshing positions", market=market, token=token, id=row['id'])
                         asyncio.create_task(asyncio.sleep(2))
                         update_positions()
                     else:
                         remove_from_performing(col, row['id'])
-                        print("Confirmed. Performing is ", len(global_state.performing[col]))
-                        print("Last trade update is ", global_state.last_trade_update)
-                        print("Performing is ", global_state.performing)
-                        print("Performing timestamps is ", global_state.performing_timestamps)
+                        log.info("Trade confirmed", market=market, token=token, id=row['id'],
+                                 performing=len(global_state.performing[col]), sample=False)
                         
                         queue_trade(market)
 
                 elif row['status'] == 'MATCHED':
                     add_to_performing(col, row['id'])
 
-                    print("Matched. Performing is ", len(global_state.performing[col]))
                     set_position(token, side, size, price)
-                    print("Position after matching is ", global_state.positions[str(token)])
-                    print("Last trade update is ", global_state.last_trade_update)
-                    print("Performing is ", global_state.performing)
-                    print("Performing timestamps is ", global_state.performing_timestamps)
+                    position = global_state.positions[str(token)]
+                    log.info("Trade matched", market=market, token=token, id=row['id'],
+                             performing=len(global_state.performing[col]), position=position['size'],
+                             avg_price=position['avgPrice'], sample=False)
                     queue_trade(market)
                 elif row['status'] == 'MINED':
                     remove_from_performing(col, row['id'])
 
             elif row['event_type'] == 'order':
-                print("ORDER EVENT FOR: ", row['market'], " STATUS: ",  row['status'], " TYPE: ", row['type'], " SIDE: ", side, "  ORIGINAL SIZE: ", row['original_size'], " SIZE MATCHED: ", row['size_matched'])
+                log.debug("Order event", market=market, id=row['id'], status=row['status'], type=row['type'],
+                          side=side, original_size=row['original_size'], size_matched=row['size_matched'])
                 
-                set_order(token, side, float(row['original_size']) - float(row['size_matched']), row['price'])
+                set_order(token, row['id'], side, row['price'], row['original_size'], row['size_matched'], row['type'])
+                latency_tracer.order_event(row['id'])
                 queue_trade(market)
 
-    else:
-        print(f"User date received for {market} but its not in")
+        else:
+            log.debug("User data received for a token that is not traded", market=market, token=token)
@@ -1,47 +1,109 @@
+import asyncio
+
+import numpy as np
+
 import poly_data.global_state as global_state
 from poly_data.utils import get_sheet_df
-import time
+import poly_data.clock as clock
 import poly_data.global_state as global_state
-
-#sth here seems to be removing the position
-def update_positions(avgOnly=False):
-    pos_df = global_state.client.get_all_positions()
-
-    for idx, row in pos_df.iterrows():
-        asset = str(row['asset'])
-
-        if asset in  global_state.positions:
-            position = global_state.positions[asset].copy()
-        else:
-            position = {'size': 0, 'avgPrice': 0}
-
-        position['avgPrice'] = row['avgPrice']
-
-        if not avgOnly:
-            position['size'] = row['size']
-        else:
-            
-            for col in [f"{asset}_sell", f"{asset}_buy"]:
-                #need to review this
-                if col not in global_state.performing or not isinstance(global_state.performing[col], set) or len(global_state.performing[col]) == 0:
-                    try:
-                        old_size = position['size']
-                    except:
-                        old_size = 0
-
-                    if asset in  global_state.last_trade_update:
-                        if time.time() - global_state.last_trade_update[asset] < 5:
-                            print(f"Skipping update for {asset} because last trade update was less than 5 seconds ago")
-                            continue
-
-                    if old_size != row['size']:
-                        print(f"No trades are pending. Updating position from {old_size} to {row['size']} and avgPrice to {row['avgPrice']} using API")
-    
-                    position['size'] = row['size']
-                else:
-                    print(f"ALERT: Skipping update for {asset} because there are trades pending for {col} looking like {global_state.performing[col]}")
-    
-        global_state.positions[asset] = position
+from poly_data.log import get_logger
+from poly_data.order_gateway import order_gateway
+from poly_data.shared_store import owned_markets, owned_tokens
+from poly_data.state_reducer import state_reducer
+
+log = get_logger(__name__)
+
+# Seconds after a websocket trade during which the API size is not trusted
+POSITION_SETTLE_SECONDS = 5
+
+# Counters of update_positions, see reconcile_report()
+reconcile_stats = {
+    'runs': 0,
+    'assets': 0,
+    'size_updates': 0,
+    'avg_updates': 0,
+    'new_assets': 0,
+    'held_pending': 0,
+    'held_recent': 0,
+    'last_drift': 0.0,
+    'max_drift': 0.0,
+}
+
+def update_positions(avgOnly=False, pos_df=None):
+    """
+    Reconcile global_state.positions with the positions API.
+
+    The snapshot is diffed against local state column-wise and only assets whose
+    size or average price differ are written. With avgOnly, sizes are only taken
+    from the API for assets with no trade in flight on either side and no
+    websocket trade in the last POSITION_SETTLE_SECONDS, since the API lags the
+    user channel; the average price is always taken.
+
+    Args:
+        avgOnly (bool): Keep local sizes that may be fresher than the API
+        pos_df (DataFrame, optional): Positions snapshot, fetched if not given
+    """
+    if pos_df is None:
+        pos_df = global_state.client.get_all_positions()
+    pos_df = owned_tokens(pos_df, 'asset')
+    if len(pos_df) == 0:
+        return
+
+    assets = pos_df['asset'].astype(str).tolist()
+    api_size = pos_df['size'].to_numpy(dtype=float)
+    api_avg = pos_df['avgPrice'].to_numpy(dtype=float)
+
+    positions = global_state.positions
+    local = [positions.get(asset) for asset in assets]
+    known = np.array([position is not None for position in local])
+    local_size = np.array([position['size'] if position is not None else 0.0 for position in local], dtype=float)
+    local_avg = np.array([position['avgPrice'] if position is not None else 0.0 for position in local], dtype=float)
+
+    if avgOnly:
+        performing = global_state.performing
+        pending = np.array([bool(performing.get(f"{asset}_buy")) or bool(performing.get(f"{asset}_sell"))
+                            for asset in assets])
+        last_trade = np.array([global_state.last_trade_update.get(asset, -np.inf) for asset in assets], dtype=float)
+        recent = clock.time() - last_trade < POSITION_SETTLE_SECONDS
+        take_size = ~pending & ~recent
+    else:
+        pending = recent = np.zeros(len(assets), dtype=bool)
+        take_size = np.ones(len(assets), dtype=bool)
+
+    drift = np.abs(api_size - local_size)
+    size_changed = take_size & (drift > 0)
+    avg_changed = api_avg != local_avg
+    changed = np.flatnonzero(size_changed | avg_changed | ~known)
+
+    new_size = np.where(take_size, api_size, local_size)
+    source = 'audit' if avgOnly else 'snapshot'
+    for i in changed:
+        state_reducer.apply({'type': 'position', 'token': assets[i], 'size': new_size[i], 'avgPrice': api_avg[i],
+                             'source': source})
+
+    for i in np.flatnonzero(size_changed & known):
+        log.info("Updating position from API, no trades pending", token=assets[i],
+                 old_size=float(local_size[i]), size=float(api_size[i]), avg_price=float(api_avg[i]))
+
+    held = ~take_size & (drift > 0)
+    for i in np.flatnonzero(held):
+        log.debug("Skipping position update", token=assets[i], pending=bool(pending[i]), recent=bool(recent[i]),
+                  size=float(local_size[i]), api_size=float(api_size[i]))
+
+    stats = reconcile_stats
+    stats['runs'] += 1
+    stats['assets'] = len(assets)
+    stats['size_updates'] += int(np.count_nonzero(size_changed & known))
+    stats['avg_updates'] += int(np.count_nonzero(avg_changed & known))
+    stats['new_assets'] += int(np.count_nonzero(~known))
+    stats['held_pending'] += int(np.count_nonzero(held & pending))
+    stats['held_recent'] += int(np.count_nonzero(held & recent & ~pending))
+    stats['last_drift'] = float(drift[known].sum())
+    stats['max_drift'] = max(stats['max_drift'], float(drift[known].max()) if known.any() else 0.0)
+
+def reconcile_report():
+    """update_positions counters; drift is the total absolute size difference found in the last run."""
+    return dict(reconcile_stats)
 
 def get_position(token):
     token = str(token)
@@ -51,114 +113,136 @@ def get_position(token):
         return {'size': 0, 'avgPrice': 0}
 
 def set_position(token, side, size, price, source='websocket'):
-    token = str(token)
-    size = float(size)
-    price = float(price)
-
-    global_state.last_trade_update[token] = time.time()
-    
-    if side.lower() == 'sell':
-        size *= -1
-
-    if token in global_state.positions:
-        
-        prev_price = global_state.positions[token]['avgPrice']
-        prev_size = global_state.positions[token]['size']
-
-
-        if size > 0:
-            if prev_size == 0:
-                # Starting a new position
-                avgPrice_new = price
-            else:
-                # Buying more; update average price
-                avgPrice_new = (prev_price * prev_size + price * size) / (prev_size + size)
-        elif size < 0:
-            # Selling; average price remains the same
-            avgPrice_new = prev_price
-        else:
-            # No change in position
-            avgPrice_new = prev_price
-
-
-        global_state.positions[token]['size'] += size
-        global_state.positions[token]['avgPrice'] = avgPrice_new
-    else:
-        global_state.positions[token] = {'size': size, 'avgPrice': price}
-
-    print(f"Updated position from {source}, set to ", global_state.positions[token])
-
-def update_orders():
-    all_orders = global_state.client.get_all_orders()
-
-    orders = {}
-
+    state_reducer.apply({'type': 'trade', 'token': token, 'side': side, 'size': size, 'price': price,
+                         'source': source})
+
+def update_orders(all_orders=None, fetched_at=None):
+    """
+    Audit the event-sourced orders against the open orders from REST.
+
+    Differences are repaired through the state reducer and reported (see
+    StateReducer.audit_orders). Sides left with more than one resting order
+    keep the oldest, which has the best queue position, and cancel the rest.
+    Runs on the event loop, like every other writer of the order state.
+
+    Args:
+        all_orders (DataFrame, optional): Open orders snapshot, fetched if not given
+        fetched_at (float, optional): clock.time() when all_orders was requested
+    """
+    if all_orders is None:
+        fetched_at = clock.time()
+        all_orders = global_state.client.get_all_orders()
+    if fetched_at is None:
+        fetched_at = clock.time()
+    all_orders = owned_tokens(all_orders, 'asset_id')
+
+    snapshot = {}
     if len(all_orders) > 0:
-            for token in all_orders['asset_id'].unique():
-                
-                if token not in orders:
-                    orders[str(token)] = {'buy': {'price': 0, 'size': 0}, 'sell': {'price': 0, 'size': 0}}
-
-                curr_orders = all_orders[all_orders['asset_id'] == str(token)]
-                
-                if len(curr_orders) > 0:
-                    sel_orders = {}
-                    sel_orders['buy'] = curr_orders[curr_orders['side'] == 'BUY']
-                    sel_orders['sell'] = curr_orders[curr_orders['side'] == 'SELL']
-
-                    for type in ['buy', 'sell']:
-                        curr = sel_orders[type]
-
-                        if len(curr) > 1:
-                            print("Multiple orders found, cancelling")
-                            global_state.client.cancel_all_asset(token)
-                            orders[str(token)] = {'buy': {'price': 0, 'size': 0}, 'sell': {'price': 0, 'size': 0}}
-                        elif len(curr) == 1:
-                            orders[str(token)][type]['price'] = float(curr.iloc[0]['price'])
-                            orders[str(token)][type]['size'] = float(curr.iloc[0]['original_size'] - curr.iloc[0]['size_matched'])
-
-    global_state.orders = orders
+        for row in all_orders.to_dict('records'):
+            snapshot.setdefault(str(row['asset_id']), {})[row['id']] = row
+
+    first_audit = state_reducer.audits == 0
+    found = state_reducer.audit_orders(snapshot, fetched_at)
+    repaired = found['missing'] + found['stale'] + found['mismatch']
+    if repaired and not first_audit:
+        log.warning("Order state diverged from REST, repaired", missing=found['missing'], stale=found['stale'],
+                    mismatch=found['mismatch'], skipped=found['skipped'])
+
+    duplicate_ids = []
+    for token, token_orders in global_state.orders.items():
+        for side in ['buy', 'sell']:
+            same_side = sorted((order for order in token_orders.values() if order['side'] == side),
+                               key=lambda order: order['created'])
+
+            if len(same_side) > 1:
+                # Keep the order with the best queue position and cancel the rest
+                log.warning("Multiple orders on one side, cancelling all but the oldest",
+                            token=token, side=side, orders=len(same_side))
+                duplicate_ids.extend(extra['id'] for extra in same_side[1:])
+
+    if duplicate_ids:
+        asyncio.get_running_loop().create_task(cancel_duplicate_orders(duplicate_ids))
+
+async def cancel_duplicate_orders(order_ids):
+    # Every duplicate, for every token, in one request
+    await order_gateway.cancel_orders(order_ids)
+    remove_orders(order_ids, 'audit')
 
 def get_order(token):
-    token = str(token)
-    if token in global_state.orders:
-
-        if 'buy' not in global_state.orders[token]:
-            global_state.orders[token]['buy'] = {'price': 0, 'size': 0}
-
-        if 'sell' not in global_state.orders[token]:
-            global_state.orders[token]['sell'] = {'price': 0, 'size': 0}
-
-        return global_state.orders[token]
-    else:
-        return {'buy': {'price': 0, 'size': 0}, 'sell': {'price': 0, 'size': 0}}
-    
-def set_order(token, side, size, price):
-    curr = {}
-    curr = {side: {'price': 0, 'size': 0}}
-
-    curr[side]['size'] = float(size)
-    curr[side]['price'] = float(price)
-
-    global_state.orders[str(token)] = curr
-    print("Updated order, set to ", curr)
-
+    """Summary of the resting orders of a token per side: total size and the best price."""
+    summary = {'buy': {'price': 0, 'size': 0}, 'sell': {'price': 0, 'size': 0}}
+
+    for order in global_state.orders.get(str(token), {}).values():
+        side = summary[order['side']]
+        better = order['price'] > side['price'] if order['side'] == 'buy' else order['price'] < side['price']
+        if side['size'] == 0 or better:
+            side['price'] = order['price']
+        side['size'] += order['size']
+
+    return summary
+
+def get_orders(token, side):
+    """Resting orders of a token on one side, oldest first."""
+    orders = [order for order in global_state.orders.get(str(token), {}).values() if order['side'] == side.lower()]
+    return sorted(orders, key=lambda order: order['created'])
     
+def set_order(token, order_id, side, price, original_size, size_matched, status='LIVE', source='websocket'):
+    state_reducer.apply({'type': 'order', 'token': token, 'id': order_id, 'side': side, 'price': price,
+                         'original_size': original_size, 'size_matched': size_matched, 'status': status,
+                         'source': source})
+
+def remove_orders(order_ids, source='cancel'):
+    state_reducer.apply({'type': 'cancel', 'ids': list(order_ids), 'source': source})
+
+def record_posted_orders(orders, responses):
+    """
+    Add orders the exchange accepted, ahead of their websocket placement event.
+
+    Args:
+        orders (list): (token, side, price, size, neg_risk) tuples as posted
+        responses (list): API responses in the same order
+    """
+    for (token, side, price, size, _), response in zip(orders, responses):
+        if response and response.get('success', True) and response.get('orderID'):
+            set_order(token, response['orderID'], side, price, size, 0, 'LIVE', source='post')
+
+def apply_order_batch(batch, responses):
+    """Bring global_state.orders in line with an OrderBatch that was just submitted."""
+    for asset_id in batch.cancel_assets:
+        state_reducer.apply({'type': 'clear', 'token': asset_id, 'source': 'cancel'})
+    if batch.cancel_ids:
+        remove_orders(batch.cancel_ids)
+    record_posted_orders(batch.orders, responses)
 
 def update_markets():
     received_df, received_params = get_sheet_df()
+    load_markets(received_df, received_params)
+
+def load_markets(received_df, received_params):
+    """
+    Apply a Selected Markets frame and its hyperparameters to the global state.
+
+    Args:
+        received_df (DataFrame): Selected markets merged with All Markets, as returned by get_sheet_df
+        received_params (dict): Hyperparameters by param_type
+    """
+    previous_markets = set(global_state.strategy_config)
 
     if len(received_df) > 0:
-        global_state.df, global_state.params = received_df.copy(), received_params
+        # In supervisor mode each worker keeps only the markets it owns
+        global_state.df, global_state.params = owned_markets(received_df).copy(), received_params
         global_state.strategy_config = {}
     
+    tokens = []
+    market_tokens = {}
 
     for _, row in global_state.df.iterrows():
         for col in ['token1', 'token2']:
             row[col] = str(row[col])
 
-        if row['token1'] not in global_state.all_tokens:
-            global_state.all_tokens.append(row['token1'])
+        if row['token1'] not in tokens:
+            tokens.append(row['token1'])
+        market_tokens[str(row['condition_id'])] = row['token1']
 
         if row['token1'] not in global_state.REVERSE_TOKENS:
             global_state.REVERSE_TOKENS[row['token1']] = row['token2']
@@ -176,4 +260,12 @@ def update_markets():
 
         for col2 in [f"{row['token1']}_buy", f"{row['token1']}_sell", f"{row['token2']}_buy", f"{row['token2']}_sell"]:
             if col2 not in global_state.performing:
-                global_state.performing[col2] = set()
\ No newline at end of file
+                global_state.performing[col2] = set()
+
+    global_state.all_tokens = tokens
+    global_state.MARKET_TOKENS = market_tokens
+
+    # Apply added and dropped markets to the live websocket subscriptions
+    if global_state.market_feed is not None:
+        removed_markets = previous_markets - set(global_state.strategy_config)
+        global_state.market_feed.sync_tokens(tokens, removed_markets)
@@ -0,0 +1,195 @@
+"""
+Schema-typed decoding of Polymarket websocket frames.
+
+Market frames (book, price_change, last_trade_price) are decoded into small
+slotted message objects with prices already converted to integer ticks, so the
+order book can apply them without any further parsing. User frames (trade,
+order) stay dicts but have their numeric fields converted to floats once here.
+
+The JSON backend is pluggable: orjson or ujson are used when installed and the
+standard library json module is the fallback.
+"""
+import json
+
+from poly_data.orderbook import price_to_tick
+
+_BACKENDS = {'json': json.loads}
+
+try:
+    import orjson
+    _BACKENDS['orjson'] = orjson.loads
+except ImportError:
+    pass
+
+try:
+    import ujson
+    _BACKENDS['ujson'] = ujson.loads
+except ImportError:
+    pass
+
+json_backend = next(name for name in ('orjson', 'ujson', 'json') if name in _BACKENDS)
+loads = _BACKENDS[json_backend]
+
+
+def set_json_backend(name):
+    """
+    Select the JSON parser used for websocket frames.
+
+    Args:
+        name (str): 'orjson', 'ujson' or 'json'
+
+    Raises:
+        ValueError: If the backend is not installed
+    """
+    global json_backend, loads
+    if name not in _BACKENDS:
+        raise ValueError(f"JSON backend {name} is not available (installed: {sorted(_BACKENDS)})")
+    json_backend, loads = name, _BACKENDS[name]
+
+
+# Only ~1000 distinct price strings exist on the 0.001 grid, so parsing each one
+# once and memoising its tick is cheaper than float() + round() per level.
+_tick_cache = {}
+
+
+def parse_tick(price):
+    """Convert a price string from the feed to its tick index."""
+    tick = _tick_cache.get(price)
+    if tick is None:
+        tick = price_to_tick(price)
+        if len(_tick_cache) < 10000:
+            _tick_cache[price] = tick
+    return tick
+
+
+_BOOK_SIDES = {'BUY': 'bids', 'SELL': 'asks'}
+
+
+def _parse_levels(levels):
+    cache = _tick_cache
+    return [(cache.get(level['price']) or parse_tick(level['price']), float(level['size'])) for level in levels]
+
+
+class BookMessage:
+    """Full book snapshot for one token. bids and asks are lists of (tick, size)."""
+
+    __slots__ = ('event_type', 'market', 'asset_id', 'bids', 'asks', 'hash', 'timestamp')
+
+    def __init__(self, data):
+        self.event_type = 'book'
+        self.market = data['market']
+        self.asset_id = data['asset_id']
+        self.bids = _parse_levels(data['bids'])
+        self.asks = _parse_levels(data['asks'])
+        self.hash = data.get('hash')
+        self.timestamp = int(data.get('timestamp') or 0)
+
+
+class PriceChangeMessage:
+    """
+    Batch of level updates for one market.
+
+    price_changes holds plain (asset_id, side, tick, size, hash) tuples, with side
+    already mapped to 'bids' or 'asks'; tuples are about twice as cheap to build as
+    an object per level.
+    """
+
+    __slots__ = ('event_type', 'market', 'timestamp', 'price_changes')
+
+    def __init__(self, data):
+        cache, sides = _tick_cache, _BOOK_SIDES
+
+        self.event_type = 'price_change'
+        self.market = data['market']
+        self.timestamp = int(data.get('timestamp') or 0)
+        self.price_changes = [
+            (change.get('asset_id'), sides[change['side']],
+             cache.get(change['price']) or parse_tick(change['price']),
+             float(change['size']), change.get('hash'))
+            for change in data['price_changes']
+        ]
+
+
+class LastTradePriceMessage:
+    """Print of the last trade in a token."""
+
+    __slots__ = ('event_type', 'market', 'asset_id', 'tick', 'size', 'side', 'timestamp')
+
+    def __init__(self, data):
+        self.event_type = 'last_trade_price'
+        self.market = data['market']
+        self.asset_id = data['asset_id']
+        self.tick = parse_tick(data['price'])
+        self.size = float(data.get('size') or 0)
+        self.side = data.get('side')
+        self.timestamp = int(data.get('timestamp') or 0)
+
+
+MARKET_SCHEMAS = {
+    'book': BookMessage,
+    'price_change': PriceChangeMessage,
+    'last_trade_price': LastTradePriceMessage,
+}
+
+
+def _decode_trade(row):
+    row['size'] = float(row['size'])
+    row['price'] = float(row['price'])
+    for maker_order in row.get('maker_orders', ()):
+        maker_order['matched_amount'] = float(maker_order['matched_amount'])
+        maker_order['price'] = float(maker_order['price'])
+    return row
+
+
+def _decode_order(row):
+    row['original_size'] = float(row['original_size'])
+    row['size_matched'] = float(row['size_matched'])
+    row['price'] = float(row['price'])
+    return row
+
+
+USER_SCHEMAS = {
+    'trade': _decode_trade,
+    'order': _decode_order,
+}
+
+
+def _as_list(data):
+    # The feed sends either a single object or a list of them per frame
+    return data if isinstance(data, list) else [data]
+
+
+def decode_market_frame(raw):
+    """
+    Decode a raw market channel frame.
+
+    Args:
+        raw (str | bytes): Frame as received from the websocket
+
+    Returns:
+        list: Decoded messages. Event types without a schema are dropped.
+    """
+    messages = []
+    for data in _as_list(loads(raw)):
+        schema = MARKET_SCHEMAS.get(data.get('event_type'))
+        if schema is not None:
+            messages.append(schema(data))
+    return messages
+
+
+def decode_user_frame(raw):
+    """
+    Decode a raw user channel frame.
+
+    Args:
+        raw (str | bytes): Frame as received from the websocket
+
+    Returns:
+        list: Trade and order dicts with numeric fields converted to floats
+    """
+    rows = []
+    for row in _as_list(loads(raw)):
+        schema = USER_SCHEMAS.get(row.get('event_type'))
+        if schema is not None:
+            rows.append(schema(row))
+    return rows
@@ -0,0 +1,176 @@
+import asyncio
+import queue
+import threading
+import time
+
+from poly_data.book_integrity import book_integrity
+from poly_data.data_processing import process_data
+from poly_data.latency import latency_tracer
+from poly_data.log import get_logger
+from poly_data.ring import RingBuffer
+
+log = get_logger(__name__)
+
+
+class FeedHandoff:
+    """
+    Hands decoded market messages from the feed thread to the strategy loop.
+
+    The feed thread publish()es each decoded frame into a bounded ring buffer;
+    run() on the strategy loop drains it, applies the frames to the books and
+    queues strategy triggers. The feed thread only wakes the strategy loop when it
+    is idle, so a busy loop costs the producer nothing but the ring write.
+
+    If the ring is full the frame is dropped and the markets in it are resynced
+    by book_integrity once the backlog is drained.
+
+    Args:
+        capacity (int): Maximum number of frames waiting for the strategy loop
+        batch (int): Frames applied before yielding to strategy tasks
+    """
+
+    def __init__(self, capacity=65536, batch=100):
+        self.ring = RingBuffer(capacity)
+        self.batch = batch
+
+        self.published = 0
+        self.drained = 0
+
+        self._loop = None
+        self._wakeup = None
+        self._waiting = False
+        self._dropped_markets = queue.SimpleQueue()
+
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self._lag_count = 0
+
+    # ---- feed thread ----
+
+    def publish(self, messages, received=None, decoded=None):
+        """
+        Queue a decoded market frame. Called on the feed thread.
+
+        Args:
+            messages (list): Decoded messages of the frame
+            received (float, optional): time.perf_counter() when the frame was received
+            decoded (float, optional): time.perf_counter() when it was decoded
+        """
+        if not self.ring.put((time.time(), messages, received, decoded)):
+            for message in messages:
+                self._dropped_markets.put(message.market)
+        self.published += 1
+        self._wake()
+
+    def call(self, callback, *args):
+        """Run callback on the strategy loop after every frame published before it."""
+        if not self.ring.put((time.time(), (callback, args), None, None)):
+            self._loop.call_soon_threadsafe(callback, *args)
+        self._wake()
+
+    def _wake(self):
+        if self._waiting:
+            self._waiting = False
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # ---- strategy loop ----
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        applied = 0
+
+        while True:
+            item = self.ring.get()
+
+            if item is None:
+                self._resync_dropped()
+                applied = 0
+
+                # Announce we are idle, then look again so a frame published in between is not missed
+                self._wakeup.clear()
+                self._waiting = True
+                item = self.ring.get()
+                if item is None:
+                    await self._wakeup.wait()
+                    continue
+                self._waiting = False
+
+            published, payload, received, decoded = item
+            try:
+                if isinstance(payload, tuple):
+                    callback, args = payload
+                    callback(*args)
+                else:
+                    self._record_lag(time.time() - published)
+                    if decoded is not None:
+                        latency_tracer.picked_up(decoded)
+                    process_data(payload, received=received)
+            except Exception:
+                log.error("Error applying market frame from feed thread", exc_info=True)
+            self.drained += 1
+
+            applied += 1
+            if applied >= self.batch:
+                # Let the strategies triggered so far run before draining more
+                applied = 0
+                await asyncio.sleep(0)
+
+    def _record_lag(self, lag):
+        self._lag_total += lag
+        self._lag_count += 1
+        if lag > self._lag_max:
+            self._lag_max = lag
+
+    def _resync_dropped(self):
+        markets = set()
+        while True:
+            try:
+                markets.add(self._dropped_markets.get_nowait())
+            except queue.Empty:
+                break
+
+        for market in markets:
+            book_integrity.request_resync(market, 'dropped')
+
+    def report(self):
+        """Return ring depth, drops and handoff lag since the previous report."""
+        lag_avg = self._lag_total / self._lag_count if self._lag_count else 0.0
+        report = {
+            'depth': len(self.ring),
+            'high_water': self.ring.high_water,
+            'published': self.published,
+            'drained': self.drained,
+            'dropped': self.ring.dropped,
+            'lag_avg_ms': round(lag_avg * 1000, 3),
+            'lag_max_ms': round(self._lag_max * 1000, 3),
+        }
+        self._lag_total, self._lag_max, self._lag_count = 0.0, 0.0, 0
+        return report
+
+
+class FeedThread:
+    """
+    Runs a MarketFeed on its own event loop in a background thread.
+
+    Socket receive, journaling and decoding happen there, so strategies that hold
+    the main loop do not delay reading the socket. Decoded frames reach the main
+    loop through the feed's FeedHandoff.
+
+    Args:
+        feed (MarketFeed): Feed created with a handoff
+    """
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.thread = None
+
+    def start(self, tokens):
+        self.thread = threading.Thread(target=self._main, args=(list(tokens),), name="market-feed", daemon=True)
+        self.thread.start()
+
+    def _main(self, tokens):
+        try:
+            asyncio.run(self.feed.run(tokens))
+        except Exception:
+            log.error("Market feed thread stopped", exc_info=True)
@@ -9,7 +9,12 @@ all_tokens = []
 # Mapping between tokens in the same market (YES->NO, NO->YES)
 REVERSE_TOKENS = {}  
 
+# Token whose order book is kept for each traded market, its token1
+# Format: {condition_id: token_id}
+MARKET_TOKENS = {}
+
 # Order book data for all markets
+# Format: {condition_id: OrderBook}
 all_data = {}  
 
 # Market configuration data from Google Sheets
@@ -23,9 +28,34 @@ strategy_config = {}
 # Polymarket client instance
 client = None
 
+# Market websocket feed (MarketFeed), set once the websockets start
+market_feed = None
+
+# Raw feed journal (FeedRecorder), None unless FEED_JOURNAL_DIR is set
+recorder = None
+
+# Messages received on the user websocket
+user_messages = 0
+
+# Ring buffer handoff from the market feed thread (FeedHandoff), None unless MARKET_FEED_THREAD=1
+feed_handoff = None
+
+# (worker index, worker count) when running as one worker of the supervisor
+# (see poly_data.supervisor), None in a single process
+shard = None
+
+# Shared positions/orders/risk-off store (SharedStore), None in a single process
+store = None
+
+# Shared memory publisher of books, positions and orders (StatePublisher), None unless STATE_SHM_NAME is set
+state_publisher = None
+
 # Trading parameters from Google Sheets
 params = {}
 
+# Directory holding risk-off details per market
+risk_dir = 'positions/'
+
 # Lock for thread-safe trading operations
 lock = threading.Lock()
 
@@ -42,8 +72,9 @@ performing_timestamps = {}
 # Timestamps for when positions were last updated
 last_trade_update = {}
 
-# Current open orders for each token
-# Format: {token_id: {'buy': {price, size}, 'sell': {price, size}}}
+# Current open orders for each token, keyed by order ID
+# Format: {token_id: {order_id: {id, side, price, original_size, size_matched, size, status, created}}}
+# created is when the order was first seen, i.e. its queue position
 orders = {}
 
 # Current positions for each token
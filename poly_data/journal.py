@@ -0,0 +1,292 @@
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future, TimeoutError
+
+import numpy as np
+
+import poly_data.global_state as global_state
+
+# Journal layout
+# --------------
+# Every segment is a pair of files in the journal directory:
+#
+#   feed-<start>.jrnl.gz  concatenated gzip members, one per block of records
+#   feed-<start>.idx      one JSON line per block: {"ts", "offset", "length", "keyframe"}
+#
+# A record is one line "<receive time in ns> <channel> <raw frame>". Channels are
+# "market", "user" and "keyframe", where a keyframe record holds a snapshot of all
+# books. Keyframes always start their own block, so a reader can jump to the last
+# keyframe before a timestamp and decompress forward from there. A keyframe holds
+# the books as of every frame before it and is written ahead of the frame that
+# triggered it, which shares its timestamp. Because each block is a complete gzip
+# member, the segment is also a valid .gz file.
+
+# Seconds the writer waits for the strategy loop to copy the books of a keyframe
+KEYFRAME_TIMEOUT = 10
+
+
+class FeedRecorder:
+    """
+    Low-overhead recorder for raw websocket frames.
+
+    record() only timestamps the frame and puts it on a queue; compression and
+    disk writes happen on a background thread so the event loop never blocks on IO.
+    Keyframes cost the thread applying market frames one copy of each book's
+    non-empty levels; they are serialized on the background thread.
+
+    Args:
+        directory (str): Directory the segments are written to
+        segment_seconds (int): Start a new segment file after this many seconds
+        block_seconds (float): Maximum time covered by one compressed block, which
+            is also the resolution of the time index
+        keyframe_seconds (int): Interval between order book keyframes
+    """
+
+    def __init__(self, directory, segment_seconds=3600, block_seconds=1.0, keyframe_seconds=60):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.block_seconds = block_seconds
+        self.keyframe_seconds = keyframe_seconds
+
+        self.frames = 0
+        self.bytes_written = 0
+        self.keyframes_missed = 0
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._last_keyframe = 0
+
+        self._segment_start = None
+        self._data_file = None
+        self._index_file = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._writer, name="feed-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything queued so far and close the current segment."""
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    def record(self, channel, raw, handoff=None):
+        """
+        Queue a raw frame. Called for every received message, before it is applied.
+
+        Args:
+            channel (str): "market" or "user"
+            raw (str): Frame exactly as received
+            handoff (FeedHandoff, optional): Set when called on the feed thread; the
+                books of a keyframe are then copied on the strategy loop, once
+                every frame published before this one has been applied
+        """
+        now = time.time_ns()
+
+        if channel == 'market' and now - self._last_keyframe > self.keyframe_seconds * 1e9:
+            self._last_keyframe = now
+            books = Future()
+            if handoff is None:
+                books.set_result(copy_books())
+            else:
+                handoff.call(lambda: books.set_result(copy_books()))
+            # Ahead of the frame, since the copy does not include it yet
+            self._queue.put((now, 'keyframe', books))
+
+        self._queue.put((now, channel, raw))
+        self.frames += 1
+
+    # ---- background writer ----
+
+    def _open_segment(self, ts):
+        self._close_segment()
+        name = time.strftime('%Y%m%d-%H%M%S', time.gmtime(ts / 1e9))
+        self._data_file = open(os.path.join(self.directory, f'feed-{name}.jrnl.gz'), 'ab')
+        self._index_file = open(os.path.join(self.directory, f'feed-{name}.idx'), 'a')
+        self._segment_start = ts
+
+    def _close_segment(self):
+        if self._data_file is not None:
+            self._data_file.close()
+            self._index_file.close()
+            self._data_file = self._index_file = None
+
+    def _write_block(self, lines, first_ts, keyframe):
+        if self._data_file is None or first_ts - self._segment_start > self.segment_seconds * 1e9:
+            self._open_segment(first_ts)
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        data = compressor.compress(''.join(lines).encode()) + compressor.flush()
+
+        offset = self._data_file.tell()
+        self._data_file.write(data)
+        self._data_file.flush()
+
+        entry = {'ts': first_ts, 'offset': offset, 'length': len(data), 'keyframe': keyframe}
+        self._index_file.write(json.dumps(entry) + '\n')
+        self._index_file.flush()
+        self.bytes_written += len(data)
+
+    def _writer(self):
+        lines, first_ts = [], None
+        block_ns = self.block_seconds * 1e9
+
+        while True:
+            try:
+                item = self._queue.get(timeout=self.block_seconds)
+            except queue.Empty:
+                item = ()
+
+            if item is None:
+                if lines:
+                    self._write_block(lines, first_ts, False)
+                self._close_segment()
+                return
+
+            if item:
+                ts, channel, raw = item
+
+                if channel == 'keyframe':
+                    try:
+                        raw = json.dumps(keyframe_books(raw.result(KEYFRAME_TIMEOUT)))
+                    except TimeoutError:
+                        # The strategy loop is stuck or gone; later frames are still recorded
+                        self.keyframes_missed += 1
+                        continue
+
+                    # Keyframes get their own block so readers can seek straight to them
+                    if lines:
+                        self._write_block(lines, first_ts, False)
+                        lines, first_ts = [], None
+                    self._write_block([f"{ts} {channel} {raw}\n"], ts, True)
+                    continue
+
+                line = f"{ts} {channel} {raw.replace(chr(10), ' ')}\n"
+
+                if first_ts is None:
+                    first_ts = ts
+                lines.append(line)
+
+            if lines and time.time_ns() - first_ts >= block_ns:
+                self._write_block(lines, first_ts, False)
+                lines, first_ts = [], None
+
+
+def copy_books():
+    """
+    Copy the non-empty levels of every order book. Called on the thread that
+    applies market frames, so each book is copied between frames.
+
+    Returns:
+        dict: {market: (asset_id, bid ticks, bid sizes, ask ticks, ask sizes)} as arrays
+    """
+    copies = {}
+    for market, book in list(global_state.all_data.items()):
+        bid_ticks = np.flatnonzero(book.bid_sizes)
+        ask_ticks = np.flatnonzero(book.ask_sizes)
+        copies[market] = (book.asset_id, bid_ticks, book.bid_sizes[bid_ticks],
+                          ask_ticks, book.ask_sizes[ask_ticks])
+    return copies
+
+
+def keyframe_books(copies):
+    """Turn copy_books() output into {market: {"asset_id", "bids", "asks"}} with [tick, size] levels."""
+    return {
+        market: {
+            'asset_id': asset_id,
+            'bids': [[tick, size] for tick, size in zip(bid_ticks.tolist()[::-1], bid_sizes.tolist()[::-1])],
+            'asks': [[tick, size] for tick, size in zip(ask_ticks.tolist(), ask_sizes.tolist())],
+        }
+        for market, (asset_id, bid_ticks, bid_sizes, ask_ticks, ask_sizes) in copies.items()
+    }
+
+
+class JournalReader:
+    """
+    Reads journals written by FeedRecorder.
+
+    Only the small index files are loaded up front; blocks are decompressed on
+    demand, so seeking to a timestamp does not decode anything before it.
+
+    Args:
+        directory (str): Journal directory
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.blocks = []
+
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.idx'):
+                continue
+            data_path = os.path.join(directory, name[:-len('.idx')] + '.jrnl.gz')
+            with open(os.path.join(directory, name)) as index_file:
+                for line in index_file:
+                    entry = json.loads(line)
+                    entry['path'] = data_path
+                    self.blocks.append(entry)
+
+        self.blocks.sort(key=lambda entry: entry['ts'])
+
+    def _read_block(self, entry):
+        with open(entry['path'], 'rb') as data_file:
+            data_file.seek(entry['offset'])
+            data = zlib.decompress(data_file.read(entry['length']), 31)
+
+        for line in data.decode().split('\n'):
+            if not line:
+                continue
+            ts, channel, raw = line.split(' ', 2)
+            yield int(ts), channel, raw
+
+    def _start_block(self, start_ts, from_keyframe):
+        start = 0
+        for i, entry in enumerate(self.blocks):
+            if entry['ts'] > start_ts:
+                break
+            if entry['keyframe'] or not from_keyframe:
+                start = i
+        return start
+
+    def read(self, start_ts=None, end_ts=None, channels=None, from_keyframe=False):
+        """
+        Yield (ts_ns, channel, raw) records in receive order.
+
+        Args:
+            start_ts (int, optional): First receive time in ns to return
+            end_ts (int, optional): Stop after this receive time in ns
+            channels (iterable, optional): Channels to return, all when None
+            from_keyframe (bool): Start at the last keyframe at or before start_ts
+                instead, so the books can be rebuilt as of start_ts
+        """
+        first = 0
+        if start_ts is not None:
+            first = self._start_block(start_ts, from_keyframe)
+            if from_keyframe:
+                start_ts = None
+
+        for entry in self.blocks[first:]:
+            if end_ts is not None and entry['ts'] > end_ts:
+                return
+
+            for ts, channel, raw in self._read_block(entry):
+                if end_ts is not None and ts > end_ts:
+                    return
+                if start_ts is not None and ts < start_ts:
+                    continue
+                if channels is None or channel in channels:
+                    yield ts, channel, raw
+
+    def keyframe_at(self, ts):
+        """Return (ts_ns, books) for the last keyframe at or before ts, or None."""
+        for entry in reversed(self.blocks):
+            if entry['keyframe'] and entry['ts'] <= ts:
+                for record_ts, channel, raw in self._read_block(entry):
+                    if channel == 'keyframe':
+                        return record_ts, json.loads(raw)
+        return None
@@ -0,0 +1,237 @@
+import contextvars
+import math
+import time
+from collections import OrderedDict
+
+# Stages of one trigger, in the order they happen. Durations are in seconds
+# of time.perf_counter(), which is shared by the feed thread, the strategy loop
+# and the order gateway's workers.
+#   decode         websocket recv() returned -> frame journaled and decoded
+#   handoff        decoded on the feed thread -> picked up by the strategy loop
+#   apply          applying one market's update to its order book
+#   queue          first unserved update applied -> strategy run starts
+#   lock           waiting for the market's strategy lock
+#   decide         lock acquired -> order batch ready to send
+#   submit         batch handed to the order gateway -> exchange acknowledged
+#   sign, cancel, post   parts of submit spent signing, cancelling and posting
+#   tick_to_trade  frame received -> new orders acknowledged
+#   user_event     acknowledged -> order event for it on the user channel
+#   tick_to_event  frame received -> order event on the user channel
+STAGES = ('decode', 'handoff', 'apply', 'queue', 'lock', 'decide', 'submit',
+          'sign', 'cancel', 'post', 'tick_to_trade', 'user_event', 'tick_to_event')
+
+# Bucket i holds durations in [2**(i-1), 2**i) microseconds; the last is open-ended
+NUM_BUCKETS = 32
+
+
+class LatencyHistogram:
+    """
+    Log2-bucketed duration histogram.
+
+    Recording is a frexp and a list increment, so it is cheap enough for every
+    frame. Quantiles are estimated at the upper edge of their bucket, i.e. to
+    within a factor of two.
+    """
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = math.frexp(seconds * 1e6)[1] if seconds > 0 else 0
+        self.buckets[min(max(index, 0), NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound in seconds of the q-th quantile."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return min(2 ** index / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p90_ms': round(self.quantile(0.9) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Trace:
+    """Timeline of one strategy run for a market, from the update that made it dirty."""
+
+    __slots__ = ('market', 'received', 'mark')
+
+    def __init__(self, market, received, mark):
+        self.market = market
+        self.received = received
+        self.mark = mark
+
+
+class LatencyTracer:
+    """
+    Tick-to-trade tracing aggregated into histograms per stage and per market.
+
+    The market feed reports when each frame was received and decoded and how
+    long applying it took. The first update applied to a market since its last
+    strategy run opens the trace for the next run; the scheduler begin()s the
+    trace when the run starts and the strategy and client mark the remaining
+    stages. The trace travels with the strategy task in a context variable, and
+    the order gateway runs client calls inside that context so signing and
+    posting on its worker threads are attributed to the right market.
+
+    Order IDs acknowledged in a traced run are kept until their order event
+    arrives on the user channel, which closes the trace.
+
+    Args:
+        enabled (bool): Record anything at all
+        max_pending (int): Acknowledged orders kept waiting for their user event
+    """
+
+    def __init__(self, enabled=True, max_pending=10000):
+        self.enabled = enabled
+        self.max_pending = max_pending
+
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.markets = {}
+
+        # market -> perf_counter times of the first unserved update (received, applied)
+        self._dirty = {}
+        # order_id -> (market, received, acknowledged)
+        self._acked = OrderedDict()
+        self._current = contextvars.ContextVar('latency_trace', default=None)
+
+    def record(self, market, stage, seconds):
+        self.stages[stage].record(seconds)
+        if market is not None:
+            histograms = self.markets.get(market)
+            if histograms is None:
+                histograms = self.markets[market] = {}
+            histogram = histograms.get(stage)
+            if histogram is None:
+                histogram = histograms[stage] = LatencyHistogram()
+            histogram.record(seconds)
+
+    # ---- market feed ----
+
+    def decoded(self, received, decoded):
+        if self.enabled:
+            self.record(None, 'decode', decoded - received)
+
+    def picked_up(self, decoded):
+        if self.enabled:
+            self.record(None, 'handoff', time.perf_counter() - decoded)
+
+    def applied(self, market, received, started):
+        """Record applying one update to market's book, opening its next trace if none is pending."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.record(market, 'apply', now - started)
+        if market not in self._dirty:
+            self._dirty[market] = (received if received is not None else started, now)
+
+    # ---- strategy run ----
+
+    def begin(self, market):
+        """Open the trace of a strategy run for market in the current task."""
+        if not self.enabled:
+            return None
+        now = time.perf_counter()
+        dirty = self._dirty.pop(market, None)
+        if dirty is not None:
+            self.record(market, 'queue', now - dirty[1])
+            trace = Trace(market, dirty[0], now)
+        else:
+            trace = Trace(market, None, now)  # Triggered by the user channel or a release
+        self._current.set(trace)
+        return trace
+
+    def stage(self, stage):
+        """Close stage for the current trace: the time since the previous stage ended."""
+        trace = self._current.get()
+        if trace is None:
+            return
+        now = time.perf_counter()
+        self.record(trace.market, stage, now - trace.mark)
+        trace.mark = now
+
+    def span(self, stage):
+        """Context manager timing a part of the current stage, e.g. signing inside submit."""
+        return _Span(self, stage)
+
+    def acknowledged(self, responses):
+        """Close the submit stage and wait for the user events of the orders it placed."""
+        trace = self._current.get()
+        if trace is None:
+            return
+        self.stage('submit')
+
+        order_ids = [response.get('orderID') for response in responses if response and response.get('orderID')]
+        if not order_ids:
+            return
+
+        if trace.received is not None:
+            self.record(trace.market, 'tick_to_trade', trace.mark - trace.received)
+        for order_id in order_ids:
+            self._acked[order_id] = (trace.market, trace.received, trace.mark)
+        while len(self._acked) > self.max_pending:
+            self._acked.popitem(last=False)
+
+    # ---- user channel ----
+
+    def order_event(self, order_id):
+        pending = self._acked.pop(order_id, None)
+        if pending is None:
+            return
+        market, received, acked = pending
+        now = time.perf_counter()
+        self.record(market, 'user_event', now - acked)
+        if received is not None:
+            self.record(market, 'tick_to_event', now - received)
+
+    def forget(self, market):
+        self._dirty.pop(market, None)
+        self.markets.pop(market, None)
+
+    def report(self, market=None):
+        """Return latency summaries per stage, overall or for one market."""
+        histograms = self.stages if market is None else self.markets.get(market, {})
+        return {stage: histograms[stage].summary() for stage in STAGES
+                if stage in histograms and histograms[stage].count}
+
+
+class _Span:
+    __slots__ = ('tracer', 'stage', 'trace', 'start')
+
+    def __init__(self, tracer, stage):
+        self.tracer = tracer
+        self.stage = stage
+
+    def __enter__(self):
+        self.trace = self.tracer._current.get()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            self.tracer.record(self.trace.market, self.stage, time.perf_counter() - self.start)
+        return False
+
+
+latency_tracer = LatencyTracer()
@@ -0,0 +1,369 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import resource_tracker, shared_memory
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import poly_data.global_state as global_state
+from poly_data.log import get_logger
+from poly_data.orderbook import NUM_TICKS, PRICE_SCALE
+
+log = get_logger(__name__)
+
+MAGIC = b'PMSTATE1'
+
+# Header: magic, seq, slots, meta_capacity, meta_len, published (unix ns), as int64 words
+HEADER_BYTES = 64
+_SEQ, _SLOTS, _META_CAPACITY, _META_LEN, _PUBLISHED = 1, 2, 3, 4, 5
+
+
+def _untrack(region):
+    """
+    Keep the resource tracker from unlinking region when this process exits.
+
+    Regions outlive the bot: a restarted bot or worker writes into the same one,
+    so sidecars attached to it keep reading without reattaching.
+    """
+    try:
+        resource_tracker.unregister(region._name, 'shared_memory')
+    except Exception:
+        pass
+    return region
+
+
+def _attach(name):
+    return _untrack(shared_memory.SharedMemory(name=name))
+
+
+def _header(region):
+    return np.ndarray((HEADER_BYTES // 8,), dtype=np.int64, buffer=region.buf)
+
+
+def _books(region, slots):
+    return np.ndarray((slots, 2, NUM_TICKS), dtype=np.float64, buffer=region.buf, offset=HEADER_BYTES)
+
+
+class StatePublisher:
+    """
+    Publish the bot's order books, positions and open orders to shared memory.
+
+    The region holds every book's tick-indexed bid and ask size arrays, copied
+    as they are, and a JSON document with the book directory, positions and
+    orders. Snapshots are versioned with a sequence counter that is odd while a
+    snapshot is being written: readers (StateReader) copy what they need and
+    retry if the counter moved, so neither side ever takes a lock.
+
+    publish() runs on the trading loop between frames, so every snapshot holds
+    whole applied frames. The trading loop pays for copying the books written
+    since the last snapshot and one JSON dump per interval, and sidecars read
+    with no API calls.
+
+    Args:
+        name (str): Shared memory name, e.g. polymaker-state
+        slots (int): Books the region has room for
+        meta_capacity (int): Bytes reserved for the JSON document
+    """
+
+    def __init__(self, name, slots=1024, meta_capacity=4 * 1024 * 1024):
+        self.name = name
+        self.slots = slots
+        self.meta_capacity = meta_capacity
+        self.version = 0
+        self.skipped = 0
+
+        # Slots stay with their market so unchanged books are not copied again
+        self._slots = {}
+        self._free = list(range(slots - 1, -1, -1))
+        # slot -> (id, version) of the OrderBook last copied into it
+        self._copied = {}
+
+        size = HEADER_BYTES + slots * 2 * NUM_TICKS * 8 + meta_capacity
+        try:
+            self.region = _untrack(shared_memory.SharedMemory(name=name, create=True, size=size))
+        except FileExistsError:
+            # Left by a previous run or a restarted worker; reuse it so attached readers keep working
+            self.region = _attach(name)
+            if self.region.size < size:
+                self.region.unlink()
+                self.region.close()
+                self.region = _untrack(shared_memory.SharedMemory(name=name, create=True, size=size))
+
+        self._header = _header(self.region)
+        self._books = _books(self.region, slots)
+        self._meta_offset = HEADER_BYTES + slots * 2 * NUM_TICKS * 8
+
+        self._header[_SEQ] += self._header[_SEQ] % 2  # A writer that died mid-snapshot left it odd
+        self._header[_SLOTS] = slots
+        self._header[_META_CAPACITY] = meta_capacity
+        self.region.buf[:len(MAGIC)] = MAGIC
+
+    def publish(self):
+        """Write one snapshot of global_state."""
+        books = dict(global_state.all_data)
+
+        for market in [market for market in self._slots if market not in books]:
+            slot = self._slots.pop(market)
+            self._copied.pop(slot, None)
+            self._free.append(slot)
+
+        skipped = 0
+        for market in books:
+            if market not in self._slots:
+                if not self._free:
+                    skipped += 1
+                    continue
+                self._slots[market] = self._free.pop()
+        self.skipped = skipped
+
+        # Copied down to each position and order, so the document is one consistent
+        # state however long the dump takes
+        positions = {token: dict(position) for token, position in list(global_state.positions.items())}
+        orders = {token: {order_id: dict(order) for order_id, order in list(token_orders.items())}
+                  for token, token_orders in list(global_state.orders.items())}
+
+        meta = json.dumps({
+            'version': self.version + 1,
+            'published': time.time(),
+            'shard': global_state.shard,
+            'books': {market: {'slot': slot, 'asset_id': books[market].asset_id}
+                      for market, slot in self._slots.items()},
+            'positions': positions,
+            'orders': orders,
+        }, default=str).encode()
+
+        if len(meta) > self.meta_capacity:
+            log.warning("State snapshot does not fit its shared memory region, not published",
+                        name=self.name, size=len(meta), capacity=self.meta_capacity)
+            return
+
+        header = self._header
+        header[_SEQ] += 1
+        for market, slot in self._slots.items():
+            book = books[market]
+            copied = (id(book), book.version)
+            if self._copied.get(slot) != copied:
+                np.copyto(self._books[slot, 0], book.bid_sizes)
+                np.copyto(self._books[slot, 1], book.ask_sizes)
+                self._copied[slot] = copied
+        self.region.buf[self._meta_offset:self._meta_offset + len(meta)] = meta
+        header[_META_LEN] = len(meta)
+        header[_PUBLISHED] = time.time_ns()
+        header[_SEQ] += 1
+
+        self.version += 1
+
+    async def run(self, interval):
+        """Publish every interval seconds on the running event loop."""
+        while True:
+            try:
+                self.publish()
+            except Exception:
+                log.error("Error publishing state", name=self.name, exc_info=True)
+            await asyncio.sleep(interval)
+
+    def report(self):
+        return {'name': self.name, 'version': self.version, 'books': len(global_state.all_data),
+                'slots': self.slots, 'skipped': self.skipped}
+
+
+class StateReader:
+    """
+    Read snapshots written by one or more StatePublishers.
+
+    With several names, as in supervisor mode where every worker publishes its
+    own markets, books, positions and orders are merged across the regions.
+    Regions are attached on first use, so a reader can be created before the
+    bot is running.
+
+    Args:
+        names (list): Shared memory names
+        retries (int): Attempts at a consistent copy before giving up
+    """
+
+    def __init__(self, names, retries=1000):
+        self.names = list(names)
+        self.retries = retries
+        self._regions = {}
+
+    @classmethod
+    def from_env(cls):
+        """Reader for the regions the bot publishes with the current .env, or None if it does not publish."""
+        name = os.getenv("STATE_SHM_NAME")
+        if not name:
+            return None
+        workers = int(os.getenv("MARKET_WORKERS", "1"))
+        return cls(state_names(name, workers))
+
+    def _region(self, name):
+        region = self._regions.get(name)
+        if region is None:
+            region = _attach(name)
+            if bytes(region.buf[:len(MAGIC)]) != MAGIC:
+                region.close()
+                raise FileNotFoundError(f"{name} is not a state region")
+            self._regions[name] = region
+        return region
+
+    def _read(self, name, read):
+        """Call read(region, meta) until it sees one complete snapshot."""
+        region = self._region(name)
+        header = _header(region)
+
+        for _ in range(self.retries):
+            seq = int(header[_SEQ])
+            if seq % 2 or seq == 0:
+                time.sleep(0)
+                continue
+
+            meta_offset = HEADER_BYTES + int(header[_SLOTS]) * 2 * NUM_TICKS * 8
+            raw = bytes(region.buf[meta_offset:meta_offset + int(header[_META_LEN])])
+            try:
+                result = read(region, json.loads(raw))
+            except (ValueError, KeyError, IndexError):
+                result = None  # Torn read; the sequence check below retries it
+
+            if int(header[_SEQ]) == seq and result is not None:
+                return result
+        raise TimeoutError(f"No consistent snapshot of {name} after {self.retries} attempts")
+
+    def versions(self):
+        """Version and publication time of each region."""
+        return {name: self._read(name, lambda region, meta: {'version': meta['version'],
+                                                             'published': meta['published']})
+                for name in self.names}
+
+    def positions(self):
+        positions = {}
+        for name in self.names:
+            positions.update(self._read(name, lambda region, meta: meta['positions']))
+        return positions
+
+    def orders(self):
+        orders = {}
+        for name in self.names:
+            orders.update(self._read(name, lambda region, meta: meta['orders']))
+        return orders
+
+    def books(self, markets=None, depth=None):
+        """
+        Levels of the published books, best price first.
+
+        Args:
+            markets (iterable, optional): Condition IDs to read, all by default
+            depth (int, optional): Levels per side
+
+        Returns:
+            dict: {condition_id: {'asset_id', 'bids': [(price, size)], 'asks': [(price, size)]}}
+        """
+        wanted = set(markets) if markets is not None else None
+
+        def read(region, meta):
+            books = _books(region, int(_header(region)[_SLOTS]))
+            result = {}
+            for market, entry in meta['books'].items():
+                if wanted is None or market in wanted:
+                    sizes = books[entry['slot']].copy()
+                    result[market] = {'asset_id': entry['asset_id'],
+                                      'bids': _levels(sizes[0], True, depth),
+                                      'asks': _levels(sizes[1], False, depth)}
+            return result
+
+        books = {}
+        for name in self.names:
+            books.update(self._read(name, read))
+        return books
+
+    def close(self):
+        for region in self._regions.values():
+            region.close()
+        self._regions = {}
+
+
+def _levels(sizes, descending, depth):
+    ticks = np.flatnonzero(sizes)
+    if descending:
+        ticks = ticks[::-1]
+    if depth is not None:
+        ticks = ticks[:depth]
+    return [(int(tick) / PRICE_SCALE, float(sizes[tick])) for tick in ticks]
+
+
+def state_names(name, workers=1):
+    """Region names for a base name: the name itself, or one per worker in supervisor mode."""
+    if workers > 1:
+        return [f"{name}-{index}" for index in range(workers)]
+    return [name]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    reader = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            depth = int(query['depth'][0]) if 'depth' in query else None
+        except ValueError:
+            self.send_error(400, "depth must be an integer")
+            return
+
+        try:
+            if parts == ['version']:
+                body = self.reader.versions()
+            elif parts == ['positions']:
+                body = self.reader.positions()
+            elif parts == ['orders']:
+                body = self.reader.orders()
+            elif parts == ['books']:
+                body = self.reader.books(depth=depth)
+            elif len(parts) == 2 and parts[0] == 'books':
+                body = self.reader.books([parts[1]], depth).get(parts[1])
+                if body is None:
+                    self.send_error(404)
+                    return
+            else:
+                self.send_error(404)
+                return
+        except (FileNotFoundError, TimeoutError) as exc:
+            self.send_error(503, str(exc))
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Sidecars poll; requests would flood stdout
+
+
+def start_state_server(reader, port, host='127.0.0.1'):
+    """
+    Serve a StateReader as JSON on a background thread.
+
+    Endpoints: /version, /positions, /orders, /books and /books/<condition_id>,
+    the last two taking ?depth=N. Requests read shared memory only, never the
+    trading process's objects.
+
+    Args:
+        reader (StateReader): Regions to serve
+        port (int): Port to listen on
+        host (str): Interface to bind, local only by default
+
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    handler = type('StateHandler', (_Handler,), {'reader': reader})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="state-server", daemon=True).start()
+    print(f"Serving live state on http://{host}:{port}/")
+    return server
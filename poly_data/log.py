@@ -0,0 +1,192 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import signal
+import sys
+import threading
+
+import poly_data.global_state as global_state
+
+# Keyword arguments of Logger._log; every other keyword becomes a structured field
+_RESERVED = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    Logger taking structured fields as keyword arguments.
+
+        log.info("Sending buy order", market=market_id, price=price, size=size)
+
+    The message is only formatted, on the log writer thread, if the level is
+    enabled. Records that carry a market field are sampled per market (see
+    SampleFilter); pass sample=False to always log one.
+    """
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in _RESERVED}
+        kwargs['extra'] = {'fields': fields}
+        return msg, kwargs
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+class SampleFilter(logging.Filter):
+    """
+    Rate-limit repetitive per-market messages.
+
+    Records with a market field are keyed by logger, message template and
+    market; each key gets `burst` records per `interval` seconds and the rest
+    are dropped. The next record let through for the key reports how many
+    were suppressed. Warnings and errors are never sampled.
+
+    Args:
+        interval (float): Length of a sampling window in seconds
+        burst (int): Records per key and window
+    """
+
+    def __init__(self, interval=10.0, burst=3):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}
+
+    def filter(self, record):
+        fields = getattr(record, 'fields', None)
+        if not fields or record.levelno >= logging.WARNING or not fields.get('sample', True):
+            return True
+        market = fields.get('market')
+        if market is None:
+            return True
+
+        key = (record.name, record.msg, market)
+        now = record.created
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window is not None else 0
+            window = self._windows[key] = [now, 0, 0]
+            if suppressed:
+                fields['suppressed'] = suppressed
+
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the writer thread.
+
+    The stock prepare() formats every record on the calling thread; here the
+    record is queued as is, so the caller pays only for creating it. Log
+    arguments and fields should therefore be values that are not mutated later.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """time level logger message key=value ..."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items() if key != 'sample')
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update((key, value) for key, value in fields.items() if key != 'sample')
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_listener = None
+
+
+def setup_logging(level=None, fmt=None, sample_interval=None, sample_burst=None, stream=None):
+    """
+    Route all logging through a queue to a background writer thread.
+
+    Defaults come from LOG_LEVEL (INFO), LOG_FORMAT (text or json),
+    LOG_SAMPLE_SECONDS (10) and LOG_SAMPLE_BURST (3).
+
+    Args:
+        level (str, optional): Minimum level logged
+        fmt (str, optional): 'text' or 'json'
+        sample_interval (float, optional): Sampling window for per-market messages
+        sample_burst (int, optional): Per-market messages let through per window
+        stream (file, optional): Where records are written, defaults to stdout
+    """
+    global _listener
+    stop_logging()
+
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    fmt = fmt or os.getenv("LOG_FORMAT", "text")
+    interval = sample_interval if sample_interval is not None else float(os.getenv("LOG_SAMPLE_SECONDS", "10"))
+    burst = sample_burst if sample_burst is not None else int(os.getenv("LOG_SAMPLE_BURST", "3"))
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(SampleFilter(interval, burst))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(records, writer)
+    _listener.start()
+
+
+@atexit.register
+def stop_logging():
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dump_state(*_):
+    """Log the full trading state. Bound to SIGUSR1 by install_state_dump()."""
+    log = get_logger(__name__)
+    # Formatted here, since the state keeps changing while the record is queued
+    log.info("State dump: performing %s", repr({col: sorted(ids) for col, ids in list(global_state.performing.items())}))
+    log.info("State dump: performing timestamps %s", repr(global_state.performing_timestamps))
+    log.info("State dump: last trade update %s", repr(global_state.last_trade_update))
+    log.info("State dump: positions %s", repr(global_state.positions))
+    log.info("State dump: orders %s", repr(global_state.orders))
+
+
+def install_state_dump():
+    """Dump the trading state to the log on `kill -USR1 <pid>`."""
+    if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, dump_state)
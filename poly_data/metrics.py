@@ -0,0 +1,246 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import poly_data.global_state as global_state
+from poly_data.book_integrity import book_integrity
+from poly_data.data_utils import reconcile_stats
+from poly_data.latency import NUM_BUCKETS, latency_tracer
+from poly_data.log import get_logger
+from poly_data.order_gateway import order_gateway
+from poly_data.state_reducer import state_reducer
+from strategies.scheduler import trigger_scheduler
+
+log = get_logger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class Metric:
+    """
+    One metric family in the Prometheus text format.
+
+    Args:
+        name (str): Metric name
+        kind (str): 'counter', 'gauge', 'summary' or 'histogram'
+        help (str): Description
+    """
+
+    def __init__(self, name, kind, help):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples = []
+
+    def add(self, value, suffix='', **labels):
+        self.samples.append((self.name + suffix, labels, value))
+        return self
+
+    def add_histogram(self, histogram, **labels):
+        """Add a LatencyHistogram as cumulative buckets in seconds."""
+        cumulative = 0
+        for index in range(NUM_BUCKETS - 1):
+            cumulative += histogram.buckets[index]
+            self.add(cumulative, '_bucket', **labels, le=repr(2 ** index / 1e6))
+        self.add(histogram.count, '_bucket', **labels, le='+Inf')
+        self.add(histogram.total, '_sum', **labels)
+        self.add(histogram.count, '_count', **labels)
+        return self
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for name, labels, value in self.samples:
+            yield f'{name}{_labels(labels)} {float(value)!r}'
+
+
+class MetricsRegistry:
+    """
+    Collectors read at scrape time.
+
+    Nothing is recorded on the trading path for the metrics endpoint itself:
+    each collector turns counters the feed, scheduler and gateway already keep
+    into metrics when the endpoint is scraped. A collector that fails is skipped
+    for that scrape.
+    """
+
+    def __init__(self):
+        self.collectors = []
+
+    def register(self, collector):
+        """Add collector, a function returning Metric objects. Usable as a decorator."""
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for collector in self.collectors:
+            try:
+                for metric in collector():
+                    lines.extend(metric.lines())
+            except Exception:
+                log.error("Error collecting metrics", collector=collector.__name__, exc_info=True)
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+@registry.register
+def collect_feed():
+    messages = Metric('polymaker_market_messages_total', 'counter', 'Frames received per market websocket shard')
+    reconnects = Metric('polymaker_market_reconnects_total', 'counter', 'Reconnects per market websocket shard')
+    tokens = Metric('polymaker_market_tokens', 'gauge', 'Tokens subscribed per market websocket shard')
+
+    feed = global_state.market_feed
+    for shard in list(feed.shards) if feed is not None else []:
+        messages.add(shard.messages, shard=shard.shard_id)
+        reconnects.add(shard.reconnects, shard=shard.shard_id)
+        tokens.add(len(shard.tokens), shard=shard.shard_id)
+
+    user = Metric('polymaker_user_messages_total', 'counter', 'Frames received on the user websocket')
+    user.add(global_state.user_messages)
+
+    updates = Metric('polymaker_book_updates_total', 'counter', 'Order book frames by integrity outcome')
+    for kind, count in book_integrity.report()['totals'].items():
+        updates.add(count, kind=kind)
+
+    metrics = [messages, reconnects, tokens, user, updates]
+
+    handoff = global_state.feed_handoff
+    if handoff is not None:
+        metrics.append(Metric('polymaker_feed_handoff_depth', 'gauge', 'Frames waiting for the strategy loop')
+                       .add(len(handoff.ring)))
+        metrics.append(Metric('polymaker_feed_handoff_dropped_total', 'counter', 'Frames dropped on a full handoff ring')
+                       .add(handoff.ring.dropped))
+    return metrics
+
+
+@registry.register
+def collect_strategies():
+    stats = trigger_scheduler.stats()
+    return [
+        Metric('polymaker_triggers_total', 'counter', 'Strategy triggers requested').add(stats['requested']),
+        Metric('polymaker_triggers_coalesced_total', 'counter', 'Triggers merged into an already queued run')
+            .add(stats['coalesced']),
+        Metric('polymaker_triggers_queued', 'gauge', 'Markets waiting for a strategy run').add(stats['pending']),
+        Metric('polymaker_strategy_running', 'gauge', 'Markets with a strategy run in progress').add(stats['running']),
+        Metric('polymaker_strategy_executions_total', 'counter', 'Strategy runs completed').add(stats['executed']),
+        Metric('polymaker_strategy_duration_seconds', 'histogram', 'Duration of one market strategy run')
+            .add_histogram(trigger_scheduler.durations),
+    ]
+
+
+@registry.register
+def collect_gateway():
+    calls = Metric('polymaker_rest_calls_total', 'counter', 'Exchange calls per client method')
+    errors = Metric('polymaker_rest_errors_total', 'counter', 'Exchange calls that raised, per client method')
+    timeouts = Metric('polymaker_rest_timeouts_total', 'counter', 'Exchange calls that timed out, per client method')
+    seconds = Metric('polymaker_rest_call_seconds', 'summary', 'Exchange call latency per client method')
+
+    for method, stats in list(order_gateway.stats.items()):
+        calls.add(stats['calls'], method=method)
+        errors.add(stats['errors'], method=method)
+        timeouts.add(stats['timeouts'], method=method)
+        seconds.add(stats['seconds'], '_sum', method=method)
+        seconds.add(stats['calls'], '_count', method=method)
+
+    waiting = Metric('polymaker_rest_waiting', 'gauge', 'Exchange calls waiting for rate budget or a worker, per lane')
+    for lane, stats in order_gateway.lane_stats.items():
+        waiting.add(stats['waiting'], lane=lane)
+
+    in_flight = Metric('polymaker_rest_in_flight', 'gauge', 'Exchange calls running').add(order_gateway.in_flight)
+    return [calls, errors, timeouts, seconds, waiting, in_flight]
+
+
+@registry.register
+def collect_state():
+    performing = Metric('polymaker_performing_entries', 'gauge', 'Matched trades waiting to be mined')
+    performing.add(sum(len(trades) for trades in list(global_state.performing.values())))
+
+    updates = Metric('polymaker_position_updates_total', 'counter',
+                     'Position fields corrected from the positions API, by field')
+    updates.add(reconcile_stats['size_updates'], field='size')
+    updates.add(reconcile_stats['avg_updates'], field='avgPrice')
+    updates.add(reconcile_stats['new_assets'], field='new')
+
+    held = Metric('polymaker_position_updates_held_total', 'counter',
+                  'API size differences not applied, by reason')
+    held.add(reconcile_stats['held_pending'], reason='pending')
+    held.add(reconcile_stats['held_recent'], reason='recent_trade')
+
+    events = Metric('polymaker_state_events_total', 'counter', 'Order and position events applied, by type and source')
+    for (event_type, source), count in list(state_reducer.applied.items()):
+        events.add(count, type=event_type, source=source)
+
+    divergences = Metric('polymaker_audit_divergences_total', 'counter',
+                         'Differences between order state and the REST audit, by kind')
+    for kind, count in list(state_reducer.divergences.items()):
+        divergences.add(count, kind=kind)
+
+    books = list(global_state.all_data.values())
+    return [
+        performing,
+        updates,
+        held,
+        events,
+        divergences,
+        Metric('polymaker_position_drift', 'gauge', 'Total absolute size difference to the positions API last run')
+            .add(reconcile_stats['last_drift']),
+        Metric('polymaker_order_books', 'gauge', 'Order books held in global_state.all_data').add(len(books)),
+        Metric('polymaker_order_book_bytes', 'gauge', 'Memory held by the order book level arrays')
+            .add(sum(book.bid_sizes.nbytes + book.ask_sizes.nbytes for book in books)),
+    ]
+
+
+@registry.register
+def collect_latency():
+    latency = Metric('polymaker_latency_seconds', 'histogram', 'Tick-to-trade latency per stage')
+    for stage, histogram in latency_tracer.stages.items():
+        if histogram.count:
+            latency.add_histogram(histogram, stage=stage)
+    return [latency]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood stdout
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """
+    Serve the registry at http://host:port/metrics on a background thread.
+
+    Args:
+        port (int): Port to listen on
+        host (str): Interface to bind, local only by default
+
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Serving metrics", url=f"http://{host}:{port}/metrics")
+    return server
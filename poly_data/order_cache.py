@@ -0,0 +1,201 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from poly_data.log import get_logger
+
+log = get_logger(__name__)
+
+
+def ladder_key(token, side, price, size, neg_risk):
+    """Cache key of one signed order. Prices and sizes are rounded to what the order builder keeps."""
+    return (str(token), side, round(float(price), 4), round(float(size), 2), bool(neg_risk))
+
+
+class PresignedOrderCache:
+    """
+    Orders signed ahead of time at the prices a token's quote is likely to move to.
+
+    Each time a strategy posts a new quote for a token, prefetch() queues
+    signatures for the same side and size at the other prices within `levels`
+    ticks of it. They are signed in one batch by the signer, which hands them to
+    the signing service's worker processes, so the trading process only waits on
+    the pool. When the next requote lands on one of those prices the client takes
+    the ready signature instead of signing on the critical path.
+
+    A signed order carries a random salt and can only be posted once, so take()
+    removes the entry it returns.
+
+    Entries are dropped when:
+    - the quote of their token and side moves more than `levels` ticks away or
+      changes size
+    - they are older than max_age, since the fee rate or tick size they were
+      signed under may have changed
+    - their market is no longer traded (forget_market)
+    - the cache is over max_orders, farthest from the current quote first
+
+    Args:
+        signer (callable): signer(orders) -> signed orders, for a list of
+            (token, side, price, size, neg_risk) tuples
+        levels (int): Ticks above and below the quote to sign
+        max_orders (int): Maximum number of signed orders held
+        max_age (float): Seconds after which a signature is no longer handed out
+    """
+
+    def __init__(self, signer, levels=2, max_orders=2000, max_age=600):
+        self.signer = signer
+        self.levels = levels
+        self.max_orders = max_orders
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-presign")
+
+        # key -> (signed order, signed at, market)
+        self._entries = {}
+        # (token, side) -> (market, center price, tick, size, neg_risk)
+        self._quotes = {}
+        self._pending = set()
+
+        self.stats = {'hits': 0, 'misses': 0, 'signed': 0, 'errors': 0, 'evicted': 0, 'expired': 0}
+
+    def _ladder(self, price, tick):
+        """Prices within levels ticks of price, without price itself, which is being posted."""
+        decimals = len(str(tick).split(".")[1]) if "." in str(tick) else 0
+        prices = []
+        for step in range(-self.levels, self.levels + 1):
+            if step == 0:
+                continue
+            level = round(price + step * tick, decimals)
+            if tick <= level <= 1 - tick:
+                prices.append(level)
+        return prices
+
+    def _distance(self, key):
+        quote = self._quotes.get((key[0], key[1]))
+        if quote is None or quote[3] != key[3]:
+            return float('inf')
+        return abs(key[2] - quote[1]) / quote[2]
+
+    def _wanted(self, key):
+        """Whether key is still on the ladder of its token's latest quote. Call with the lock held."""
+        return self._distance(key) <= self.levels + 1e-9
+
+    def prefetch(self, market, token, side, price, size, neg_risk, tick):
+        """
+        Record a quote about to be posted and queue signatures for the prices around it.
+
+        Args:
+            market (str): Condition ID, used by forget_market
+            token (str): Token ID
+            side (str): "BUY" or "SELL"
+            price (float): Quote price
+            size (float): Quote size
+            neg_risk (bool): Whether this is a negative risk market
+            tick (float): Tick size of the market
+        """
+        token, tick = str(token), float(tick)
+        if size <= 0 or tick <= 0:
+            return
+
+        queue = []
+        with self._lock:
+            self._quotes[(token, side)] = (market, float(price), tick, round(float(size), 2), bool(neg_risk))
+
+            # Drop this side's signatures that fell off the new ladder
+            for key in [key for key in self._entries if key[0] == token and key[1] == side]:
+                if not self._wanted(key):
+                    del self._entries[key]
+                    self.stats['evicted'] += 1
+
+            for level in self._ladder(float(price), tick):
+                key = ladder_key(token, side, level, size, neg_risk)
+                if key not in self._entries and key not in self._pending:
+                    self._pending.add(key)
+                    queue.append(key)
+
+        if queue:
+            self._executor.submit(self._sign, queue, market)
+
+    def _sign(self, queued, market):
+        keys = []
+        try:
+            with self._lock:
+                # A later quote may have moved the ladder while these waited
+                keys = [key for key in queued if self._wanted(key)]
+            if not keys:
+                return
+
+            signed = self.signer(keys)
+
+            with self._lock:
+                for key, order in zip(keys, signed):
+                    if self._wanted(key):
+                        self._entries[key] = (order, time.monotonic(), market)
+                        self.stats['signed'] += 1
+                self._trim()
+        except Exception:
+            self.stats['errors'] += 1
+            log.error("Error presigning orders", market=market, orders=len(keys), exc_info=True)
+        finally:
+            with self._lock:
+                self._pending.difference_update(queued)
+
+    def _trim(self):
+        """Evict the signatures farthest from their quote until under max_orders. Call with the lock held."""
+        excess = len(self._entries) - self.max_orders
+        if excess <= 0:
+            return
+
+        ranked = sorted(self._entries, key=lambda key: (self._distance(key), -self._entries[key][1]), reverse=True)
+        for key in ranked[:excess]:
+            del self._entries[key]
+        self.stats['evicted'] += excess
+
+    def take(self, token, side, price, size, neg_risk):
+        """
+        Remove and return a ready signature for this exact order, or None.
+
+        Safe to call from any thread.
+        """
+        key = ladder_key(token, side, price, size, neg_risk)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and time.monotonic() - entry[1] > self.max_age:
+                self.stats['expired'] += 1
+                entry = None
+
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            self.stats['hits'] += 1
+            return entry[0]
+
+    def expire(self):
+        """Drop every signature older than max_age."""
+        cutoff = time.monotonic() - self.max_age
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[1] < cutoff]:
+                del self._entries[key]
+                self.stats['expired'] += 1
+
+    def forget_market(self, market):
+        """Drop the quotes and signatures of a market that is no longer traded."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[2] == market]:
+                del self._entries[key]
+                self.stats['evicted'] += 1
+            for quote in [quote for quote, details in self._quotes.items() if details[0] == market]:
+                del self._quotes[quote]
+
+    def report(self):
+        """Return cache size, hit rate and eviction counts."""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                size=len(self._entries),
+                pending=len(self._pending),
+                hit_rate=round(self.stats['hits'] / lookups, 3) if lookups else 0.0,
+            )
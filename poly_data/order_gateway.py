@@ -0,0 +1,355 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import poly_data.global_state as global_state
+from poly_data.log import get_logger
+
+log = get_logger(__name__)
+
+# Seconds before a call is reported as timed out. merge_positions shells out to
+# the on-chain merge script and waits for the transaction, so it gets longer.
+DEFAULT_TIMEOUTS = {
+    'create_order': 10,
+    'cancel_all_asset': 5,
+    'cancel_all_market': 5,
+    'get_position': 10,
+    'merge_positions': 120,
+    'cancel_orders': 5,
+    'replace_orders': 15,
+}
+
+# Priority lanes, most urgent first. Risk-off covers the stop-loss sell and the
+# cancels that go with it; routine requotes use the cancel and quote lanes.
+LANES = ('risk_off', 'cancel', 'quote', 'background')
+
+METHOD_LANES = {
+    'create_order': 'quote',
+    'cancel_all_asset': 'cancel',
+    'cancel_all_market': 'cancel',
+    'get_position': 'background',
+    'merge_positions': 'background',
+    'cancel_orders': 'cancel',
+    'replace_orders': 'quote',
+}
+
+# Rate budget each client method draws from
+METHOD_ENDPOINTS = {
+    'create_order': 'order',
+    'cancel_all_asset': 'cancel',
+    'cancel_all_market': 'cancel',
+    'get_position': 'rpc',
+    'merge_positions': 'merge',
+    'cancel_orders': 'cancel',
+    'replace_orders': 'order',
+}
+
+# (sustained requests per second, burst) per endpoint. Kept below the CLOB's
+# published per-endpoint limits so bursts of cancels never get throttled;
+# rpc is the public Polygon node used for balance reads.
+DEFAULT_LIMITS = {
+    'order': (40, 200),
+    'cancel': (20, 100),
+    'rpc': (5, 10),
+    'merge': (1, 2),
+    'default': (10, 20),
+}
+
+
+class OrderBatch:
+    """
+    Cancels and new orders for one market, collected during a strategy run and
+    sent together by OrderGateway.submit.
+
+    Args:
+        market (str): Condition ID
+        tokens (iterable): Both token IDs of the market; cancelling both becomes
+            a single market-wide cancel
+    """
+
+    def __init__(self, market, tokens=()):
+        self.market = market
+        self.tokens = {str(token) for token in tokens}
+        self.cancel_assets = []
+        self.cancel_ids = []
+        self.orders = []
+
+    def cancel_asset(self, asset_id):
+        if str(asset_id) not in self.cancel_assets:
+            self.cancel_assets.append(str(asset_id))
+
+    def cancel_order(self, order_id):
+        self.cancel_ids.append(order_id)
+
+    def add_order(self, token, side, price, size, neg_risk=False):
+        self.orders.append((token, side, price, size, neg_risk))
+
+    def clear(self):
+        self.cancel_assets, self.cancel_ids, self.orders = [], [], []
+
+    def __bool__(self):
+        return bool(self.cancel_assets or self.cancel_ids or self.orders)
+
+
+class TokenBucket:
+    """
+    Token bucket whose waiters are served in priority order.
+
+    Args:
+        rate (float): Tokens added per second
+        burst (int): Bucket capacity
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority):
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._grant()
+        await future
+
+    def _grant(self):
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+
+        if self._waiters and self._timer is None:
+            delay = (1 - self.tokens) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._grant()
+
+
+class PrioritySlots:
+    """Semaphore whose waiters are served in priority order."""
+
+    def __init__(self, slots):
+        self.free = slots
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority):
+        if not self._waiters and self.free > 0:
+            self.free -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Granted just as the caller gave up
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+
+class OrderGateway:
+    """
+    Awaitable, rate-budgeted front end for the blocking PolymarketClient calls made by strategies.
+
+    Signing, HTTP round trips and web3 reads run on a thread pool, so a strategy
+    waiting on the exchange no longer freezes the event loop and every other
+    market with it.
+
+    Before running, every call takes a token from its endpoint's bucket and then
+    a worker slot. Both are handed out by lane, so a stop-loss sell or cancel
+    queued behind a burst of routine requotes goes first.
+
+    A call that times out raises asyncio.TimeoutError in the caller, but the
+    request itself cannot be withdrawn and may still reach the exchange; the
+    periodic order and position refresh reconciles its outcome.
+
+    Clients that are not blocking (the replay's SimulatedClient sets
+    blocking = False) are called inline on the loop without rate budgets.
+
+    Args:
+        max_workers (int): Exchange calls running at once
+        timeouts (dict, optional): Per-method timeouts overriding DEFAULT_TIMEOUTS
+        limits (dict, optional): Per-endpoint (rate, burst) overriding DEFAULT_LIMITS
+    """
+
+    def __init__(self, max_workers=8, timeouts=None, limits=None):
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="order-gateway")
+        self._slots = PrioritySlots(max_workers)
+        self._buckets = {}
+
+        self.in_flight = 0
+        self.stats = defaultdict(lambda: {'calls': 0, 'errors': 0, 'timeouts': 0, 'seconds': 0.0})
+        self.lane_stats = {lane: {'calls': 0, 'waiting': 0, 'wait': 0.0, 'max_wait': 0.0} for lane in LANES}
+
+    def _bucket(self, method):
+        endpoint = METHOD_ENDPOINTS.get(method, 'default')
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            bucket = self._buckets[endpoint] = TokenBucket(*self.limits.get(endpoint, self.limits['default']))
+        return bucket
+
+    async def _admit(self, method, lane):
+        priority = LANES.index(lane)
+        stats = self.lane_stats[lane]
+        stats['calls'] += 1
+        stats['waiting'] += 1
+
+        queued = time.perf_counter()
+        try:
+            await self._bucket(method).acquire(priority)
+            await self._slots.acquire(priority)
+        finally:
+            stats['waiting'] -= 1
+
+        wait = time.perf_counter() - queued
+        stats['wait'] += wait
+        if wait > stats['max_wait']:
+            stats['max_wait'] = wait
+
+    async def call(self, method, *args, lane=None, timeout=None, **kwargs):
+        """
+        Run client.<method>(*args, **kwargs) off the event loop and return its result.
+
+        Args:
+            method (str): PolymarketClient method name
+            lane (str, optional): One of LANES, defaults to the method's lane in METHOD_LANES
+            timeout (float, optional): Overrides the method's timeout
+
+        Raises:
+            asyncio.TimeoutError: If no result arrived within the timeout
+        """
+        client = global_state.client
+        func = functools.partial(getattr(client, method), *args, **kwargs)
+        stats = self.stats[method]
+        stats['calls'] += 1
+
+        if not getattr(client, 'blocking', True):
+            return func()
+
+        await self._admit(method, lane or METHOD_LANES.get(method, 'background'))
+
+        start = time.perf_counter()
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        # Run in the caller's context so latency spans on the worker find its trace
+        future = self._executor.submit(contextvars.copy_context().run, func)
+        # The slot is held until the worker thread is done, not just until the caller
+        # stops waiting: a timed out call still occupies its thread
+        future.add_done_callback(lambda _: _call_soon(loop, self._finished))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeouts.get(method, 10))
+        except asyncio.TimeoutError:
+            stats['timeouts'] += 1
+            log.warning("Order gateway call timed out", method=method)
+            raise
+        except Exception:
+            stats['errors'] += 1
+            raise
+        finally:
+            stats['seconds'] += time.perf_counter() - start
+
+    def _finished(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def create_order(self, token, side, price, size, neg_risk=False, lane=None):
+        return await self.call('create_order', token, side, price, size, neg_risk, lane=lane)
+
+    async def cancel_all_asset(self, asset_id, lane=None):
+        return await self.call('cancel_all_asset', asset_id, lane=lane)
+
+    async def cancel_all_market(self, market_id, lane=None):
+        return await self.call('cancel_all_market', market_id, lane=lane)
+
+    async def cancel_orders(self, order_ids, lane=None):
+        return await self.call('cancel_orders', list(order_ids), lane=lane)
+
+    async def submit(self, batch, lane=None):
+        """
+        Send an OrderBatch as one replace_orders call: cancels first, then every new
+        order in a single batch post.
+
+        Returns:
+            list: Responses of the posted orders
+        """
+        if not batch:
+            return []
+
+        cancel_assets, cancel_market = batch.cancel_assets, None
+        if batch.tokens and batch.tokens.issubset(cancel_assets):
+            cancel_assets, cancel_market = [], batch.market
+
+        return await self.call('replace_orders', orders=batch.orders, cancel_ids=batch.cancel_ids,
+                               cancel_assets=cancel_assets, cancel_market=cancel_market, lane=lane)
+
+    async def get_position(self, token):
+        return await self.call('get_position', token)
+
+    async def merge_positions(self, amount_to_merge, condition_id, is_neg_risk_market):
+        return await self.call('merge_positions', amount_to_merge, condition_id, is_neg_risk_market)
+
+    def report(self):
+        """Return call counts, failures and latency per client method, and queue waits per lane."""
+        report = {'in_flight': self.in_flight}
+        for method, stats in self.stats.items():
+            report[method] = {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'timeouts': stats['timeouts'],
+                'avg_ms': round(stats['seconds'] / stats['calls'] * 1000, 1) if stats['calls'] else 0.0,
+            }
+
+        report['lanes'] = {
+            lane: {
+                'calls': stats['calls'],
+                'waiting': stats['waiting'],
+                'avg_wait_ms': round(stats['wait'] / stats['calls'] * 1000, 2) if stats['calls'] else 0.0,
+                'max_wait_ms': round(stats['max_wait'] * 1000, 2),
+            }
+            for lane, stats in self.lane_stats.items()
+        }
+        return report
+
+
+def _call_soon(loop, callback):
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        pass  # The loop closed at shutdown while a call was still running
+
+
+order_gateway = OrderGateway()
@@ -0,0 +1,236 @@
+import math
+
+import numpy as np
+
+# Polymarket prices live on a 0.01 or 0.001 grid inside [0, 1]. Storing every
+# level at 0.001 resolution lets both tick sizes share one integer index space.
+PRICE_SCALE = 1000
+NUM_TICKS = PRICE_SCALE + 1
+
+
+def price_to_tick(price):
+    """Convert a price (float or numeric string) to its integer tick index."""
+    return int(round(float(price) * PRICE_SCALE))
+
+
+def tick_to_price(tick):
+    """Convert a tick index back to a float price."""
+    return tick / PRICE_SCALE
+
+
+class TopOfBook:
+    """
+    Aggregates for one (min_size, band) pair, kept current by OrderBook.refresh().
+
+    Mirrors the values get_best_bid_ask_deets used to rebuild from a full scan:
+    the top level, the first level larger than min_size and the level after it
+    on each side, plus the resting size between the sized best price and
+    mid * (1 +/- band).
+    """
+
+    __slots__ = (
+        'min_size', 'band',
+        'best_bid', 'best_bid_size', 'second_best_bid', 'second_best_bid_size', 'top_bid',
+        'best_ask', 'best_ask_size', 'second_best_ask', 'second_best_ask_size', 'top_ask',
+        'bid_sum_within_n_percent', 'ask_sum_within_n_percent'
+    )
+
+    def __init__(self, min_size, band):
+        self.min_size = min_size
+        self.band = band
+
+    def update(self, book):
+        (self.best_bid, self.best_bid_size, self.second_best_bid,
+         self.second_best_bid_size, self.top_bid) = book.find_best_with_size('bids', self.min_size)
+        (self.best_ask, self.best_ask_size, self.second_best_ask,
+         self.second_best_ask_size, self.top_ask) = book.find_best_with_size('asks', self.min_size)
+
+        if self.best_bid is not None and self.best_ask is not None:
+            mid_price = (self.best_bid + self.best_ask) / 2
+            self.bid_sum_within_n_percent = book.depth_between('bids', self.best_bid, mid_price * (1 + self.band))
+            self.ask_sum_within_n_percent = book.depth_between('asks', mid_price * (1 - self.band), self.best_ask)
+        else:
+            self.bid_sum_within_n_percent = 0
+            self.ask_sum_within_n_percent = 0
+
+
+class OrderBook:
+    """
+    Order book for a single token backed by preallocated tick-indexed arrays.
+
+    Each side is a float64 array of NUM_TICKS sizes where the index is the price
+    in ticks, so inserting, updating or deleting a level is a single array write.
+    The best bid and ask ticks are tracked on every write so top-of-book lookups
+    never have to walk the levels. Sized best prices and depth bands requested
+    through top_of_book() are cached as TopOfBook entries and recomputed by
+    refresh() once per applied frame, so strategy reads are O(1).
+
+    Attributes:
+        asset_id (str): Token ID the book was built for
+        bid_sizes (np.ndarray): Resting bid size per tick
+        ask_sizes (np.ndarray): Resting ask size per tick
+        best_bid_tick (int): Highest non-empty bid tick, -1 if there are no bids
+        best_ask_tick (int): Lowest non-empty ask tick, NUM_TICKS if there are no asks
+        aggregates (dict): TopOfBook entries keyed by (min_size, band)
+        version (int): Incremented on every write, so copies can tell the book changed
+    """
+
+    __slots__ = ('asset_id', 'bid_sizes', 'ask_sizes', 'best_bid_tick', 'best_ask_tick', 'aggregates', 'version')
+
+    def __init__(self, asset_id=None):
+        self.asset_id = asset_id
+        self.bid_sizes = np.zeros(NUM_TICKS, dtype=np.float64)
+        self.ask_sizes = np.zeros(NUM_TICKS, dtype=np.float64)
+        self.best_bid_tick = -1
+        self.best_ask_tick = NUM_TICKS
+        self.aggregates = {}
+        self.version = 0
+
+    def reset(self, asset_id, bids, asks):
+        """
+        Replace the whole book with a snapshot, reusing the existing arrays.
+
+        Args:
+            asset_id (str): Token ID of the snapshot
+            bids (iterable): (tick, size) pairs for the bid side
+            asks (iterable): (tick, size) pairs for the ask side
+        """
+        self.asset_id = asset_id
+        self.version += 1
+        self.bid_sizes.fill(0.0)
+        self.ask_sizes.fill(0.0)
+
+        for tick, size in bids:
+            self.bid_sizes[tick] = size
+        for tick, size in asks:
+            self.ask_sizes[tick] = size
+
+        self._rescan_best()
+        self.refresh()
+
+    def _rescan_best(self):
+        bid_ticks = np.flatnonzero(self.bid_sizes)
+        ask_ticks = np.flatnonzero(self.ask_sizes)
+        self.best_bid_tick = int(bid_ticks[-1]) if len(bid_ticks) else -1
+        self.best_ask_tick = int(ask_ticks[0]) if len(ask_ticks) else NUM_TICKS
+
+    def set_level(self, side, tick, size):
+        """
+        Set the size resting at a tick. A size of 0 removes the level.
+
+        Args:
+            side (str): 'bids' or 'asks'
+            tick (int): Price in ticks
+            size (float): New total size at that price
+        """
+        self.version += 1
+        if side == 'bids':
+            self.bid_sizes[tick] = size
+            if size > 0:
+                if tick > self.best_bid_tick:
+                    self.best_bid_tick = tick
+            elif tick == self.best_bid_tick:
+                below = np.flatnonzero(self.bid_sizes[:tick])
+                self.best_bid_tick = int(below[-1]) if len(below) else -1
+        else:
+            self.ask_sizes[tick] = size
+            if size > 0:
+                if tick < self.best_ask_tick:
+                    self.best_ask_tick = tick
+            elif tick == self.best_ask_tick:
+                above = np.flatnonzero(self.ask_sizes[tick + 1:])
+                self.best_ask_tick = tick + 1 + int(above[0]) if len(above) else NUM_TICKS
+
+    def refresh(self):
+        """Recompute every tracked TopOfBook. Call once after applying a frame of level updates."""
+        for aggregate in self.aggregates.values():
+            aggregate.update(self)
+
+    def top_of_book(self, min_size, band):
+        """
+        Return the cached TopOfBook for (min_size, band), starting to track it on first use.
+
+        Args:
+            min_size (float): Size a level has to exceed to count as the best price
+            band (float): Fraction around the mid price used for the depth sums
+
+        Returns:
+            TopOfBook: Aggregates as of the last refresh()
+        """
+        key = (min_size, band)
+        aggregate = self.aggregates.get(key)
+        if aggregate is None:
+            aggregate = TopOfBook(min_size, band)
+            aggregate.update(self)
+            self.aggregates[key] = aggregate
+        return aggregate
+
+    @property
+    def best_bid(self):
+        return tick_to_price(self.best_bid_tick) if self.best_bid_tick >= 0 else None
+
+    @property
+    def best_ask(self):
+        return tick_to_price(self.best_ask_tick) if self.best_ask_tick < NUM_TICKS else None
+
+    def sizes(self, side):
+        """Return a read-only, zero-copy view of the size array for a side."""
+        view = (self.bid_sizes if side == 'bids' else self.ask_sizes).view()
+        view.flags.writeable = False
+        return view
+
+    def level_ticks(self, side):
+        """Return non-empty ticks for a side ordered from the best price outwards."""
+        if side == 'bids':
+            return np.flatnonzero(self.bid_sizes[:self.best_bid_tick + 1])[::-1]
+        return np.flatnonzero(self.ask_sizes[self.best_ask_tick:]) + self.best_ask_tick
+
+    def levels(self, side):
+        """Return (price, size) pairs for a side ordered from the best price outwards."""
+        sizes = self.bid_sizes if side == 'bids' else self.ask_sizes
+        return [(tick_to_price(tick), float(sizes[tick])) for tick in self.level_ticks(side)]
+
+    def find_best_with_size(self, side, min_size):
+        """
+        Find the first level whose size exceeds min_size, plus the level after it.
+
+        Args:
+            side (str): 'bids' or 'asks'
+            min_size (float): Size the level has to exceed
+
+        Returns:
+            tuple: (best_price, best_size, second_best_price, second_best_size, top_price)
+                   with None for anything that does not exist
+        """
+        sizes = self.bid_sizes if side == 'bids' else self.ask_sizes
+        ticks = self.level_ticks(side)
+
+        if len(ticks) == 0:
+            return None, None, None, None, None
+
+        top_price = tick_to_price(int(ticks[0]))
+        large = np.flatnonzero(sizes[ticks] > min_size)
+
+        if len(large) == 0:
+            return None, None, None, None, top_price
+
+        pos = int(large[0])
+        best_tick = int(ticks[pos])
+        best_price, best_size = tick_to_price(best_tick), float(sizes[best_tick])
+
+        second_best_price, second_best_size = None, None
+        if pos + 1 < len(ticks):
+            second_tick = int(ticks[pos + 1])
+            second_best_price, second_best_size = tick_to_price(second_tick), float(sizes[second_tick])
+
+        return best_price, best_size, second_best_price, second_best_size, top_price
+
+    def depth_between(self, side, low_price, high_price):
+        """Total size resting on a side at prices within [low_price, high_price]."""
+        sizes = self.bid_sizes if side == 'bids' else self.ask_sizes
+        low = max(int(math.ceil(low_price * PRICE_SCALE - 1e-6)), 0)
+        high = min(int(math.floor(high_price * PRICE_SCALE + 1e-6)), NUM_TICKS - 1)
+
+        if high < low:
+            return 0.0
+        return float(sizes[low:high + 1].sum())
@@ -4,7 +4,9 @@ import os                           # Operating system interface
 # Polymarket API client libraries
 from py_clob_client.client import ClobClient
 from py_clob_client.clob_types import OrderArgs, BalanceAllowanceParams, AssetType, PartialCreateOrderOptions
+from py_clob_client.clob_types import OrderType, PostOrdersArgs
 from py_clob_client.constants import POLYGON
+from py_clob_client.utilities import price_valid
 
 # Web3 libraries for blockchain interaction
 from web3 import Web3
@@ -20,10 +22,16 @@ from py_clob_client.clob_types import OpenOrderParams
 
 # Smart contract ABIs
 from poly_data.abis import NegRiskAdapterABI, ConditionalTokenABI, erc20_abi
+from poly_data.latency import latency_tracer
+from poly_data.order_cache import PresignedOrderCache
+from poly_data.signing_service import SigningService
 
 # Load environment variables
 load_dotenv()
 
+# Maximum number of orders the CLOB accepts in one batch post
+MAX_BATCH_ORDERS = 15
+
 
 class PolymarketClient:
     """
@@ -99,10 +107,48 @@ class PolymarketClient:
 
         self.web3 = web3
 
+        # Orders signed ahead of time (PresignedOrderCache), None until enable_order_cache
+        self.order_cache = None
+
+        # Worker processes that sign orders (SigningService), None until enable_signing_service
+        self.signing_service = None
+
+    def enable_signing_service(self, workers=None):
+        """
+        Sign orders on a pool of worker processes instead of on the calling thread.
+        
+        Call before starting other threads; the workers are forked from this process.
+        
+        Args:
+            workers (int, optional): Worker processes, defaults to the CPU count
+        """
+        signer, builder = self.client.signer, self.client.builder
+        self.signing_service = SigningService(
+            signer.private_key, builder.funder, signer.get_chain_id(), builder.sig_type, workers
+        )
+        self.signing_service.warm_up()
+
+    def enable_order_cache(self, levels=2, max_orders=2000, max_age=600):
+        """
+        Sign orders in the background at the prices around each quote, see PresignedOrderCache.
+        
+        Needs the signing service: signed on this process, the orders would hold
+        the GIL the trading loop runs under.
+        
+        Args:
+            levels (int): Ticks above and below the quote to sign
+            max_orders (int): Maximum number of signed orders held
+            max_age (float): Seconds after which a signature is no longer used
+        """
+        if self.signing_service is None:
+            raise Exception("The order cache signs on the signing service; call enable_signing_service first")
+        self.order_cache = PresignedOrderCache(self._build_orders, levels, max_orders, max_age)
     
-    def create_order(self, marketId, action, price, size, neg_risk=False):
+    def sign_order(self, marketId, action, price, size, neg_risk=False):
         """
-        Create and submit a new order to the Polymarket order book.
+        Build and sign an order without submitting it.
+        
+        A signature prepared by the order cache is used if one matches exactly.
         
         Args:
             marketId (str): ID of the market token to trade
@@ -112,8 +158,64 @@ class PolymarketClient:
             neg_risk (bool, optional): Whether this is a negative risk market. Defaults to False.
             
         Returns:
-            dict: Response from the API containing order details, or empty dict on error
+            SignedOrder: Order ready for post_order or post_orders
         """
+        if self.order_cache is not None:
+            signed_order = self.order_cache.take(marketId, action, price, size, neg_risk)
+            if signed_order is not None:
+                return signed_order
+
+        return self._build_order(marketId, action, price, size, neg_risk)
+
+    def sign_orders(self, orders):
+        """
+        Sign several orders, in parallel when the signing service is enabled.
+        
+        Ready signatures from the order cache are used first.
+        
+        Args:
+            orders (list): (marketId, action, price, size, neg_risk) tuples
+            
+        Returns:
+            list: SignedOrder per order, in order
+        """
+        signed = [None] * len(orders)
+        if self.order_cache is not None:
+            signed = [self.order_cache.take(*order) for order in orders]
+
+        missing = [i for i, order in enumerate(signed) if order is None]
+        built = self._build_orders([orders[i] for i in missing])
+
+        for i, order in zip(missing, built):
+            signed[i] = order
+        return signed
+
+    def _build_orders(self, orders):
+        """Sign (marketId, action, price, size, neg_risk) tuples, in one batch on the signing service if enabled."""
+        if self.signing_service is not None and len(orders) > 1:
+            return self.signing_service.sign([self._order_job(*order) for order in orders])
+        return [self._build_order(*order) for order in orders]
+
+    def _order_job(self, marketId, action, price, size, neg_risk=False):
+        """Resolve what ClobClient.create_order looks up, giving a job for the signing service."""
+        token_id = str(marketId)
+        tick_size = self.client.get_tick_size(token_id)
+        if not price_valid(price, tick_size):
+            raise Exception(f"price ({price}), min: {tick_size} - max: {1 - float(tick_size)}")
+
+        order_args = OrderArgs(
+            token_id=token_id,
+            price=price,
+            size=size,
+            side=action,
+            fee_rate_bps=self.client.get_fee_rate_bps(token_id)
+        )
+        return order_args, tick_size, neg_risk or self.client.get_neg_risk(token_id)
+
+    def _build_order(self, marketId, action, price, size, neg_risk=False):
+        if self.signing_service is not None:
+            return self.signing_service.sign([self._order_job(marketId, action, price, size, neg_risk)])[0]
+
         # Create order parameters
         order_args = OrderArgs(
             token_id=str(marketId),
@@ -122,17 +224,32 @@ class PolymarketClient:
             side=action
         )
 
-        signed_order = None
-
         # Handle regular vs negative risk markets differently
         if neg_risk == False:
-            signed_order = self.client.create_order(order_args)
-        else:
-            signed_order = self.client.create_order(order_args, options=PartialCreateOrderOptions(neg_risk=True))
+            return self.client.create_order(order_args)
+        return self.client.create_order(order_args, options=PartialCreateOrderOptions(neg_risk=True))
+
+    def create_order(self, marketId, action, price, size, neg_risk=False):
+        """
+        Create and submit a new order to the Polymarket order book.
+        
+        Args:
+            marketId (str): ID of the market token to trade
+            action (str): "BUY" or "SELL"
+            price (float): Order price (0-1 range for prediction markets)
+            size (float): Order size in USDC
+            neg_risk (bool, optional): Whether this is a negative risk market. Defaults to False.
+            
+        Returns:
+            dict: Response from the API containing order details, or empty dict on error
+        """
+        with latency_tracer.span('sign'):
+            signed_order = self.sign_order(marketId, action, price, size, neg_risk)
             
         try:
             # Submit the signed order to the API
-            resp = self.client.post_order(signed_order)
+            with latency_tracer.span('post'):
+                resp = self.client.post_order(signed_order)
             return resp
         except Exception as ex:
             print(ex)
@@ -151,6 +268,21 @@ class PolymarketClient:
         orderBook = self.client.get_order_book(market)
         return pd.DataFrame(orderBook.bids).astype(float), pd.DataFrame(orderBook.asks).astype(float)
 
+    def get_order_book_snapshot(self, market):
+        """
+        Get the current order book for a specific market with the exchange's timestamp of it.
+        
+        Args:
+            market (str): Market ID to query
+            
+        Returns:
+            tuple: (bids_df, asks_df, timestamp) - timestamp in milliseconds, 0 if the
+                   response has none
+        """
+        orderBook = self.client.get_order_book(market)
+        return (pd.DataFrame(orderBook.bids).astype(float), pd.DataFrame(orderBook.asks).astype(float),
+                int(getattr(orderBook, 'timestamp', None) or 0))
+
 
     def get_usdc_balance(self):
         """
@@ -280,6 +412,81 @@ class PolymarketClient:
         """
         self.client.cancel_market_orders(market=marketId)
 
+    def post_orders(self, orders):
+        """
+        Sign several orders and submit them in batched requests.
+        
+        Args:
+            orders (list): (marketId, action, price, size, neg_risk) tuples
+            
+        Returns:
+            list: One API response per order, in order. Orders in a batch that failed
+                get an empty dict.
+        """
+        return self._post_signed(self.sign_orders(orders))
+
+    def _post_signed(self, signed_orders):
+        responses = []
+        for start in range(0, len(signed_orders), MAX_BATCH_ORDERS):
+            batch = signed_orders[start:start + MAX_BATCH_ORDERS]
+            try:
+                responses.extend(self.client.post_orders(
+                    [PostOrdersArgs(order=order, orderType=OrderType.GTC) for order in batch]
+                ))
+            except Exception as ex:
+                print(ex)
+                responses.extend({} for _ in batch)
+        return responses
+
+    def cancel_orders(self, order_ids):
+        """
+        Cancel a list of orders by ID in one request.
+        
+        Args:
+            order_ids (list): Order IDs to cancel
+            
+        Returns:
+            dict: API response with canceled and not_canceled orders
+        """
+        if not order_ids:
+            return {}
+        return self.client.cancel_orders(list(order_ids))
+
+    def replace_orders(self, orders=(), cancel_ids=(), cancel_assets=(), cancel_market=None):
+        """
+        Cancel and post in as few round trips as possible.
+        
+        New orders are signed first so the book is left without our quotes only for
+        the cancel and post requests themselves. Cancels always complete before the
+        new orders are posted.
+        
+        Args:
+            orders (list): (marketId, action, price, size, neg_risk) tuples to post
+            cancel_ids (list): Order IDs to cancel
+            cancel_assets (list): Asset token IDs whose orders are all cancelled
+            cancel_market (str, optional): Market whose orders are all cancelled,
+                covering both of its tokens in a single request
+            
+        Returns:
+            list: Responses of the posted orders, see post_orders
+        """
+        with latency_tracer.span('sign'):
+            signed = self.sign_orders(orders)
+
+        if cancel_market is not None or cancel_assets or cancel_ids:
+            with latency_tracer.span('cancel'):
+                if cancel_market is not None:
+                    self.cancel_all_market(cancel_market)
+                for asset_id in cancel_assets:
+                    self.cancel_all_asset(asset_id)
+                if cancel_ids:
+                    self.cancel_orders(cancel_ids)
+
+        if not signed:
+            return []
+        with latency_tracer.span('post'):
+            return self._post_signed(signed)
+
     
     def merge_positions(self, amount_to_merge, condition_id, is_neg_risk_market):
         """
@@ -0,0 +1,436 @@
+import asyncio
+import itertools
+import os
+import random
+import time
+import traceback
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+import poly_data.clock as clock
+import poly_data.global_state as global_state
+from poly_data.book_integrity import book_integrity
+from poly_data.data_processing import process_data, process_user_data
+from poly_data.data_utils import load_markets
+import poly_data.decoding as decoding
+from poly_data.decoding import decode_market_frame, decode_user_frame
+from poly_data.journal import JournalReader
+from poly_data.latency import latency_tracer
+from poly_data.orderbook import OrderBook, PRICE_SCALE, price_to_tick
+from strategies.scheduler import trigger_scheduler
+
+
+class FillModel:
+    """
+    Decides how much of a resting simulated order the replayed book fills.
+
+    An order is filled when the opposite side of the book trades through its
+    price, or reaches it when on_touch is set. Each qualifying book update fills
+    fill_ratio of the remaining size, so values below 1 approximate queue position.
+
+    Args:
+        on_touch (bool): Also fill when the opposite best price equals the order price
+        fill_ratio (float): Fraction of the remaining size filled per qualifying update
+    """
+
+    def __init__(self, on_touch=False, fill_ratio=1.0):
+        self.on_touch = on_touch
+        self.fill_ratio = fill_ratio
+
+    def matched_size(self, side, price_tick, remaining, best_bid_tick, best_ask_tick):
+        if side == 'BUY':
+            if best_ask_tick is None:
+                return 0
+            crossed = best_ask_tick < price_tick or (self.on_touch and best_ask_tick == price_tick)
+        else:
+            if best_bid_tick is None:
+                return 0
+            crossed = best_bid_tick > price_tick or (self.on_touch and best_bid_tick == price_tick)
+
+        if not crossed:
+            return 0
+
+        size = remaining * self.fill_ratio
+        # Avoid leaving dust that would keep an order alive forever
+        return remaining if remaining - size < 1 else size
+
+
+class LatencyModel:
+    """
+    Delays between a client call and the exchange acting on it, in simulated seconds.
+
+    Args:
+        order_seconds (float): Time for a posted order to rest on the book
+        cancel_seconds (float): Time for a cancel to take effect
+        jitter_seconds (float): Uniform random extra delay added to both
+        seed (int, optional): Seed for the jitter
+    """
+
+    def __init__(self, order_seconds=0.05, cancel_seconds=0.05, jitter_seconds=0.0, seed=None):
+        self.order_seconds = order_seconds
+        self.cancel_seconds = cancel_seconds
+        self.jitter_seconds = jitter_seconds
+        self._random = random.Random(seed)
+
+    def _jitter(self):
+        return self._random.uniform(0, self.jitter_seconds) if self.jitter_seconds else 0.0
+
+    def order_delay(self):
+        return self.order_seconds + self._jitter()
+
+    def cancel_delay(self):
+        return self.cancel_seconds + self._jitter()
+
+
+class SimulatedClient:
+    """
+    Stand-in for PolymarketClient that matches orders against the replayed books.
+
+    Implements the client methods the strategy and update loops call. Posted
+    orders rest after the latency model's delay and fill according to the fill
+    model. Fills and order changes come back as user channel events through
+    process_user_data, just like the live user websocket.
+
+    Args:
+        sim_clock (SimulatedClock): Clock the exchange events are scheduled on
+        fill_model (FillModel): Fill rules
+        latency_model (LatencyModel): Acknowledgement and cancel delays
+        confirm_seconds (float): Delay between a MATCHED and CONFIRMED trade event
+    """
+
+    # Calls return immediately, so the order gateway runs them inline on the replay loop
+    blocking = False
+
+    def __init__(self, sim_clock, fill_model, latency_model, confirm_seconds=2.0):
+        self.clock = sim_clock
+        self.fill_model = fill_model
+        self.latency_model = latency_model
+        self.confirm_seconds = confirm_seconds
+
+        self.browser_wallet = '0x000000000000000000000000000000000000dEaD'
+        self.orders = {}
+        self.positions = defaultdict(float)
+        self.avg_prices = defaultdict(float)
+        self.cash = 0.0
+        self.stats = Counter()
+        self._ids = itertools.count(1)
+
+    # ---- market lookup ----
+
+    @staticmethod
+    def _market_of(token):
+        df = global_state.df
+        match = df[(df['token1'].astype(str) == token) | (df['token2'].astype(str) == token)]
+        return str(match.iloc[0]['condition_id']) if len(match) else None
+
+    def _token_book_ticks(self, market, token):
+        """Best bid and ask ticks for token, derived from the market's book."""
+        book = global_state.all_data.get(market)
+        if book is None:
+            return None, None
+
+        best_bid = book.best_bid_tick if book.best_bid_tick >= 0 else None
+        best_ask = book.best_ask_tick if book.best_ask_tick <= PRICE_SCALE else None
+        if token == str(book.asset_id):
+            return best_bid, best_ask
+
+        # The complement token's book is the mirror image of the stored one
+        return (PRICE_SCALE - best_ask if best_ask is not None else None,
+                PRICE_SCALE - best_bid if best_bid is not None else None)
+
+    # ---- PolymarketClient interface ----
+
+    def create_order(self, marketId, action, price, size, neg_risk=False):
+        token = str(marketId)
+        order_id = f"sim-{next(self._ids)}"
+        self.orders[order_id] = {
+            'id': order_id, 'token': token, 'market': self._market_of(token), 'side': action,
+            'price': float(price), 'original_size': float(size), 'size_matched': 0.0, 'live': False,
+        }
+        self.stats['orders_posted'] += 1
+        self.clock.call_at(self.clock.now + self.latency_model.order_delay(), self._activate, order_id)
+        return {'orderID': order_id, 'success': True, 'status': 'live'}
+
+    def cancel_all_asset(self, asset_id):
+        self._cancel_where(lambda order: order['token'] == str(asset_id))
+
+    def cancel_all_market(self, marketId):
+        self._cancel_where(lambda order: order['market'] == str(marketId))
+
+    def post_orders(self, orders):
+        return [self.create_order(*order) for order in orders]
+
+    def cancel_orders(self, order_ids):
+        wanted = {str(order_id) for order_id in order_ids}
+        self._cancel_where(lambda order: order['id'] in wanted)
+
+    def replace_orders(self, orders=(), cancel_ids=(), cancel_assets=(), cancel_market=None):
+        if cancel_market is not None:
+            self.cancel_all_market(cancel_market)
+        for asset_id in cancel_assets:
+            self.cancel_all_asset(asset_id)
+        self.cancel_orders(cancel_ids)
+        return self.post_orders(orders)
+
+    def get_position(self, tokenId):
+        shares = self.positions[str(tokenId)]
+        raw_position = int(shares * 1e6)
+        return raw_position, shares if shares >= 1 else 0
+
+    def merge_positions(self, amount_to_merge, condition_id, is_neg_risk_market):
+        row = global_state.df[global_state.df['condition_id'] == condition_id].iloc[0]
+        shares = amount_to_merge / 1e6
+
+        for token in (str(row['token1']), str(row['token2'])):
+            self.positions[token] -= shares
+        self.cash += shares
+        self.stats['merges'] += 1
+        return 'simulated-merge'
+
+    def get_all_positions(self):
+        return pd.DataFrame(
+            [{'asset': token, 'size': size, 'avgPrice': self.avg_prices[token]}
+             for token, size in self.positions.items() if size != 0],
+            columns=['asset', 'size', 'avgPrice']
+        )
+
+    def get_all_orders(self):
+        return pd.DataFrame(
+            [{'id': order['id'], 'asset_id': order['token'], 'side': order['side'], 'price': order['price'],
+              'original_size': order['original_size'], 'size_matched': order['size_matched']}
+             for order in self.orders.values() if order['live']],
+            columns=['id', 'asset_id', 'side', 'price', 'original_size', 'size_matched']
+        )
+
+    # ---- simulated exchange ----
+
+    def _cancel_where(self, predicate):
+        for order_id, order in list(self.orders.items()):
+            if predicate(order):
+                self.stats['cancels'] += 1
+                self.clock.call_at(self.clock.now + self.latency_model.cancel_delay(), self._cancel, order_id)
+
+    def _cancel(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is not None and order['live']:
+            # Report the cancelled order with nothing left resting
+            self._emit_order(order, 'CANCELLATION', size_matched=order['original_size'])
+
+    def _activate(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None:
+            return  # Cancelled before it reached the book
+        order['live'] = True
+        self._emit_order(order, 'PLACEMENT')
+        self.check_fills(order['market'])
+
+    def check_fills(self, market):
+        """Fill resting orders in market that the current book trades through."""
+        for order in list(self.orders.values()):
+            if not order['live'] or order['market'] != market:
+                continue
+
+            best_bid, best_ask = self._token_book_ticks(market, order['token'])
+            remaining = order['original_size'] - order['size_matched']
+            size = self.fill_model.matched_size(order['side'], price_to_tick(order['price']),
+                                                remaining, best_bid, best_ask)
+            if size > 0:
+                self._fill(order, size)
+
+    def _fill(self, order, size):
+        token, price = order['token'], order['price']
+        order['size_matched'] += size
+
+        if order['side'] == 'BUY':
+            held = self.positions[token]
+            self.avg_prices[token] = (self.avg_prices[token] * held + price * size) / (held + size)
+            self.positions[token] += size
+            self.cash -= price * size
+        else:
+            self.positions[token] -= size
+            self.cash += price * size
+
+        self.stats['fills'] += 1
+        self.stats['filled_volume'] += size * price
+
+        trade_id = f"sim-trade-{next(self._ids)}"
+        self._emit_trade(order, trade_id, size, 'MATCHED')
+        self.clock.call_at(self.clock.now + self.confirm_seconds, self._emit_trade, order, trade_id, size, 'CONFIRMED')
+
+        if order['original_size'] - order['size_matched'] <= 0:
+            self.orders.pop(order['id'], None)
+        self._emit_order(order, 'UPDATE')
+
+    def _emit_trade(self, order, trade_id, size, status):
+        # We are always the maker; the taker traded the same outcome on the other side
+        taker_side = 'SELL' if order['side'] == 'BUY' else 'BUY'
+        process_user_data([{
+            'event_type': 'trade', 'id': trade_id, 'market': order['market'], 'asset_id': order['token'],
+            'side': taker_side, 'outcome': 'SIM', 'status': status, 'size': size, 'price': order['price'],
+            'maker_orders': [{'maker_address': self.browser_wallet, 'matched_amount': size,
+                              'price': order['price'], 'outcome': 'SIM'}],
+        }])
+
+    def _emit_order(self, order, order_type, size_matched=None):
+        process_user_data([{
+            'event_type': 'order', 'id': order['id'], 'market': order['market'], 'asset_id': order['token'],
+            'side': order['side'], 'type': order_type, 'status': 'LIVE', 'price': order['price'],
+            'original_size': order['original_size'],
+            'size_matched': order['size_matched'] if size_matched is None else size_matched,
+        }])
+
+
+class ReplayEngine:
+    """
+    Replays a FeedRecorder journal through the live data processing and strategies.
+
+    Market frames go through process_data into the real strategies, with a
+    SimulatedClock in place of wall time so strategy sleeps and exchange latency
+    cost no real time. With a fill model, orders are matched by a SimulatedClient
+    and recorded user frames are skipped. Without one, the recorded user frames
+    are replayed as-is to reproduce a live session.
+
+    Replay mutates poly_data.global_state, so run it in its own process.
+
+    Args:
+        journal_dir (str): Directory written by FeedRecorder
+        markets_df (DataFrame): Selected Markets rows, as returned by get_sheet_df
+        params (dict): Hyperparameters by param_type
+        fill_model (FillModel, optional): Fill rules, None to replay recorded user frames
+        latency_model (LatencyModel, optional): Exchange delays
+        output_dir (str): Where risk-off files written by the strategy go
+        settle_yields (int): Event loop iterations given to woken tasks after each event
+    """
+
+    def __init__(self, journal_dir, markets_df, params, fill_model=None, latency_model=None,
+                 output_dir='replay_output', settle_yields=10):
+        self.reader = JournalReader(journal_dir)
+        self.markets_df = markets_df
+        self.params = params
+        self.fill_model = fill_model
+        self.latency_model = latency_model or LatencyModel()
+        self.output_dir = output_dir
+        self.settle_yields = settle_yields
+
+        self.clock = None
+        self.client = None
+        self.stats = Counter()
+
+    async def _settle(self):
+        # Let every task woken so far run up to its next simulated sleep
+        for _ in range(self.settle_yields):
+            await asyncio.sleep(0)
+
+    async def _advance(self, until):
+        while True:
+            due = self.clock.pop_due(until)
+            if due is None:
+                break
+            callback, args = due
+            callback(*args)
+            await self._settle()
+
+        self.clock.now = max(self.clock.now, until)
+
+    @staticmethod
+    def _load_keyframe(books):
+        for market, snapshot in books.items():
+            book = global_state.all_data.get(market) or OrderBook()
+            book.reset(snapshot['asset_id'], snapshot['bids'], snapshot['asks'])
+            global_state.all_data[market] = book
+
+    def _setup(self, start):
+        self.clock = clock.SimulatedClock(start)
+        clock.set_clock(self.clock)
+
+        self.client = SimulatedClient(self.clock, self.fill_model or FillModel(), self.latency_model)
+        global_state.client = self.client
+        global_state.risk_dir = os.path.join(self.output_dir, 'positions')
+        global_state.positions, global_state.orders, global_state.all_data = {}, {}, {}
+
+        # The journal is the only source of book data, so integrity problems are counted but not resynced
+        book_integrity.resync = False
+        book_integrity.markets = {}
+
+        load_markets(self.markets_df.copy(), self.params)
+
+    async def run(self, start_ts=None, end_ts=None, drain_seconds=10):
+        """
+        Replay the journal between two receive times.
+
+        Args:
+            start_ts (int, optional): Start in ns; books are rebuilt from the keyframe before it
+            end_ts (int, optional): End in ns
+            drain_seconds (float): Simulated time to keep running after the last frame
+
+        Returns:
+            dict: Summary of the run, see summary()
+        """
+        records = self.reader.read(start_ts, end_ts, from_keyframe=start_ts is not None)
+        wall_start = time.perf_counter()
+        first_ts = None
+
+        for ts, channel, raw in records:
+            now = ts / 1e9
+            if first_ts is None:
+                first_ts = now
+                self._setup(now)
+
+            await self._advance(now)
+
+            try:
+                if channel == 'keyframe':
+                    self._load_keyframe(decoding.loads(raw))
+                elif channel == 'market':
+                    messages = decode_market_frame(raw)
+                    process_data(messages, trade=start_ts is None or ts >= start_ts)
+                    if self.fill_model is not None:
+                        for market in {message.market for message in messages}:
+                            self.client.check_fills(market)
+                elif channel == 'user' and self.fill_model is None:
+                    process_user_data(decode_user_frame(raw))
+                self.stats[f'{channel}_frames'] += 1
+            except Exception:
+                # Live, the same exception would drop the frame and reconnect the socket
+                self.stats['failed_frames'] += 1
+                print(f"Error replaying {channel} frame at {ts}")
+                print(traceback.format_exc())
+
+            await self._settle()
+
+        if first_ts is None:
+            return self.summary(0, 0)
+
+        await self._advance(self.clock.now + drain_seconds)
+        return self.summary(self.clock.now - first_ts, time.perf_counter() - wall_start)
+
+    def summary(self, simulated_seconds, wall_seconds):
+        marks = {}
+        for _, row in global_state.df.iterrows():
+            book = global_state.all_data.get(str(row['condition_id']))
+            if book is not None and book.best_bid is not None and book.best_ask is not None:
+                mid = (book.best_bid + book.best_ask) / 2
+                token1 = str(row['token1']) if str(book.asset_id) == str(row['token1']) else str(row['token2'])
+                marks[token1] = mid
+                marks[global_state.REVERSE_TOKENS[token1]] = 1 - mid
+
+        positions = {token: size for token, size in self.client.positions.items() if size} if self.client else {}
+        cash = self.client.cash if self.client else 0.0
+        equity = cash + sum(size * marks.get(token, 0) for token, size in positions.items())
+
+        return {
+            'simulated_seconds': round(simulated_seconds, 1),
+            'wall_seconds': round(wall_seconds, 2),
+            'speedup': round(simulated_seconds / wall_seconds, 1) if wall_seconds else None,
+            'frames': dict(self.stats),
+            'triggers': trigger_scheduler.stats(),
+            'book_integrity': book_integrity.report()['totals'],
+            # Wall-clock processing time per stage; simulated exchange delays are not included
+            'latency': latency_tracer.report(),
+            'exchange': dict(self.client.stats) if self.client else {},
+            'positions': positions,
+            'cash': round(cash, 4),
+            'marked_equity': round(equity, 4),
+        }
+
@@ -0,0 +1,50 @@
+class RingBuffer:
+    """
+    Bounded single-producer / single-consumer ring buffer.
+
+    The producer only ever advances _tail and the consumer only ever advances
+    _head, and each slot is written before the index that publishes it, so one
+    thread can put() while another get()s without taking a lock. With more than
+    one producer or consumer use a queue.Queue instead.
+
+    Args:
+        capacity (int): Maximum number of items held; put() fails when full
+    """
+
+    __slots__ = ('capacity', '_items', '_head', '_tail', 'dropped', 'high_water')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def put(self, item):
+        """Append item. Returns False, and counts a drop, if the buffer is full."""
+        depth = self._tail - self._head
+        if depth >= self.capacity:
+            self.dropped += 1
+            return False
+
+        self._items[self._tail % self.capacity] = item
+        self._tail += 1
+
+        if depth + 1 > self.high_water:
+            self.high_water = depth + 1
+        return True
+
+    def get(self):
+        """Remove and return the oldest item, or None if the buffer is empty."""
+        if self._head == self._tail:
+            return None
+
+        index = self._head % self.capacity
+        item = self._items[index]
+        self._items[index] = None
+        self._head += 1
+        return item
+
+    def __len__(self):
+        return self._tail - self._head
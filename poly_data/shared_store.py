@@ -0,0 +1,127 @@
+import threading
+import zlib
+
+import poly_data.global_state as global_state
+from poly_data.log import get_logger
+
+log = get_logger(__name__)
+
+
+def market_owner(condition_id, workers):
+    """
+    Index of the worker process that trades a market.
+
+    A stable hash of the condition ID, so every process computes the same owner
+    and a market keeps its worker across sheet reloads and worker restarts.
+    """
+    return zlib.crc32(str(condition_id).encode()) % workers
+
+
+def owned_markets(df):
+    """Rows of a Selected Markets frame traded by this process; all rows outside supervisor mode."""
+    if global_state.shard is None or df is None or len(df) == 0:
+        return df
+    index, workers = global_state.shard
+    return df[df['condition_id'].map(lambda condition_id: market_owner(condition_id, workers) == index)]
+
+
+def owned_tokens(frame, column):
+    """Rows of a positions or orders frame for tokens of the markets this process trades."""
+    if global_state.shard is None or len(frame) == 0:
+        return frame
+    return frame[frame[column].astype(str).isin(global_state.REVERSE_TOKENS.keys())]
+
+
+class SharedStore:
+    """
+    Positions, open orders and risk-off state of every worker, served by a
+    multiprocessing manager so the supervisor and all workers see one view.
+
+    Both tokens of a market belong to the worker that owns the market (see
+    market_owner), so each token has a single writer and exposure checks that
+    need both tokens read the worker's local state, which is always consistent.
+    The store is what other processes read: the worker publishes a market's two
+    tokens together, from a background thread, so the trading loop only marks
+    tokens dirty and never waits on the manager.
+
+    Args:
+        positions (DictProxy): {token: {'size', 'avgPrice'}}
+        orders (DictProxy): {token: {order_id: order}}, as in global_state.orders
+        risk_off (DictProxy): {condition_id: risk-off details}
+    """
+
+    def __init__(self, positions, orders, risk_off):
+        self.positions = positions
+        self.orders = orders
+        self.risk_off = risk_off
+
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._publisher = None
+
+    @classmethod
+    def create(cls, manager):
+        """Create the shared dicts on a started multiprocessing manager."""
+        return cls(manager.dict(), manager.dict(), manager.dict())
+
+    def __getstate__(self):
+        return {'positions': self.positions, 'orders': self.orders, 'risk_off': self.risk_off}
+
+    def __setstate__(self, state):
+        self.__init__(state['positions'], state['orders'], state['risk_off'])
+
+    # ---- worker side ----
+
+    def publish(self, tokens):
+        """Mark tokens, and the other token of their markets, to be written to the store."""
+        with self._lock:
+            for token in tokens:
+                token = str(token)
+                self._dirty.add(token)
+                reverse = global_state.REVERSE_TOKENS.get(token)
+                if reverse is not None:
+                    self._dirty.add(reverse)
+        self._wake.set()
+
+    def publish_risk_off(self, market, details):
+        self.risk_off[str(market)] = details
+
+    def start_publisher(self):
+        self._publisher = threading.Thread(target=self._publish_loop, name="store-publisher", daemon=True)
+        self._publisher.start()
+
+    def _publish_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                tokens, self._dirty = self._dirty, set()
+
+            # Copies of the entries as they are now; the trading loop keeps mutating them
+            positions = {}
+            orders = {}
+            for token in tokens:
+                position = global_state.positions.get(token)
+                if position is not None:
+                    positions[token] = dict(position)
+                orders[token] = {order_id: dict(order) for order_id, order in
+                                 list(global_state.orders.get(token, {}).items())}
+
+            try:
+                if positions:
+                    self.positions.update(positions)
+                self.orders.update(orders)
+            except Exception:
+                log.error("Error publishing to the shared store", tokens=len(tokens), exc_info=True)
+
+    # ---- supervisor side ----
+
+    def report(self):
+        positions = dict(self.positions)
+        orders = dict(self.orders)
+        return {
+            'positions': sum(1 for position in positions.values() if position['size'] != 0),
+            'orders': sum(len(token_orders) for token_orders in orders.values()),
+            'risk_off': len(self.risk_off),
+        }
@@ -0,0 +1,95 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from py_clob_client.clob_types import CreateOrderOptions
+from py_clob_client.constants import POLYGON
+from py_clob_client.order_builder.builder import OrderBuilder
+from py_clob_client.signer import Signer
+
+# Order builder of a worker process, created once by _init_worker
+_builder = None
+
+
+def _init_worker(key, chain_id, signature_type, funder):
+    global _builder
+    _builder = OrderBuilder(Signer(key, chain_id), sig_type=signature_type, funder=funder)
+
+
+def _worker_pid(_):
+    return os.getpid()
+
+
+def _sign_chunk(jobs):
+    return [
+        _builder.create_order(order_args, CreateOrderOptions(tick_size=tick_size, neg_risk=neg_risk))
+        for order_args, tick_size, neg_risk in jobs
+    ]
+
+
+class SigningService:
+    """
+    Signs EIP-712 orders on a pool of worker processes.
+
+    Order signing is pure-Python hashing and elliptic-curve math that holds the
+    GIL for around ten milliseconds per order, so signing a mass requote on the
+    trading process stalls it for seconds. Each worker builds its order builder
+    from the key once at startup; batches are split into chunks and signed in
+    parallel, one chunk per round trip.
+
+    Jobs carry everything the exchange would otherwise be asked for (tick size,
+    fee rate in the OrderArgs, neg-risk flag), so workers make no HTTP calls.
+    PolymarketClient.sign_orders resolves those before handing a batch over.
+
+    Start the service before other threads, since workers are forked from the
+    calling process.
+
+    Args:
+        key (str): Private key orders are signed with
+        funder (str): Address holding the funds (the browser wallet)
+        chain_id (int): Chain ID, defaults to Polygon
+        signature_type (int): Polymarket signature type, 2 for browser wallets
+        workers (int, optional): Worker processes, defaults to the CPU count
+        chunk (int): Orders signed per worker round trip
+    """
+
+    def __init__(self, key, funder, chain_id=POLYGON, signature_type=2, workers=None, chunk=4):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk = chunk
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(key, chain_id, signature_type, funder),
+        )
+        self.signed = 0
+
+    def sign(self, jobs):
+        """
+        Sign a batch of orders.
+
+        Args:
+            jobs (list): (OrderArgs, tick_size, neg_risk) tuples; tick_size is the
+                market's tick as a string, e.g. "0.01"
+
+        Returns:
+            list: SignedOrder per job, in order
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return []
+
+        # Spread small batches over every worker instead of filling one chunk
+        size = max(1, min(self.chunk, -(-len(jobs) // self.workers)))
+        chunks = [jobs[start:start + size] for start in range(0, len(jobs), size)]
+
+        signed = []
+        for result in self._pool.map(_sign_chunk, chunks):
+            signed.extend(result)
+        self.signed += len(signed)
+        return signed
+
+    def warm_up(self):
+        """Start every worker now rather than on the first batch."""
+        list(self._pool.map(_worker_pid, range(self.workers)))
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,237 @@
+import threading
+from collections import Counter
+
+import poly_data.clock as clock
+import poly_data.global_state as global_state
+from poly_data.log import get_logger
+
+log = get_logger(__name__)
+
+# Order event types and statuses after which an order no longer rests on the book
+CLOSED_ORDER_STATUSES = {'CANCELLATION', 'CANCELED', 'CANCELLED', 'UNMATCHED'}
+
+# Seconds after an order event on a token during which the REST audit leaves the
+# token alone: the snapshot may predate the event, or not show a new order yet
+ORDER_SETTLE_SECONDS = 5
+
+
+def order_entry(order_id, side, price, original_size, size_matched, status, created):
+    return {
+        'id': order_id,
+        'side': side.lower(),
+        'price': float(price),
+        'original_size': float(original_size),
+        'size_matched': float(size_matched),
+        'size': float(original_size) - float(size_matched),
+        'status': status,
+        'created': created,
+    }
+
+
+class StateReducer:
+    """
+    The single writer of global_state.orders and global_state.positions.
+
+    Every change arrives as an event dict and is applied by apply(). The user
+    channel and the order gateway's acknowledgements are the primary sources;
+    the REST snapshots only audit the result, see audit_orders():
+
+        {'type': 'order', 'token', 'id', 'side', 'price', 'original_size', 'size_matched', 'status'}
+        {'type': 'cancel', 'ids'}                         cancels the exchange acknowledged
+        {'type': 'clear', 'token'}                        every order of a token cancelled
+        {'type': 'trade', 'token', 'side', 'size', 'price'}   fill or merge, moves the position
+        {'type': 'position', 'token', 'size', 'avgPrice'}     position taken from a snapshot
+
+    Each event also carries its 'source', e.g. websocket, post, cancel, merge or
+    audit, which is what the counters are kept by.
+
+    Events are only applied on the trading loop's thread, so handlers iterate
+    the state without locks. Background threads fetch REST snapshots and hand
+    them to the loop (main.run_on_loop) instead of applying them.
+    """
+
+    def __init__(self):
+        self.applied = Counter()
+        self.divergences = Counter()
+        self.audits = 0
+        self.last_audit = None
+
+        # token -> clock.time() of its last order event from a live source
+        self.last_order_event = {}
+        self._audit_requested = threading.Event()
+
+    def apply(self, event):
+        event_type = event['type']
+        tokens = getattr(self, '_apply_' + event_type)(event)
+        self.applied[(event_type, event.get('source', 'unknown'))] += 1
+
+        if event_type in ('order', 'cancel', 'clear') and event.get('source') != 'audit':
+            now = clock.time()
+            for token in tokens:
+                self.last_order_event[token] = now
+
+        if tokens and global_state.store is not None:
+            global_state.store.publish(tokens)
+
+    # ---- handlers, each returning the tokens it changed ----
+
+    def _apply_order(self, event):
+        token = str(event['token'])
+        order_id = event['id']
+        token_orders = global_state.orders.setdefault(token, {})
+
+        if (str(event['status']).upper() in CLOSED_ORDER_STATUSES
+                or float(event['original_size']) - float(event['size_matched']) <= 0):
+            token_orders.pop(order_id, None)
+            log.debug("Removed order", token=token, id=order_id, status=event['status'])
+            return [token]
+
+        previous = token_orders.get(order_id)
+        created = previous['created'] if previous else event.get('created') or clock.time()
+
+        token_orders[order_id] = order_entry(order_id, event['side'], event['price'], event['original_size'],
+                                             event['size_matched'], event['status'], created)
+        log.debug("Updated order", token=token, id=order_id, side=event['side'], price=float(event['price']),
+                  size=token_orders[order_id]['size'], status=event['status'])
+        return [token]
+
+    def _apply_cancel(self, event):
+        order_ids = set(event['ids'])
+        tokens = []
+        for token, token_orders in global_state.orders.items():
+            removed = order_ids.intersection(token_orders)
+            for order_id in removed:
+                del token_orders[order_id]
+            if removed:
+                tokens.append(token)
+        return tokens
+
+    def _apply_clear(self, event):
+        token = str(event['token'])
+        global_state.orders.pop(token, None)
+        return [token]
+
+    def _apply_trade(self, event):
+        token = str(event['token'])
+        size = float(event['size'])
+        price = float(event['price'])
+
+        global_state.last_trade_update[token] = clock.time()
+
+        if event['side'].lower() == 'sell':
+            size *= -1
+
+        position = global_state.positions.get(token)
+        if position is not None:
+            prev_price = position['avgPrice']
+            prev_size = position['size']
+
+            if size > 0:
+                if prev_size == 0:
+                    # Starting a new position
+                    avg_price = price
+                else:
+                    # Buying more; update average price
+                    avg_price = (prev_price * prev_size + price * size) / (prev_size + size)
+            else:
+                # Selling or no change; average price remains the same
+                avg_price = prev_price
+
+            position['size'] += size
+            position['avgPrice'] = avg_price
+        else:
+            global_state.positions[token] = {'size': size, 'avgPrice': price}
+
+        log.debug("Updated position", token=token, source=event.get('source'),
+                  size=global_state.positions[token]['size'], avg_price=global_state.positions[token]['avgPrice'])
+        return [token]
+
+    def _apply_position(self, event):
+        token = str(event['token'])
+        # Swap in a new dict so readers never see the size and price of different snapshots
+        global_state.positions[token] = {'size': float(event['size']), 'avgPrice': float(event['avgPrice'])}
+        return [token]
+
+    # ---- REST audit ----
+
+    def request_audit(self):
+        """Ask for an audit as soon as possible, e.g. after the user channel reconnected."""
+        self._audit_requested.set()
+
+    def wait_for_audit_request(self, timeout):
+        """Sleep up to timeout seconds; True if an audit was requested meanwhile."""
+        requested = self._audit_requested.wait(timeout)
+        self._audit_requested.clear()
+        return requested
+
+    def audit_orders(self, snapshot, fetched_at):
+        """
+        Compare the open orders from REST with the event-sourced state and repair differences.
+
+        Tokens with a live order event after fetched_at - ORDER_SETTLE_SECONDS are
+        skipped: the snapshot may predate the event. The repairs are applied as
+        'audit' events through the reducer like any other change.
+
+        Args:
+            snapshot (dict): {token: {order_id: order row}} from get_all_orders
+            fetched_at (float): clock.time() when the snapshot was requested
+
+        Returns:
+            Counter: Divergences found by kind: missing (only in REST), stale (only
+                local), mismatch (both, different fills or price) and skipped
+        """
+        found = Counter()
+        settled_before = fetched_at - ORDER_SETTLE_SECONDS
+
+        for token in set(snapshot) | set(global_state.orders):
+            remote = snapshot.get(token, {})
+            local = global_state.orders.get(token, {})
+            if remote.keys() == local.keys() and all(_same_order(local[order_id], row)
+                                                     for order_id, row in remote.items()):
+                continue
+
+            if self.last_order_event.get(token, float('-inf')) > settled_before:
+                found['skipped'] += 1
+                continue
+
+            stale = [order_id for order_id in local if order_id not in remote]
+            if stale:
+                found['stale'] += len(stale)
+                self.apply({'type': 'cancel', 'ids': stale, 'source': 'audit'})
+
+            for order_id, row in remote.items():
+                if order_id not in local:
+                    found['missing'] += 1
+                elif _same_order(local[order_id], row):
+                    continue
+                else:
+                    found['mismatch'] += 1
+                self.apply({'type': 'order', 'token': token, 'id': order_id, 'side': row['side'],
+                            'price': row['price'], 'original_size': row['original_size'],
+                            'size_matched': row['size_matched'], 'status': 'LIVE',
+                            'created': float(row.get('created_at') or clock.time()), 'source': 'audit'})
+
+        self.audits += 1
+        self.last_audit = clock.time()
+        self.divergences.update(found)
+        return found
+
+    def report(self):
+        applied = Counter()
+        for (event_type, source), count in self.applied.items():
+            applied[f"{event_type}/{source}"] += count
+        return {
+            'applied': dict(applied),
+            'audits': self.audits,
+            'divergences': dict(self.divergences),
+        }
+
+
+def _same_order(entry, row):
+    return (entry['side'] == str(row['side']).lower()
+            and abs(entry['price'] - float(row['price'])) < 1e-9
+            and abs(entry['original_size'] - float(row['original_size'])) < 1e-9
+            and abs(entry['size_matched'] - float(row['size_matched'])) < 1e-9)
+
+
+state_reducer = StateReducer()
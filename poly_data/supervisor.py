@@ -0,0 +1,219 @@
+import atexit
+import gc
+import multiprocessing
+import threading
+import time
+
+import poly_data.clock as clock
+import poly_data.global_state as global_state
+from poly_data.log import get_logger
+from poly_data.polymarket_client import PolymarketClient
+from poly_data.shared_store import SharedStore, market_owner
+from poly_data.state_reducer import state_reducer
+from poly_data.utils import get_sheet_df
+from poly_data.websocket_handlers import maintain_user_websocket
+
+log = get_logger(__name__)
+
+
+class WorkerProcess:
+    """Handle on one worker process and the queue feeding it."""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.inbox = None
+        self.restarts = 0
+        self.user_rows = 0
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    """
+    Run the selected markets on several worker processes.
+
+    Each market belongs to the worker market_owner() assigns it to; the worker
+    holds the books, strategies and order state of its markets and runs its own
+    market websocket shards, strategy loop and order gateway. The supervisor does
+    the account-wide I/O once for all of them:
+
+    - It holds the user websocket and forwards each trade and order row to the
+      worker owning the row's market.
+    - It reads the sheet every 30 seconds, and the positions and orders REST
+      endpoints on the audit interval, and sends each worker its markets' slice,
+      so API calls and sheet reads do not grow with the number of workers.
+    - It serves the SharedStore the workers publish their positions, orders and
+      risk-off state to.
+
+    A worker that dies is restarted with the latest snapshot.
+
+    Args:
+        workers (int): Number of worker processes
+        target (callable): Worker entry point, called in the new process as
+            target(index, workers, inbox, store)
+        refresh (float): Seconds between checks on the worker processes
+        markets_interval (float): Seconds between sheet reloads
+        audit_interval (float): Seconds between position and order snapshots, which
+            the workers audit their event-sourced state against
+    """
+
+    def __init__(self, workers, target, refresh=5, markets_interval=30, audit_interval=60):
+        self.workers = [WorkerProcess(index) for index in range(workers)]
+        self.target = target
+        self.refresh = refresh
+        self.markets_interval = markets_interval
+        self.audit_interval = audit_interval
+
+        # Spawned, not forked: workers start their own threads, sockets and signing pools
+        self._context = multiprocessing.get_context('spawn')
+        self._manager = None
+        self.store = None
+
+        self._markets = None
+        self._params = None
+        self._positions = None
+        self._orders = None
+        self._orders_fetched_at = None
+        # token -> index of the worker owning its market
+        self._owners = {}
+
+    async def run(self):
+        self._manager = self._context.Manager()
+        self.store = SharedStore.create(self._manager)
+
+        global_state.client = PolymarketClient()
+
+        self.update_markets()
+        self._positions = global_state.client.get_all_positions()
+        self._orders_fetched_at = clock.time()
+        self._orders = global_state.client.get_all_orders()
+
+        for worker in self.workers:
+            self.start_worker(worker)
+        atexit.register(self.stop)
+        log.info("Supervisor started", workers=len(self.workers), markets=len(self._markets))
+
+        threading.Thread(target=self.update_periodically, daemon=True).start()
+
+        await maintain_user_websocket(self.route_user_data)
+
+    def start_worker(self, worker):
+        """Start worker's process and queue the markets, positions and orders it begins with."""
+        worker.inbox = self._context.Queue()
+        worker.process = self._context.Process(
+            target=self.target,
+            args=(worker.index, len(self.workers), worker.inbox, self.store),
+            name=f"worker-{worker.index}",
+        )
+        worker.process.start()
+
+        worker.inbox.put(('markets', self._markets, self._params))
+        worker.inbox.put(('positions', self._slice(self._positions, 'asset', worker.index), False))
+        worker.inbox.put(('orders', self._slice(self._orders, 'asset_id', worker.index), self._orders_fetched_at))
+
+    def stop(self):
+        for worker in self.workers:
+            if worker.alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(5)
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def update_markets(self):
+        received_df, received_params = get_sheet_df()
+        if len(received_df) == 0:
+            return  # Keep trading the previous selection, as load_markets does
+
+        self._markets, self._params = received_df, received_params
+
+        owners = {}
+        for condition_id, token1, token2 in zip(received_df['condition_id'], received_df['token1'],
+                                                received_df['token2']):
+            owner = market_owner(condition_id, len(self.workers))
+            owners[str(token1)] = owner
+            owners[str(token2)] = owner
+        self._owners = owners
+
+    def _slice(self, frame, column, index):
+        """Rows of a positions or orders frame for tokens of worker index's markets."""
+        if frame is None or len(frame) == 0:
+            return frame
+        return frame[frame[column].astype(str).map(self._owners) == index]
+
+    def route_user_data(self, rows):
+        """Forward decoded user channel rows to the workers owning their markets."""
+        by_worker = {}
+        for row in rows:
+            by_worker.setdefault(market_owner(row['market'], len(self.workers)), []).append(row)
+
+        for index, worker_rows in by_worker.items():
+            worker = self.workers[index]
+            worker.user_rows += len(worker_rows)
+            worker.inbox.put(('user', worker_rows))
+
+    def update_periodically(self):
+        """
+        Background thread sending snapshots to the workers, as main.update_periodically
+        does for a single process, and restarting workers that died.
+        """
+        last_audit = last_markets = time.time()
+
+        while True:
+            audit_requested = state_reducer.wait_for_audit_request(self.refresh)
+
+            try:
+                now = time.time()
+                reload_markets = now - last_markets >= self.markets_interval
+                if reload_markets:
+                    self.update_markets()
+                    last_markets = now
+
+                dead = [worker for worker in self.workers if not worker.alive()]
+                audit = audit_requested or now - last_audit >= self.audit_interval
+                if audit or dead:
+                    # A restarted worker starts from these, so they have to be fresh
+                    self._positions = global_state.client.get_all_positions()
+                    self._orders_fetched_at = clock.time()
+                    self._orders = global_state.client.get_all_orders()
+                    last_audit = now
+
+                for worker in self.workers:
+                    if worker in dead:
+                        log.warning("Worker process exited, restarting", worker=worker.index,
+                                    exitcode=worker.process.exitcode if worker.process else None)
+                        worker.restarts += 1
+                        self.start_worker(worker)
+                        continue
+
+                    if reload_markets:
+                        worker.inbox.put(('markets', self._markets, self._params))
+                    if audit:
+                        worker.inbox.put(('positions', self._slice(self._positions, 'asset', worker.index), True))
+                        worker.inbox.put(('orders', self._slice(self._orders, 'asset_id', worker.index), self._orders_fetched_at))
+
+                if reload_markets:
+                    log.info("Supervisor report", report=self.report())
+
+                gc.collect()
+            except Exception:
+                log.error("Error in supervisor update_periodically", exc_info=True)
+
+    def report(self):
+        workers = len(self.workers)
+        markets = self._markets['condition_id'].tolist() if self._markets is not None else []
+        return {
+            'workers': [{
+                'worker': worker.index,
+                'pid': worker.process.pid if worker.process else None,
+                'alive': worker.alive(),
+                'markets': sum(1 for market in markets if market_owner(market, workers) == worker.index),
+                'user_rows': worker.user_rows,
+                'restarts': worker.restarts,
+            } for worker in self.workers],
+            'store': self.store.report(),
+        }
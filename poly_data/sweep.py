@@ -0,0 +1,280 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import poly_data.decoding as decoding
+from poly_data.journal import JournalReader
+from poly_data.orderbook import OrderBook
+from poly_data.trading_utils import (
+    get_buy_sell_amount_vec,
+    get_order_prices_vec,
+    round_down_vec,
+    round_up_vec,
+)
+
+# Hyperparameters that can be swept; anything not in the grid keeps the sheet value
+SWEEP_PARAMS = ['stop_loss_threshold', 'take_profit_threshold', 'spread_threshold',
+                'volatility_threshold', 'sleep_period']
+
+_BOOK_FIELDS = ['best_bid', 'best_bid_size', 'top_bid', 'best_ask', 'best_ask_size', 'top_ask']
+
+
+def make_grid(**values):
+    """
+    Build the cartesian product of parameter values.
+
+    Example:
+        make_grid(stop_loss_threshold=[-5, -3], take_profit_threshold=[1, 2, 3])
+
+    Returns:
+        DataFrame: One row per parameter combination
+    """
+    unknown = set(values) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"Cannot sweep {sorted(unknown)}; choose from {SWEEP_PARAMS}")
+
+    names = list(values)
+    return pd.DataFrame(list(itertools.product(*(values[name] for name in names))), columns=names)
+
+
+def _sample(book, ts, market):
+    # Same lookups as MarketMakerStrategy: size-100 levels with a size-20 fallback for
+    # quoting, size-100 levels alone for the stop-loss mid and spread
+    deets = book.top_of_book(100, 0.1)
+    risk_bid, risk_ask = deets.best_bid, deets.best_ask
+
+    if None in (deets.best_bid, deets.best_ask, deets.best_bid_size, deets.best_ask_size):
+        deets = book.top_of_book(20, 0.1)
+
+    sample = {'ts': ts / 1e9, 'market': market, 'risk_bid': risk_bid, 'risk_ask': risk_ask}
+    for field in _BOOK_FIELDS:
+        sample[field] = getattr(deets, field)
+    return sample
+
+
+def collect_snapshots(journal_dir, start_ts=None, end_ts=None, interval=1.0):
+    """
+    Rebuild the books from a FeedRecorder journal and sample top of book per market.
+
+    Args:
+        journal_dir (str): Journal directory
+        start_ts (int, optional): Start in ns
+        end_ts (int, optional): End in ns
+        interval (float): Minimum seconds between two samples of the same market
+
+    Returns:
+        DataFrame: ts, market, the quoting levels and the stop-loss levels per sample
+    """
+    reader = JournalReader(journal_dir)
+    books, last_sample, samples = {}, {}, []
+    interval_ns = interval * 1e9
+
+    records = reader.read(start_ts, end_ts, channels={'market', 'keyframe'},
+                          from_keyframe=start_ts is not None)
+
+    for ts, channel, raw in records:
+        if channel == 'keyframe':
+            for market, snapshot in decoding.loads(raw).items():
+                books.setdefault(market, OrderBook()).reset(snapshot['asset_id'], snapshot['bids'], snapshot['asks'])
+            continue
+
+        for message in decoding.decode_market_frame(raw):
+            market = message.market
+            if message.event_type == 'book':
+                books.setdefault(market, OrderBook()).reset(message.asset_id, message.bids, message.asks)
+            elif message.event_type == 'price_change' and market in books:
+                book = books[market]
+                for asset_id, side, tick, size, _ in message.price_changes:
+                    if asset_id == book.asset_id:
+                        book.set_level(side, tick, size)
+                book.refresh()
+            else:
+                continue
+
+            if start_ts is not None and ts < start_ts:
+                continue
+            if ts - last_sample.get(market, 0) >= interval_ns:
+                last_sample[market] = ts
+                samples.append(_sample(books[market], ts, market))
+
+    return pd.DataFrame(samples, columns=['ts', 'market', 'risk_bid', 'risk_ask'] + _BOOK_FIELDS)
+
+
+def _token_view(snapshots, name):
+    """Book arrays as seen by token1 or token2, mirroring get_best_bid_ask_deets."""
+    view = {field: snapshots[field].to_numpy(dtype=float) for field in _BOOK_FIELDS + ['risk_bid', 'risk_ask']}
+    if name == 'token1':
+        return view
+
+    return {
+        'best_bid': 1 - view['best_ask'], 'best_bid_size': view['best_ask_size'], 'top_bid': 1 - view['top_ask'],
+        'best_ask': 1 - view['best_bid'], 'best_ask_size': view['best_bid_size'], 'top_ask': 1 - view['top_bid'],
+        'risk_bid': 1 - view['risk_ask'], 'risk_ask': 1 - view['risk_bid'],
+    }
+
+
+def simulate_token(ts, book, row, grid):
+    """
+    Run the quoting rules for one token over a snapshot history, for every parameter set at once.
+
+    Time is looped in Python but each step is vectorized over the parameter grid.
+    Quotes follow get_order_prices / get_buy_sell_amount and the stop-loss and
+    take-profit branches of MarketMakerStrategy. A resting bid fills when a later
+    snapshot's best ask reaches it and a resting ask when the best bid reaches it.
+    Simplifications: the other token's position is ignored, buys are gated on the
+    sheet's 3_hour volatility but not on the sheet price, and quotes are replaced
+    each step rather than kept when the change is small.
+
+    Args:
+        ts (np.ndarray): Snapshot times in seconds
+        book (dict): Token view of the snapshot arrays, see _token_view
+        row (dict): Market row from the Selected Markets sheet
+        grid (dict): Parameter name -> array with one value per parameter set
+
+    Returns:
+        dict: Metric name -> array with one value per parameter set
+    """
+    n = len(grid['stop_loss_threshold'])
+    round_length = len(str(row['tick_size']).split(".")[1])
+    max_size = row.get('max_size', row['trade_size'])
+    volatility = row['3_hour']
+
+    position, avg_price, cash = np.zeros(n), np.zeros(n), np.zeros(n)
+    bid_quote, bid_size = np.zeros(n), np.zeros(n)
+    ask_quote, ask_size = np.zeros(n), np.zeros(n)
+    sleep_until = np.full(n, -np.inf)
+    trades, stop_losses = np.zeros(n), np.zeros(n)
+
+    for t in range(len(ts)):
+        best_bid, best_ask = book['best_bid'][t], book['best_ask'][t]
+        if np.isnan(best_bid) or np.isnan(best_ask):
+            continue
+
+        # Fill quotes left resting by the previous step
+        bought = np.where((bid_size > 0) & (best_ask <= bid_quote), bid_size, 0.0)
+        held = position + bought
+        avg_price = np.where(bought > 0, (avg_price * position + bid_quote * bought) / np.where(held > 0, held, 1), avg_price)
+        cash -= bought * bid_quote
+        position = held
+
+        sold = np.where((ask_size > 0) & (best_bid >= ask_quote), np.minimum(ask_size, position), 0.0)
+        cash += sold * ask_quote
+        position = position - sold
+        trades += (bought > 0) + (sold > 0)
+
+        best_bid, best_ask = round(best_bid, round_length), round(best_ask, round_length)
+        top_bid, top_ask = round(book['top_bid'][t], round_length), round(book['top_ask'][t], round_length)
+
+        bid_price, ask_price = get_order_prices_vec(
+            best_bid, book['best_bid_size'][t], top_bid, best_ask, book['best_ask_size'][t], top_ask, avg_price, row
+        )
+        bid_price, ask_price = np.round(bid_price, round_length), np.round(ask_price, round_length)
+
+        rounded_position = round_down_vec(position, 2)
+        buy_amount, sell_amount = get_buy_sell_amount_vec(rounded_position, bid_price, row)
+
+        # Stop loss: sell at the best bid and stop buying for sleep_period hours
+        risk_bid, risk_ask = book['risk_bid'][t], book['risk_ask'][t]
+        mid_price = round_up_vec((risk_bid + risk_ask) / 2, round_length)
+        spread = round(risk_ask - risk_bid, 2)
+        pnl = np.where(avg_price > 0, (mid_price - avg_price) / np.where(avg_price > 0, avg_price, 1) * 100, 0.0)
+
+        selling = (sell_amount > 0) & (avg_price > 0)
+        stop = selling & (((pnl < grid['stop_loss_threshold']) & (spread <= grid['spread_threshold']))
+                          | (volatility > grid['volatility_threshold']))
+        if not np.isnan(risk_bid):
+            stopped = np.where(stop, sell_amount, 0.0)
+            cash += stopped * risk_bid
+            position = position - stopped
+            trades += stop
+            stop_losses += stop
+            sleep_until = np.where(stop, ts[t] + grid['sleep_period'] * 3600, sleep_until)
+
+        # Buy branch, and the take-profit sell branch when not buying
+        buy_branch = ((rounded_position < max_size) & (rounded_position < 250)
+                      & (buy_amount > 0) & (buy_amount >= row['min_size']))
+        buying = ~stop & buy_branch & (ts[t] >= sleep_until) & (volatility <= grid['volatility_threshold'])
+        bid_quote = np.where(buying, bid_price, bid_quote)
+        bid_size = np.where(buying, buy_amount, np.where(stop | ~buy_branch, 0.0, bid_size))
+
+        take_profit = ~stop & ~buy_branch & (sell_amount > 0) & (avg_price > 0)
+        tp_price = round_up_vec(avg_price + avg_price * grid['take_profit_threshold'] / 100, round_length)
+        ask_quote = np.where(take_profit, round_up_vec(np.maximum(tp_price, ask_price), round_length), ask_quote)
+        ask_size = np.where(take_profit, sell_amount, np.where(stop, 0.0, np.minimum(ask_size, position)))
+
+    valid = ~np.isnan(book['best_bid']) & ~np.isnan(book['best_ask'])
+    last_mid = (book['best_bid'][valid][-1] + book['best_ask'][valid][-1]) / 2 if valid.any() else 0.0
+
+    return {
+        'pnl': cash + position * last_mid,
+        'trades': trades,
+        'stop_losses': stop_losses,
+        'final_position': position,
+    }
+
+
+def _evaluate_chunk(snapshots, markets, market_params, grid):
+    results = []
+
+    for market, market_snapshots in snapshots.groupby('market'):
+        if market not in markets:
+            continue
+
+        row = markets[market]
+        defaults = market_params[market]
+        params = {
+            name: grid[name].to_numpy(dtype=float) if name in grid else np.full(len(grid), float(defaults[name]))
+            for name in SWEEP_PARAMS
+        }
+        ts = market_snapshots['ts'].to_numpy()
+
+        for name in ['token1', 'token2']:
+            metrics = simulate_token(ts, _token_view(market_snapshots, name), row, params)
+            frame = grid.copy()
+            frame['market'], frame['question'], frame['token'] = market, row['question'], name
+            for metric, values in metrics.items():
+                frame[metric] = values
+            results.append(frame)
+
+    return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+
+def run_sweep(snapshots, markets_df, params, grid, workers=None):
+    """
+    Evaluate every parameter combination in grid over the snapshot history on a process pool.
+
+    Args:
+        snapshots (DataFrame): Output of collect_snapshots
+        markets_df (DataFrame): Selected Markets rows, as returned by get_sheet_df
+        params (dict): Hyperparameters by param_type, used for parameters not in grid
+        grid (DataFrame): Output of make_grid
+        workers (int, optional): Worker processes, defaults to the CPU count
+
+    Returns:
+        DataFrame: One row per parameter combination, market and token with its metrics
+    """
+    markets, market_params = {}, {}
+    for _, row in markets_df.iterrows():
+        market = str(row['condition_id'])
+        markets[market] = row.to_dict()
+        market_params[market] = params[row['param_type']]
+
+    workers = workers or os.cpu_count() or 1
+    chunks = np.array_split(np.arange(len(grid)), min(workers, len(grid)))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_evaluate_chunk, snapshots, markets, market_params, grid.iloc[rows].reset_index(drop=True))
+                   for rows in chunks]
+        results = [future.result() for future in futures]
+
+    return pd.concat(results, ignore_index=True)
+
+
+def summarize(results):
+    """Total the per-market results per parameter combination, best PnL first."""
+    keys = [column for column in SWEEP_PARAMS if column in results.columns]
+    summary = results.groupby(keys, as_index=False)[['pnl', 'trades', 'stop_losses']].sum()
+    return summary.sort_values('pnl', ascending=False).reset_index(drop=True)
@@ -1,5 +1,7 @@
 import math 
-from poly_data.data_utils import update_positions
+import numpy as np
+import pandas as pd
+from poly_data.data_utils import get_position, update_positions
 import poly_data.global_state as global_state
 
 # def get_avgPrice(position, assetId):
@@ -26,19 +28,12 @@ import poly_data.global_state as global_state
 #     return api_avgPrice
 
 def get_best_bid_ask_deets(market, name, size, deviation_threshold=0.05):
+    # Cached on the book and kept current on every book/price_change frame
+    tob = global_state.all_data[market].top_of_book(size, deviation_threshold)
 
-    best_bid, best_bid_size, second_best_bid, second_best_bid_size, top_bid = find_best_price_with_size(global_state.all_data[market]['bids'], size, reverse=True)
-    best_ask, best_ask_size, second_best_ask, second_best_ask_size, top_ask = find_best_price_with_size(global_state.all_data[market]['asks'], size, reverse=False)
-    
-    # Handle None values in mid_price calculation
-    if best_bid is not None and best_ask is not None:
-        mid_price = (best_bid + best_ask) / 2
-        bid_sum_within_n_percent = sum(size for price, size in global_state.all_data[market]['bids'].items() if best_bid <= price <= mid_price * (1 + deviation_threshold))
-        ask_sum_within_n_percent = sum(size for price, size in global_state.all_data[market]['asks'].items() if mid_price * (1 - deviation_threshold) <= price <= best_ask)
-    else:
-        mid_price = None
-        bid_sum_within_n_percent = 0
-        ask_sum_within_n_percent = 0
+    best_bid, best_bid_size, second_best_bid, second_best_bid_size, top_bid = tob.best_bid, tob.best_bid_size, tob.second_best_bid, tob.second_best_bid_size, tob.top_bid
+    best_ask, best_ask_size, second_best_ask, second_best_ask_size, top_ask = tob.best_ask, tob.best_ask_size, tob.second_best_ask, tob.second_best_ask_size, tob.top_ask
+    bid_sum_within_n_percent, ask_sum_within_n_percent = tob.bid_sum_within_n_percent, tob.ask_sum_within_n_percent
 
     if name == 'token2':
         # Handle None values before arithmetic operations
@@ -80,32 +75,6 @@ def get_best_bid_ask_deets(market, name, size, deviation_threshold=0.05):
     }
 
 
-def find_best_price_with_size(price_dict, min_size, reverse=False):
-    lst = list(price_dict.items())
-
-    if reverse:
-        lst.reverse()
-    
-    best_price, best_size = None, None
-    second_best_price, second_best_size = None, None
-    top_price = None
-    set_best = False
-
-    for price, size in lst:
-        if top_price is None:
-            top_price = price
-
-        if set_best:
-            second_best_price, second_best_size = price, size
-            break
-
-        if size > min_size:
-            if best_price is None:
-                best_price, best_size = price, size
-                set_best = True
-
-    return best_price, best_size, second_best_price, second_best_size, top_price
-
 def get_order_prices(best_bid, best_bid_size, top_bid,  best_ask, best_ask_size, top_ask, avgPrice, row):
 
     bid_price = best_bid + row['tick_size']
@@ -194,3 +163,185 @@ def get_buy_sell_amount(position, bid_price, row, other_token_position=0):
 
     return buy_amount, sell_amount
 
+
+# ============ Array versions ============
+# Same rules as get_order_prices / get_buy_sell_amount, evaluated element-wise over
+# NumPy arrays so a history of snapshots or a grid of parameters is priced in one call.
+# Row values may be scalars or arrays that broadcast against the book arrays.
+
+def get_order_prices_vec(best_bid, best_bid_size, top_bid, best_ask, best_ask_size, top_ask, avgPrice, row):
+    tick_size = row['tick_size']
+
+    bid_price = np.where(best_bid_size < row['min_size'] * 1.5, best_bid, best_bid + tick_size)
+    ask_price = np.where(best_ask_size < 250 * 1.5, best_ask, best_ask - tick_size)
+
+    bid_price = np.where(bid_price >= top_ask, top_bid, bid_price)
+    ask_price = np.where(ask_price <= top_bid, top_ask, ask_price)
+
+    same = bid_price == ask_price
+    bid_price = np.where(same, top_bid, bid_price)
+    ask_price = np.where(same, top_ask, ask_price)
+
+    ask_price = np.where((ask_price <= avgPrice) & (avgPrice > 0), avgPrice, ask_price)
+
+    return bid_price, ask_price
+
+def get_buy_sell_amount_vec(position, bid_price, row, other_token_position=0):
+    max_size = row.get('max_size', row['trade_size'])
+    trade_size = row['trade_size']
+
+    position = np.asarray(position, dtype=float)
+    total_exposure = position + other_token_position
+    building = position < max_size
+
+    buy_amount = np.where(
+        building,
+        np.minimum(trade_size, max_size - position),
+        np.where(total_exposure < max_size * 2, trade_size, 0.0)
+    )
+    sell_amount = np.where(
+        building,
+        np.where(position >= trade_size, np.minimum(position, trade_size), 0.0),
+        np.minimum(position, trade_size)
+    )
+
+    min_size = row['min_size']
+    buy_amount = np.where((buy_amount > 0.7 * min_size) & (buy_amount < min_size), min_size, buy_amount)
+
+    # A blank multiplier leaves low-priced buys alone; an array holds one multiplier per element.
+    # Blank cells arrive as '' from the sheet and as NaN from a CSV read with pandas.
+    multiplier = row['multiplier']
+    if not isinstance(multiplier, np.ndarray):
+        multiplier = pd.to_numeric(multiplier, errors='coerce')
+    if isinstance(multiplier, np.ndarray) or not pd.isna(multiplier):
+        multiplier = multiplier if isinstance(multiplier, np.ndarray) else int(multiplier)
+        buy_amount = np.where((bid_price < 0.1) & (buy_amount > 0), buy_amount * multiplier, buy_amount)
+
+    return buy_amount, sell_amount
+
+def round_down_vec(number, decimals):
+    factor = 10 ** decimals
+    return np.floor(number * factor) / factor
+
+def round_up_vec(number, decimals):
+    factor = 10 ** decimals
+    return np.ceil(number * factor) / factor
+
+def round_vec(number, decimals):
+    """Round to a per-element number of decimals."""
+    factor = 10.0 ** decimals
+    return np.round(number * factor) / factor
+
+
+# Book fields the market maker prices from, in the order get_portfolio_quotes gathers them
+QUOTE_BOOK_FIELDS = ('best_bid', 'best_bid_size', 'top_bid', 'best_ask', 'best_ask_size', 'top_ask',
+                     'bid_sum_within_n_percent', 'ask_sum_within_n_percent')
+
+def get_portfolio_quotes(markets):
+    """
+    Price both tokens of many markets in one vectorized pass.
+
+    Applies the same rules as pricing each token with get_best_bid_ask_deets,
+    get_order_prices, get_buy_sell_amount and the rounding around them: top of
+    book for a 100 share minimum within 10% (20 shares if that finds no level),
+    token2 seen through the inverted book, positions rounded down to cents.
+
+    Only the cached top of book and positions are read per market; sheet
+    parameters are read column-wise and everything else is computed on arrays
+    covering every token at once.
+
+    Args:
+        markets (pd.DataFrame): Sheet rows of the markets to price, one per condition_id
+
+    Returns:
+        dict: {condition_id: {token (int): quote}}, where each quote holds the book
+            fields in QUOTE_BOOK_FIELDS plus overall_ratio, position, avgPrice,
+            other_position, bid_price, ask_price, mid_price, buy_amount and
+            sell_amount. Markets without an order book or without a sized level
+            on both sides are left out.
+    """
+    priced, book = [], []
+
+    for i, condition_id in enumerate(markets['condition_id'].tolist()):
+        order_book = global_state.all_data.get(condition_id)
+        if order_book is None:
+            continue
+
+        tob = order_book.top_of_book(100, 0.1)
+        if tob.best_bid is None or tob.best_ask is None or tob.best_bid_size is None or tob.best_ask_size is None:
+            tob = order_book.top_of_book(20, 0.1)
+        values = [getattr(tob, field) for field in QUOTE_BOOK_FIELDS]
+        if any(value is None for value in values[:6]):
+            continue
+
+        priced.append(i)
+        book.append(values)
+
+    if not priced:
+        return {}
+
+    markets = markets.iloc[priced]
+    condition_ids = markets['condition_id'].tolist()
+    # Python ints: token IDs are 77 digits, past what a numpy integer holds
+    tokens = [(int(token1), int(token2)) for token1, token2 in zip(markets['token1'], markets['token2'])]
+
+    # token1 reads the book as is. token2's bids are token1's asks at 1 - price.
+    bb, bbs, tb, ba, bas, ta, bsum, asum = np.array(book, dtype=float).T
+    best_bid = np.concatenate([bb, 1 - ba])
+    best_bid_size = np.concatenate([bbs, bas])
+    top_bid = np.concatenate([tb, 1 - ta])
+    best_ask = np.concatenate([ba, 1 - bb])
+    best_ask_size = np.concatenate([bas, bbs])
+    top_ask = np.concatenate([ta, 1 - tb])
+    bid_sum = np.concatenate([bsum, asum])
+    ask_sum = np.concatenate([asum, bsum])
+
+    def column(name):
+        return np.tile(markets[name].to_numpy(dtype=float), 2)
+
+    tick_size = column('tick_size')
+    round_length = np.rint(-np.log10(tick_size))
+    trade_size = column('trade_size')
+    # A blank multiplier means no multiplier
+    multiplier = np.tile(pd.to_numeric(markets['multiplier'], errors='coerce').fillna(1).to_numpy(dtype=int), 2)
+    row = {'tick_size': tick_size, 'min_size': column('min_size'), 'trade_size': trade_size,
+           'max_size': column('max_size') if 'max_size' in markets else trade_size, 'multiplier': multiplier}
+
+    token_ids = [pair[0] for pair in tokens] + [pair[1] for pair in tokens]
+    other_ids = [pair[1] for pair in tokens] + [pair[0] for pair in tokens]
+    positions = [get_position(token) for token in token_ids]
+    position = round_down_vec(np.array([pos['size'] for pos in positions], dtype=float), 2)
+    avg_price = np.array([pos['avgPrice'] for pos in positions], dtype=float)
+    other_position = np.array([get_position(token)['size'] for token in other_ids], dtype=float)
+
+    best_bid = round_vec(best_bid, round_length)
+    best_ask = round_vec(best_ask, round_length)
+    top_bid = round_vec(top_bid, round_length)
+    top_ask = round_vec(top_ask, round_length)
+
+    overall_ratio = np.divide(bid_sum, ask_sum, out=np.zeros_like(bid_sum), where=ask_sum != 0)
+
+    bid_price, ask_price = get_order_prices_vec(best_bid, best_bid_size, top_bid, best_ask,
+                                                best_ask_size, top_ask, avg_price, row)
+    bid_price = round_vec(bid_price, round_length)
+    ask_price = round_vec(ask_price, round_length)
+    mid_price = (top_bid + top_ask) / 2
+
+    buy_amount, sell_amount = get_buy_sell_amount_vec(position, bid_price, row, other_position)
+
+    columns = {
+        'best_bid': best_bid, 'best_bid_size': best_bid_size, 'top_bid': top_bid,
+        'best_ask': best_ask, 'best_ask_size': best_ask_size, 'top_ask': top_ask,
+        'bid_sum_within_n_percent': bid_sum, 'ask_sum_within_n_percent': ask_sum,
+        'overall_ratio': overall_ratio, 'position': position, 'avgPrice': avg_price,
+        'other_position': other_position, 'bid_price': bid_price, 'ask_price': ask_price,
+        'mid_price': mid_price, 'buy_amount': buy_amount, 'sell_amount': sell_amount,
+    }
+    names = list(columns)
+    rows = zip(*(columns[name].tolist() for name in names))
+
+    n_markets = len(condition_ids)
+    quotes = {condition_id: {} for condition_id in condition_ids}
+    for i, values in enumerate(rows):
+        quotes[condition_ids[i % n_markets]][token_ids[i]] = dict(zip(names, values))
+    return quotes
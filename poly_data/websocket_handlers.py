@@ -1,12 +1,20 @@
 import asyncio                      # Asynchronous I/O
 import json                        # JSON handling
+import time                        # Message rate tracking
 import websockets                  # WebSocket client
-import traceback                   # Exception handling
 
 from poly_data.data_processing import process_data, process_user_data
+from poly_data.book_integrity import book_integrity
+from poly_data.decoding import decode_market_frame, decode_user_frame
+from poly_data.latency import latency_tracer
+from poly_data.log import get_logger
+from poly_data.state_reducer import state_reducer
 import poly_data.global_state as global_state
+from strategies.base import BaseStrategy
 
-async def connect_market_websocket(chunk):
+log = get_logger(__name__)
+
+async def connect_market_websocket(chunk, shard=None):
     """
     Connect to Polymarket's market WebSocket API and process market updates.
     
@@ -17,6 +25,8 @@ async def connect_market_websocket(chunk):
     
     Args:
         chunk (list): List of token IDs to subscribe to
+        shard (MarketShard, optional): Shard that owns this connection, used for
+            per-shard message counters and live subscription changes
         
     Notes:
         If the connection is lost, the function will exit and the main loop will
@@ -28,27 +38,45 @@ async def connect_market_websocket(chunk):
         message = {"assets_ids": chunk}
         await websocket.send(json.dumps(message))
 
-        print("\n")
-        print(f"Sent market subscription message: {message}")
+        if shard is not None:
+            shard.websocket = websocket
+
+        log.info("Sent market subscription message", shard=shard.shard_id if shard is not None else None,
+                 tokens=len(chunk))
 
         try:
             # Process incoming market data indefinitely
             while True:
                 message = await websocket.recv()
-                json_data = json.loads(message)
-                # Process order book updates and trigger trading as needed
-                process_data(json_data)
+                received = time.perf_counter()
+                if shard is not None:
+                    shard.messages += 1
+                if global_state.recorder is not None:
+                    global_state.recorder.record('market', message, shard.handoff if shard is not None else None)
+                # Decode straight into tick-indexed book updates
+                messages = decode_market_frame(message)
+                decoded = time.perf_counter()
+                latency_tracer.decoded(received, decoded)
+                if shard is not None and shard.handoff is not None:
+                    # Running on the feed thread; the strategy loop applies the updates
+                    shard.handoff.publish(messages, received, decoded)
+                else:
+                    # Process order book updates and trigger trading as needed
+                    process_data(messages, received=received)
         except websockets.ConnectionClosed:
-            print("Connection closed in market websocket")
-            print(traceback.format_exc())
-        except Exception as e:
-            print(f"Exception in market websocket: {e}")
-            print(traceback.format_exc())
+            log.warning("Connection closed in market websocket", shard=shard.shard_id if shard is not None else None,
+                        exc_info=True)
+        except Exception:
+            log.error("Exception in market websocket", shard=shard.shard_id if shard is not None else None,
+                      exc_info=True)
         finally:
+            if shard is not None:
+                shard.websocket = None
+
             # Brief delay before attempting to reconnect
             await asyncio.sleep(5)
 
-async def connect_user_websocket():
+async def connect_user_websocket(handler=process_user_data):
     """
     Connect to Polymarket's user WebSocket API and process order/trade updates.
     
@@ -57,6 +85,10 @@ async def connect_user_websocket():
     2. Authenticates using API credentials
     3. Processes incoming order and trade updates for the user
     
+    Args:
+        handler (callable, optional): Called with the decoded rows of each frame.
+            The supervisor passes one that forwards rows to the owning worker.
+
     Notes:
         If the connection is lost, the function will exit and the main loop will
         attempt to reconnect after a short delay.
@@ -77,22 +109,238 @@ async def connect_user_websocket():
         # Send authentication message
         await websocket.send(json.dumps(message))
 
-        print("\n")
-        print(f"Sent user subscription message")
+        log.info("Sent user subscription message")
+
+        # Events may have been missed while disconnected; audit against REST now
+        state_reducer.request_audit()
 
         try:
             # Process incoming user data indefinitely
             while True:
                 message = await websocket.recv()
-                json_data = json.loads(message)
+                global_state.user_messages += 1
+                if global_state.recorder is not None:
+                    global_state.recorder.record('user', message)
+                rows = decode_user_frame(message)
                 # Process trade and order updates
-                process_user_data(json_data)
+                handler(rows)
         except websockets.ConnectionClosed:
-            print("Connection closed in user websocket")
-            print(traceback.format_exc())
-        except Exception as e:
-            print(f"Exception in user websocket: {e}")
-            print(traceback.format_exc())
+            log.warning("Connection closed in user websocket", exc_info=True)
+        except Exception:
+            log.error("Exception in user websocket", exc_info=True)
         finally:
             # Brief delay before attempting to reconnect
-            await asyncio.sleep(5)
\ No newline at end of file
+            await asyncio.sleep(5)
+
+async def maintain_user_websocket(handler=process_user_data):
+    """
+    Keep the user WebSocket connected, reconnecting on its own whenever it drops.
+
+    Used with the sharded market feed, where market shards reconnect independently
+    and the user channel should not wait on them.
+
+    Args:
+        handler (callable, optional): Called with the decoded rows of each frame
+    """
+    while True:
+        try:
+            await connect_user_websocket(handler)
+            log.info("Reconnecting to the user websocket")
+        except Exception:
+            log.error("Error in user websocket loop", exc_info=True)
+
+        await asyncio.sleep(1)
+
+
+class MarketShard:
+    """
+    One market WebSocket connection covering a slice of the token universe.
+
+    Each shard runs its own reconnect loop, so a slow or dropped socket only
+    affects the books of its own tokens. Tokens can be added or removed while
+    connected; the shard's token list is also what it subscribes to on reconnect.
+    """
+
+    def __init__(self, shard_id, tokens, handoff=None):
+        self.shard_id = shard_id
+        self.tokens = list(tokens)
+        self.handoff = handoff
+        self.websocket = None
+        self.task = None
+        self.messages = 0
+        self.reconnects = 0
+
+        self._last_report_time = time.time()
+        self._last_report_messages = 0
+
+    async def run(self):
+        while True:
+            try:
+                await connect_market_websocket(self.tokens, shard=self)
+            except Exception:
+                log.error("Error in market shard", shard=self.shard_id, exc_info=True)
+
+            self.reconnects += 1
+            log.info("Reconnecting market shard", shard=self.shard_id, reconnects=self.reconnects)
+            await asyncio.sleep(1)
+
+    async def update_subscription(self, tokens, operation):
+        """
+        Subscribe or unsubscribe tokens on the live connection without reconnecting.
+
+        Args:
+            tokens (list): Token IDs to change
+            operation (str): "subscribe" or "unsubscribe"
+        """
+        if self.websocket is None:
+            return  # Not connected; the next connect subscribes to self.tokens
+
+        message = {"assets_ids": tokens, "operation": operation}
+        try:
+            await self.websocket.send(json.dumps(message))
+            log.info("Changed market shard subscription", shard=self.shard_id, operation=operation,
+                     tokens=len(tokens))
+        except websockets.ConnectionClosed:
+            pass  # The reconnect picks up the current token list
+
+    def report(self):
+        """Return counters for this shard, with the message rate since the previous report."""
+        now = time.time()
+        elapsed = now - self._last_report_time
+        rate = (self.messages - self._last_report_messages) / elapsed if elapsed > 0 else 0.0
+
+        self._last_report_time = now
+        self._last_report_messages = self.messages
+
+        return {
+            'shard': self.shard_id,
+            'tokens': len(self.tokens),
+            'messages': self.messages,
+            'msgs_per_sec': round(rate, 2),
+            'reconnects': self.reconnects,
+        }
+
+
+class MarketFeed:
+    """
+    Market data feed that splits the token universe across one or more WebSocket shards.
+
+    The subscribed token set can be changed while running with sync_tokens(), which
+    diffs it against the current set and sends incremental subscribe/unsubscribe
+    messages on the affected shards instead of tearing connections down.
+
+    Args:
+        tokens_per_shard (int, optional): Maximum number of tokens subscribed on one
+            connection. None or 0 keeps every token on a single connection.
+        handoff (FeedHandoff, optional): Publish decoded frames here instead of
+            applying them, when the feed runs on its own thread (see poly_data.feed_thread)
+    """
+
+    def __init__(self, tokens_per_shard=None, handoff=None):
+        self.tokens_per_shard = tokens_per_shard or None
+        self.handoff = handoff
+        self.shards = []
+        self._next_shard_id = 0
+        self._loop = None
+
+    def _start_shard(self, tokens):
+        shard = MarketShard(self._next_shard_id, tokens, self.handoff)
+        self._next_shard_id += 1
+        self.shards.append(shard)
+        shard.task = asyncio.create_task(shard.run())
+        return shard
+
+    async def run(self, tokens):
+        self._loop = asyncio.get_running_loop()
+
+        chunk = self.tokens_per_shard or max(len(tokens), 1)
+        for start in range(0, len(tokens), chunk):
+            self._start_shard(tokens[start:start + chunk])
+        log.info("Started market shards", shards=len(self.shards), tokens=len(tokens))
+
+        # Shards reconnect on their own, so this never returns
+        await asyncio.Future()
+
+    def sync_tokens(self, tokens, removed_markets=()):
+        """
+        Bring the subscribed token set in line with tokens. Safe to call from any thread.
+
+        Args:
+            tokens (list): Token IDs that should be subscribed
+            removed_markets (iterable): Condition IDs no longer traded, whose books
+                and locks are released
+        """
+        if self._loop is None:
+            return  # Not running yet; run() subscribes to the initial set
+
+        asyncio.run_coroutine_threadsafe(
+            self._apply_tokens(list(tokens), list(removed_markets)), self._loop
+        )
+
+    async def _apply_tokens(self, tokens, removed_markets):
+        wanted = set(tokens)
+        current = {token for shard in self.shards for token in shard.tokens}
+
+        removed = current - wanted
+        added = [token for token in tokens if token not in current]
+        added_count = len(added)
+
+        for shard in list(self.shards):
+            dropped = [token for token in shard.tokens if token in removed]
+            if not dropped:
+                continue
+
+            shard.tokens[:] = [token for token in shard.tokens if token not in removed]
+
+            if shard.tokens:
+                await shard.update_subscription(dropped, "unsubscribe")
+            else:
+                # Nothing left to stream on this connection
+                shard.task.cancel()
+                if shard.websocket is not None:
+                    await shard.websocket.close()
+                self.shards.remove(shard)
+
+        for shard in self.shards:
+            if not added:
+                break
+
+            room = len(added) if self.tokens_per_shard is None else self.tokens_per_shard - len(shard.tokens)
+            if room <= 0:
+                continue
+
+            joining, added = added[:room], added[room:]
+            shard.tokens.extend(joining)
+            await shard.update_subscription(joining, "subscribe")
+
+        chunk = self.tokens_per_shard or max(len(added), 1)
+        for start in range(0, len(added), chunk):
+            self._start_shard(added[start:start + chunk])
+
+        for market in removed_markets:
+            if self.handoff is not None:
+                # Books belong to the strategy loop; release after the market's queued frames
+                self.handoff.call(release_market, market)
+            else:
+                release_market(market)
+
+        if removed or added_count:
+            log.info("Market feed resynced", added=added_count, removed=len(removed), shards=len(self.shards))
+
+    def report(self):
+        return [shard.report() for shard in self.shards]
+
+
+def release_market(market):
+    """Free the order book and strategy lock held for a market that is no longer traded."""
+    global_state.all_data.pop(market, None)
+    book_integrity.forget(market)
+    latency_tracer.forget(market)
+
+    order_cache = getattr(global_state.client, 'order_cache', None)
+    if order_cache is not None:
+        order_cache.forget_market(market)
+
+    lock = BaseStrategy.market_locks.get(market)
+    if lock is not None and not lock.locked():
+        del BaseStrategy.market_locks[market]
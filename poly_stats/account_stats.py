@@ -3,6 +3,7 @@ from py_clob_client.headers.headers import create_level_2_headers
 from py_clob_client.clob_types import RequestArgs
 
 from poly_utils.google_utils import get_spreadsheet
+from poly_data.live_state import StateReader
 from gspread_dataframe import set_with_dataframe
 import requests
 import json
@@ -20,8 +21,27 @@ def get_markets_df(wk_full):
     markets_df['token2'] = markets_df['token2'].astype(str)
     return markets_df
 
+def get_live_orders():
+    """Open orders the running bot publishes to shared memory, or None if it is not publishing."""
+    reader = StateReader.from_env()
+    if reader is None:
+        return None
+    try:
+        live = reader.orders()
+    except (FileNotFoundError, TimeoutError):
+        return None
+    finally:
+        reader.close()
+
+    return [{'asset_id': token, 'original_size': order['original_size'], 'size_matched': order['size_matched'],
+             'side': order['side'].upper(), 'price': order['price']}
+            for token, token_orders in live.items() for order in token_orders.values()]
+
 def get_all_orders(client):
-    orders = client.client.get_orders()
+    # The running bot already holds the open orders; only ask the API when it is not publishing them
+    orders = get_live_orders()
+    if orders is None:
+        orders = client.client.get_orders()
     orders_df = pd.DataFrame(orders)
 
     if len(orders_df) > 0:
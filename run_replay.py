@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+
+import pandas as pd
+
+from poly_data.log import setup_logging
+from poly_data.replay import ReplayEngine, FillModel, LatencyModel
+from poly_data.utils import get_sheet_df
+
+
+def parse_time(value):
+    """Accept a unix timestamp in ns or anything pd.Timestamp understands (UTC)."""
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    return pd.Timestamp(value).value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded feed journal through MarketMakerStrategy")
+    parser.add_argument('journal', help="Directory written with FEED_JOURNAL_DIR")
+    parser.add_argument('--markets', help="CSV of Selected Markets rows (defaults to the Google Sheet)")
+    parser.add_argument('--params', help="JSON file of hyperparameters (defaults to the Google Sheet)")
+    parser.add_argument('--start', help="Start time (UTC timestamp or ns)")
+    parser.add_argument('--end', help="End time (UTC timestamp or ns)")
+    parser.add_argument('--recorded-fills', action='store_true',
+                        help="Replay recorded user frames instead of simulating fills")
+    parser.add_argument('--fill-on-touch', action='store_true', help="Fill when the book touches the order price")
+    parser.add_argument('--fill-ratio', type=float, default=1.0, help="Fraction of remaining size filled per update")
+    parser.add_argument('--order-latency', type=float, default=0.05, help="Seconds until a posted order rests")
+    parser.add_argument('--cancel-latency', type=float, default=0.05, help="Seconds until a cancel takes effect")
+    parser.add_argument('--output', default='replay_output', help="Directory for strategy output files")
+    parser.add_argument('--verbose', action='store_true', help="Show strategy output")
+    args = parser.parse_args()
+
+    # Strategy logs go to stderr so stdout stays the JSON summary
+    setup_logging(level='INFO' if args.verbose else 'WARNING', stream=sys.stderr)
+
+    if args.markets and args.params:
+        markets_df = pd.read_csv(args.markets)
+        params = json.load(open(args.params))
+    else:
+        markets_df, params = get_sheet_df()
+
+    engine = ReplayEngine(
+        args.journal, markets_df, params,
+        fill_model=None if args.recorded_fills else FillModel(args.fill_on_touch, args.fill_ratio),
+        latency_model=LatencyModel(args.order_latency, args.cancel_latency),
+        output_dir=args.output,
+    )
+
+    # Replayed prints go to stderr with --verbose and are dropped otherwise
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stderr if args.verbose else devnull):
+        summary = asyncio.run(engine.run(parse_time(args.start), parse_time(args.end)))
+
+    print(json.dumps(summary, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import json
+
+import pandas as pd
+
+from poly_data.sweep import collect_snapshots, make_grid, run_sweep, summarize
+from poly_data.utils import get_sheet_df
+from run_replay import parse_time
+
+
+def parse_values(value):
+    return [float(item) for item in value.split(',')] if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep quoting hyperparameters over a recorded feed journal")
+    parser.add_argument('journal', help="Directory written with FEED_JOURNAL_DIR")
+    parser.add_argument('--markets', help="CSV of Selected Markets rows (defaults to the Google Sheet)")
+    parser.add_argument('--params', help="JSON file of hyperparameters (defaults to the Google Sheet)")
+    parser.add_argument('--start', help="Start time (UTC timestamp or ns)")
+    parser.add_argument('--end', help="End time (UTC timestamp or ns)")
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds between book samples per market")
+    parser.add_argument('--stop-loss', help="Comma separated stop_loss_threshold values")
+    parser.add_argument('--take-profit', help="Comma separated take_profit_threshold values")
+    parser.add_argument('--spread', help="Comma separated spread_threshold values")
+    parser.add_argument('--volatility', help="Comma separated volatility_threshold values")
+    parser.add_argument('--sleep', help="Comma separated sleep_period values (hours)")
+    parser.add_argument('--workers', type=int, help="Worker processes (defaults to the CPU count)")
+    parser.add_argument('--output', default='sweep_results.csv', help="CSV of per-market results")
+    args = parser.parse_args()
+
+    if args.markets and args.params:
+        markets_df = pd.read_csv(args.markets)
+        params = json.load(open(args.params))
+    else:
+        markets_df, params = get_sheet_df()
+
+    values = {
+        'stop_loss_threshold': parse_values(args.stop_loss),
+        'take_profit_threshold': parse_values(args.take_profit),
+        'spread_threshold': parse_values(args.spread),
+        'volatility_threshold': parse_values(args.volatility),
+        'sleep_period': parse_values(args.sleep),
+    }
+    grid = make_grid(**{name: items for name, items in values.items() if items})
+    if grid.empty:
+        parser.error("give at least one parameter to sweep")
+
+    snapshots = collect_snapshots(args.journal, parse_time(args.start), parse_time(args.end), args.interval)
+    print(f"{len(snapshots)} book samples, {len(grid)} parameter sets")
+
+    results = run_sweep(snapshots, markets_df, params, grid, args.workers)
+    results.to_csv(args.output, index=False)
+
+    print(summarize(results).head(20).to_string())
+
+
+if __name__ == "__main__":
+    main()
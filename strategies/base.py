@@ -21,6 +21,15 @@ class BaseStrategy(ABC):
             self.market_locks[market_id] = asyncio.Lock()
         return self.market_locks[market_id]
 
+    def prepare(self, markets):
+        """Precompute for a batch of markets whose execute() calls are about to run.
+
+        Optional; the default does nothing.
+
+        Args:
+            markets (pd.DataFrame): Sheet rows of the markets, one per condition_id
+        """
+
     @abstractmethod
     async def execute(self, market_id, market_data):
         """Run the strategy for the given market."""
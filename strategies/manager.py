@@ -35,6 +35,23 @@ class StrategyManager:
 
         return strategies
 
+    def prepare_strategies(self, markets):
+        """Give every strategy one prepare() call covering all of its markets in the batch.
+
+        Args:
+            markets (pd.DataFrame): Sheet rows of the markets about to be executed
+        """
+        batches: Dict[BaseStrategy, List[str]] = {}
+        for condition_id in markets['condition_id'].tolist():
+            for strategy in self.get_strategies_for_market(condition_id):
+                batches.setdefault(strategy, []).append(condition_id)
+
+        for strategy, condition_ids in batches.items():
+            try:
+                strategy.prepare(markets[markets['condition_id'].isin(condition_ids)])
+            except Exception as exc:
+                print(f"Error preparing strategy {strategy.__class__.__name__} for {len(condition_ids)} markets: {exc}")
+
     async def execute_strategies(self, condition_id: str, market_data):
         strategies = self.get_strategies_for_market(condition_id)
 
@@ -2,30 +2,56 @@ import asyncio
 import gc
 import json
 import os
-import traceback
+import time
 
 import pandas as pd
 
 import poly_data.CONSTANTS as CONSTANTS
+import poly_data.clock as clock
 import poly_data.global_state as global_state
-from poly_data.data_utils import get_order, get_position, set_position
+from poly_data.order_gateway import OrderBatch, order_gateway
+from poly_data.latency import latency_tracer
+from poly_data.log import get_logger
+from poly_data.data_utils import apply_order_batch, get_order, get_position, set_position
 from poly_data.trading_utils import (
     get_best_bid_ask_deets,
-    get_buy_sell_amount,
-    get_order_prices,
-    round_down,
+    get_portfolio_quotes,
     round_up,
 )
 from trading import send_buy_order, send_sell_order
 
 from .base import BaseStrategy
 
+log = get_logger(__name__)
+
+
+# Seconds a quote priced by prepare() may wait for its market's execution
+QUOTE_MAX_AGE = 1.0
+
 
 class MarketMakerStrategy(BaseStrategy):
+    def __init__(self, client=None):
+        super().__init__(client)
+        # {condition_id: (priced at, {token: quote})} from the last prepare()
+        self._quotes = {}
+
+    def prepare(self, markets):
+        """Price every token of the markets about to be executed in one vectorized pass."""
+        priced_at = time.monotonic()
+        for market_id, quotes in get_portfolio_quotes(markets).items():
+            self._quotes[market_id] = (priced_at, quotes)
+
+    def take_quotes(self, market_id, row):
+        """Quotes prepared for this market if still fresh, else priced now."""
+        prepared = self._quotes.pop(market_id, None)
+        if prepared is not None and time.monotonic() - prepared[0] <= QUOTE_MAX_AGE:
+            return prepared[1]
+        return get_portfolio_quotes(pd.DataFrame([row])).get(market_id, {})
+
     async def execute(self, market_id, market_data):
         async with self.get_lock(market_id):
+            latency_tracer.stage('lock')
             try:
-                client = self.client
                 row = market_data
 
                 round_length = len(str(row['tick_size']).split(".")[1])
@@ -35,7 +61,9 @@ class MarketMakerStrategy(BaseStrategy):
                     {'name': 'token1', 'token': row['token1'], 'answer': row['answer1']},
                     {'name': 'token2', 'token': row['token2'], 'answer': row['answer2']}
                 ]
-                print(f"\n\n{pd.Timestamp.utcnow().tz_localize(None)}: {row['question']}")
+                log.debug("Evaluating market", market=market_id, question=row['question'])
+
+                quotes = self.take_quotes(market_id, row)
 
                 pos_1 = get_position(row['token1'])['size']
                 pos_2 = get_position(row['token2'])['size']
@@ -43,78 +71,51 @@ class MarketMakerStrategy(BaseStrategy):
                 amount_to_merge = min(pos_1, pos_2)
 
                 if float(amount_to_merge) > CONSTANTS.MIN_MERGE_SIZE:
-                    pos_1 = client.get_position(row['token1'])[0]
-                    pos_2 = client.get_position(row['token2'])[0]
+                    (pos_1, _), (pos_2, _) = await asyncio.gather(
+                        order_gateway.get_position(row['token1']),
+                        order_gateway.get_position(row['token2']),
+                    )
                     amount_to_merge = min(pos_1, pos_2)
                     scaled_amt = amount_to_merge / 10**6
 
                     if scaled_amt > CONSTANTS.MIN_MERGE_SIZE:
-                        print(f"Position 1 is of size {pos_1} and Position 2 is of size {pos_2}. Merging positions")
-                        client.merge_positions(amount_to_merge, market_id, row['neg_risk'] == 'TRUE')
+                        log.info("Merging positions", market=market_id, position_1=pos_1, position_2=pos_2, sample=False)
+                        await order_gateway.merge_positions(amount_to_merge, market_id, row['neg_risk'] == 'TRUE')
                         set_position(row['token1'], 'SELL', scaled_amt, 0, 'merge')
                         set_position(row['token2'], 'SELL', scaled_amt, 0, 'merge')
 
+                        # Sizes depend on the positions the merge just reduced
+                        quotes = get_portfolio_quotes(pd.DataFrame([row])).get(market_id, {})
+
+                # Routine cancels and orders for both tokens, sent in one batch after the loop
+                batch = OrderBatch(market_id, (row['token1'], row['token2']))
+
                 for detail in market_details:
                     token = int(detail['token'])
                     orders = get_order(token)
 
-                    deets = get_best_bid_ask_deets(market_id, detail['name'], 100, 0.1)
-
-                    if deets['best_bid'] is None or deets['best_ask'] is None or deets['best_bid_size'] is None or deets['best_ask_size'] is None:
-                        deets = get_best_bid_ask_deets(market_id, detail['name'], 20, 0.1)
-
-                    best_bid = deets['best_bid']
-                    best_bid_size = deets['best_bid_size']
-                    second_best_bid = deets['second_best_bid']
-                    second_best_bid_size = deets['second_best_bid_size']
-                    top_bid = deets['top_bid']
-                    best_ask = deets['best_ask']
-                    best_ask_size = deets['best_ask_size']
-                    second_best_ask = deets['second_best_ask']
-                    second_best_ask_size = deets['second_best_ask_size']
-                    top_ask = deets['top_ask']
+                    quote = quotes.get(token)
+                    if quote is None:
+                        log.info("No sized bid and ask, not quoting", market=market_id, answer=detail['answer'])
+                        continue
 
-                    best_bid = round(best_bid, round_length)
-                    best_ask = round(best_ask, round_length)
+                    best_bid = quote['best_bid']
+                    best_ask = quote['best_ask']
+                    overall_ratio = quote['overall_ratio']
 
-                    try:
-                        overall_ratio = (deets['bid_sum_within_n_percent']) / (deets['ask_sum_within_n_percent'])
-                    except:
-                        overall_ratio = 0
+                    position = quote['position']
+                    avgPrice = quote['avgPrice']
 
-                    try:
-                        second_best_bid = round(second_best_bid, round_length)
-                        second_best_ask = round(second_best_ask, round_length)
-                    except:
-                        pass
+                    bid_price = quote['bid_price']
+                    ask_price = quote['ask_price']
+                    mid_price = quote['mid_price']
 
-                    top_bid = round(top_bid, round_length)
-                    top_ask = round(top_ask, round_length)
+                    log.debug("Quote", market=market_id, answer=detail['answer'], position=position, avg_price=avgPrice,
+                              best_bid=best_bid, best_ask=best_ask, bid_price=bid_price, ask_price=ask_price,
+                              mid_price=mid_price, buy_orders=orders['buy']['size'], sell_orders=orders['sell']['size'])
 
-                    pos = get_position(token)
-                    position = pos['size']
-                    avgPrice = pos['avgPrice']
-
-                    position = round_down(position, 2)
-
-                    bid_price, ask_price = get_order_prices(
-                        best_bid, best_bid_size, top_bid, best_ask,
-                        best_ask_size, top_ask, avgPrice, row
-                    )
-
-                    bid_price = round(bid_price, round_length)
-                    ask_price = round(ask_price, round_length)
-
-                    mid_price = (top_bid + top_ask) / 2
-
-                    print(f"\nFor {detail['answer']}. Orders: {orders} Position: {position}, "
-                          f"avgPrice: {avgPrice}, Best Bid: {best_bid}, Best Ask: {best_ask}, "
-                          f"Bid Price: {bid_price}, Ask Price: {ask_price}, Mid Price: {mid_price}")
-
-                    other_token = global_state.REVERSE_TOKENS[str(token)]
-                    other_position = get_position(other_token)['size']
-
-                    buy_amount, sell_amount = get_buy_sell_amount(position, bid_price, row, other_position)
+                    other_position = quote['other_position']
+                    buy_amount, sell_amount = quote['buy_amount'], quote['sell_amount']
 
                     max_size = row.get('max_size', row['trade_size'])
 
@@ -128,16 +129,16 @@ class MarketMakerStrategy(BaseStrategy):
                         'row': row
                     }
 
-                    print(f"Position: {position}, Other Position: {other_position}, "
-                          f"Trade Size: {row['trade_size']}, Max Size: {max_size}, "
-                          f"buy_amount: {buy_amount}, sell_amount: {sell_amount}")
+                    log.debug("Sizes", market=market_id, answer=detail['answer'], position=position,
+                              other_position=other_position, trade_size=row['trade_size'], max_size=max_size,
+                              buy_amount=buy_amount, sell_amount=sell_amount)
 
-                    os.makedirs('positions/', exist_ok=True)
-                    fname = 'positions/' + str(market_id) + '.json'
+                    os.makedirs(global_state.risk_dir, exist_ok=True)
+                    fname = os.path.join(global_state.risk_dir, str(market_id) + '.json')
 
                     if sell_amount > 0:
                         if avgPrice == 0:
-                            print("Avg Price is 0. Skipping")
+                            log.info("Avg price is 0, skipping", market=market_id, answer=detail['answer'])
                             continue
 
                         order['size'] = sell_amount
@@ -150,10 +151,11 @@ class MarketMakerStrategy(BaseStrategy):
 
                         pnl = (mid_price - avgPrice) / avgPrice * 100
 
-                        print(f"Mid Price: {mid_price}, Spread: {spread}, PnL: {pnl}")
+                        log.debug("Position PnL", market=market_id, answer=detail['answer'], mid_price=mid_price,
+                                  spread=spread, pnl=pnl)
 
                         risk_details = {
-                            'time': str(pd.Timestamp.utcnow().tz_localize(None)),
+                            'time': str(clock.utcnow()),
                             'question': row['question']
                         }
 
@@ -167,19 +169,22 @@ class MarketMakerStrategy(BaseStrategy):
                         if (pnl < params['stop_loss_threshold'] and spread <= params['spread_threshold']) or row['3_hour'] > params['volatility_threshold']:
                             risk_details['msg'] = (f"Selling {pos_to_sell} because spread is {spread} and pnl is {pnl} "
                                                   f"and ratio is {ratio} and 3 hour volatility is {row['3_hour']}")
-                            print("Stop loss Triggered: ", risk_details['msg'])
+                            log.warning("Stop loss triggered, risking off", market=market_id, reason=risk_details['msg'])
 
                             order['size'] = pos_to_sell
                             order['price'] = n_deets['best_bid']
 
-                            risk_details['sleep_till'] = str(pd.Timestamp.utcnow().tz_localize(None) +
+                            risk_details['sleep_till'] = str(clock.utcnow() +
                                                             pd.Timedelta(hours=params['sleep_period']))
 
-                            print("Risking off")
-                            send_sell_order(order)
-                            client.cancel_all_market(market_id)
+                            # cancel_all_market supersedes anything batched for the other token
+                            batch.clear()
+                            await send_sell_order(order, lane='risk_off')
+                            await order_gateway.cancel_all_market(market_id, lane='risk_off')
 
                             open(fname, 'w').write(json.dumps(risk_details))
+                            if global_state.store is not None:
+                                global_state.store.publish_risk_off(market_id, risk_details)
                             continue
 
                     max_size = row.get('max_size', row['trade_size'])
@@ -202,47 +207,51 @@ class MarketMakerStrategy(BaseStrategy):
                             risk_details = json.load(open(fname))
 
                             start_trading_at = pd.to_datetime(risk_details['sleep_till'])
-                            current_time = pd.Timestamp.utcnow().tz_localize(None)
+                            current_time = clock.utcnow()
 
-                            print(risk_details, current_time, start_trading_at)
                             if current_time < start_trading_at:
                                 send_buy = False
-                                print(f"Not sending a buy order because recently risked off. "
-                                     f"Risked off at {risk_details['time']}")
+                                log.info("Not sending a buy order, recently risked off", market=market_id,
+                                         risked_off=risk_details['time'], sleep_till=risk_details['sleep_till'])
 
                         if send_buy:
                             if row['3_hour'] > params['volatility_threshold'] or price_change >= 0.05:
-                                print(f'3 Hour Volatility of {row["3_hour"]} is greater than max volatility of '
-                                      f'{params["volatility_threshold"]} or price of {order["price"]} is outside '
-                                      f'0.05 of {sheet_value}. Cancelling all orders')
-                                client.cancel_all_asset(order['token'])
+                                log.info("Volatility or price move too large, cancelling buy orders", market=market_id,
+                                         token=token, volatility=row['3_hour'],
+                                         max_volatility=params['volatility_threshold'],
+                                         price=order['price'], sheet_value=sheet_value)
+                                batch.cancel_asset(order['token'])
                             else:
                                 rev_token = global_state.REVERSE_TOKENS[str(token)]
                                 rev_pos = get_position(rev_token)
 
                                 if rev_pos['size'] > row['min_size']:
-                                    print("Bypassing creation of new buy order because there is a reverse position")
+                                    log.info("Not buying, there is a reverse position", market=market_id, token=token)
                                     if orders['buy']['size'] > CONSTANTS.MIN_MERGE_SIZE:
-                                        print("Cancelling buy orders because there is a reverse position")
-                                        client.cancel_all_asset(order['token'])
+                                        log.info("Cancelling buy orders, there is a reverse position",
+                                                 market=market_id, token=token)
+                                        batch.cancel_asset(order['token'])
 
                                     continue
 
                                 if overall_ratio < 0:
                                     send_buy = False
-                                    print(f"Not sending a buy order because overall ratio is {overall_ratio}")
-                                    client.cancel_all_asset(order['token'])
+                                    log.info("Not sending a buy order, negative overall ratio", market=market_id,
+                                             token=token, ratio=overall_ratio)
+                                    batch.cancel_asset(order['token'])
                                 else:
                                     if best_bid > orders['buy']['price']:
-                                        print(f"Sending Buy Order for {token} because better price. "
-                                              f"Orders look like this: {orders['buy']}. Best Bid: {best_bid}")
-                                        send_buy_order(order)
+                                        log.debug("Sending buy order, better price", market=market_id, token=token,
+                                                  order_price=orders['buy']['price'], best_bid=best_bid)
+                                        await send_buy_order(order, batch=batch)
                                     elif position + orders['buy']['size'] < 0.95 * max_size:
-                                        print(f"Sending Buy Order for {token} because not enough position + size")
-                                        send_buy_order(order)
+                                        log.debug("Sending buy order, not enough position + size",
+                                                  market=market_id, token=token)
+                                        await send_buy_order(order, batch=batch)
                                     elif orders['buy']['size'] > order['size'] * 1.01:
-                                        print(f"Resending buy orders because open orders are too large")
-                                        send_buy_order(order)
+                                        log.debug("Resending buy orders, open orders too large",
+                                                  market=market_id, token=token)
+                                        await send_buy_order(order, batch=batch)
 
                     elif sell_amount > 0:
                         order['size'] = sell_amount
@@ -256,17 +265,21 @@ class MarketMakerStrategy(BaseStrategy):
                         diff = abs(order_price - tp_price)/tp_price * 100
 
                         if diff > 2:
-                            print(f"Sending Sell Order for {token} because better current order price of "
-                                  f"{order_price} is deviant from the tp_price of {tp_price} and diff is {diff}")
-                            send_sell_order(order)
+                            log.debug("Sending sell order, price deviates from take profit", market=market_id,
+                                      token=token, order_price=order_price, tp_price=tp_price, diff=diff)
+                            await send_sell_order(order, batch=batch)
                         elif orders['sell']['size'] < position * 0.97:
-                            print(f"Sending Sell Order for {token} because not enough sell size. "
-                                  f"Position: {position}, Sell Size: {orders['sell']['size']}")
-                            send_sell_order(order)
+                            log.debug("Sending sell order, not enough sell size", market=market_id, token=token,
+                                      position=position, sell_size=orders['sell']['size'])
+                            await send_sell_order(order, batch=batch)
+
+                latency_tracer.stage('decide')
+                responses = await order_gateway.submit(batch)
+                latency_tracer.acknowledged(responses)
+                apply_order_batch(batch, responses)
 
             except Exception as ex:
-                print(f"Error performing trade for {market_id}: {ex}")
-                traceback.print_exc()
+                log.error("Error performing trade", market=market_id, error=str(ex), exc_info=True)
 
             gc.collect()
-            await asyncio.sleep(2)
+            await clock.sleep(2)
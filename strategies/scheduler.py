@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import poly_data.global_state as global_state
+from poly_data.latency import LatencyHistogram, latency_tracer
+from poly_data.log import get_logger
+from strategies.manager import strategy_manager
+
+log = get_logger(__name__)
+
+
+class TriggerScheduler:
+    """Coalesces strategy triggers so each market has at most one evaluation queued.
+
+    Every book or user event marks its market dirty. A market that is already
+    dirty is not queued again, and a market whose strategies are still running
+    is evaluated once more after they finish. Market data is looked up when the
+    evaluation starts, so it always sees the latest book and sheet row and any
+    intermediate states in between are skipped.
+
+    A market can be put on hold, e.g. while its order book is being resynced.
+    Triggers for a held market are kept pending and run once it is released.
+
+    Markets that become due in the same event loop iteration are started
+    together: their strategies get one prepare() call for the whole batch, so
+    quotes for every dirty market are priced in a single vectorized pass before
+    the per-market executions run.
+    """
+
+    def __init__(self, manager=None):
+        self.manager = manager or strategy_manager
+        self._pending = set()
+        self._running = set()
+        self._held = set()
+        self._starting = []
+
+        self.requested = 0
+        self.coalesced = 0
+        self.executed = 0
+        self.held = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.durations = LatencyHistogram()
+
+    def schedule(self, market):
+        self.requested += 1
+
+        if market in self._pending:
+            self.coalesced += 1
+            return
+
+        self._pending.add(market)
+
+        if market in self._held:
+            self.held += 1
+            return
+
+        if market not in self._running:
+            self._start(market)
+
+    def hold(self, market):
+        self._held.add(market)
+
+    def release(self, market):
+        self._held.discard(market)
+
+        if market in self._pending and market not in self._running:
+            self._start(market)
+
+    def _start(self, market):
+        self._running.add(market)
+        self._starting.append(market)
+        if len(self._starting) == 1:
+            asyncio.get_running_loop().call_soon(self._start_batch)
+
+    def _start_batch(self):
+        markets, self._starting = self._starting, []
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(markets))
+
+        try:
+            df = global_state.df
+            self.manager.prepare_strategies(df[df['condition_id'].isin(markets)].drop_duplicates('condition_id'))
+        except Exception:
+            log.error("Error preparing markets", markets=len(markets), exc_info=True)
+
+        for market in markets:
+            asyncio.create_task(self._run(market))
+
+    async def _run(self, market):
+        try:
+            while market in self._pending and market not in self._held:
+                self._pending.discard(market)
+
+                try:
+                    market_data = global_state.df[global_state.df['condition_id'] == market].iloc[0]
+                except IndexError:
+                    log.warning("No market data found", market=market)
+                    continue
+
+                latency_tracer.begin(market)
+                started = time.perf_counter()
+                await self.manager.execute_strategies(market, market_data)
+                self.durations.record(time.perf_counter() - started)
+                self.executed += 1
+        finally:
+            self._running.discard(market)
+
+    def stats(self):
+        return {
+            'requested': self.requested,
+            'coalesced': self.coalesced,
+            'executed': self.executed,
+            'held': self.held,
+            'batches': self.batches,
+            'max_batch': self.max_batch,
+            'pending': len(self._pending),
+            'running': len(self._running),
+        }
+
+
+trigger_scheduler = TriggerScheduler()
@@ -1,38 +1,86 @@
 import poly_data.global_state as global_state
+from poly_data.data_utils import get_orders, record_posted_orders, remove_orders
+from poly_data.log import get_logger
+from poly_data.order_gateway import order_gateway
 
-def send_buy_order(order):
+log = get_logger(__name__)
+
+def diff_side(live_orders, price, size):
+    """
+    Decide which resting orders on one side of a token survive a requote.
+
+    The oldest order within 0.5 cents and 10% of the new quote is kept, so it
+    holds its queue position. Every other order on the side is cancelled.
+
+    Args:
+        live_orders (list): Resting orders on the side, oldest first (see get_orders)
+        price (float): New quote price
+        size (float): New quote size
+
+    Returns:
+        tuple: (kept order or None, list of order IDs to cancel)
+    """
+    kept = None
+    for live in live_orders:
+        if abs(live['price'] - price) <= 0.005 and abs(live['size'] - size) <= size * 0.1:
+            kept = live
+            break
+
+    cancel_ids = [live['id'] for live in live_orders if live is not kept]
+    return kept, cancel_ids
+
+def presign_around(order, side):
+    """
+    Have the client's order cache sign the prices around a quote that is about to
+    be posted, so the next requote usually finds its signature ready. Quotes kept
+    resting sign nothing.
+    """
+    order_cache = getattr(global_state.client, 'order_cache', None)
+    if order_cache is not None:
+        neg_risk = True if order['neg_risk'] == 'TRUE' else False
+        order_cache.prefetch(order['row']['condition_id'], order['token'], side, order['price'],
+                             order['size'], neg_risk, float(order['row']['tick_size']))
+
+async def cancel_orders(order_ids, batch=None, lane=None):
+    if batch is not None:
+        for order_id in order_ids:
+            batch.cancel_order(order_id)
+    else:
+        await order_gateway.cancel_orders(order_ids, lane=lane)
+        remove_orders(order_ids)
+
+async def post_order(token, side, price, size, neg_risk, batch=None, lane=None):
+    if batch is not None:
+        batch.add_order(token, side, price, size, neg_risk)
+    else:
+        response = await order_gateway.create_order(token, side, price, size, neg_risk, lane=lane)
+        record_posted_orders([(token, side, price, size, neg_risk)], [response])
+
+async def send_buy_order(order, batch=None):
     """
     Create a BUY order for a specific token.
-    
+
     This function:
-    1. Cancels any existing orders for the token
+    1. Diffs the resting buy orders against the new quote, keeping one that is
+       close enough and cancelling the others. Sell orders are left alone.
     2. Checks if the order price is within acceptable range
-    3. Creates a new buy order if conditions are met
-    
+    3. Creates a new buy order if none was kept and conditions are met
+
     Args:
         order (dict): Order details including token, price, size, and market parameters
+        batch (OrderBatch, optional): Add the cancels and order to this batch instead of
+            sending them right away
     """
-    client = global_state.client
-
-    # Only cancel existing orders if we need to make significant changes
-    existing_buy_size = order['orders']['buy']['size']
-    existing_buy_price = order['orders']['buy']['price']
-    
-    # Cancel orders if price changed significantly or size needs major adjustment
-    price_diff = abs(existing_buy_price - order['price']) if existing_buy_price > 0 else float('inf')
-    size_diff = abs(existing_buy_size - order['size']) if existing_buy_size > 0 else float('inf')
-    
-    should_cancel = (
-        price_diff > 0.005 or  # Cancel if price diff > 0.5 cents
-        size_diff > order['size'] * 0.1 or  # Cancel if size diff > 10%
-        existing_buy_size == 0  # Cancel if no existing buy order
-    )
-    
-    if should_cancel and (existing_buy_size > 0 or order['orders']['sell']['size'] > 0):
-        print(f"Cancelling buy orders - price diff: {price_diff:.4f}, size diff: {size_diff:.1f}")
-        client.cancel_all_asset(order['token'])
-    elif not should_cancel:
-        print(f"Keeping existing buy orders - minor changes: price diff: {price_diff:.4f}, size diff: {size_diff:.1f}")
+    market = order['row']['condition_id']
+    kept, cancel_ids = diff_side(get_orders(order['token'], 'buy'), order['price'], order['size'])
+
+    if cancel_ids:
+        log.info("Cancelling buy orders", market=market, token=order['token'], orders=len(cancel_ids))
+        await cancel_orders(cancel_ids, batch)
+
+    if kept is not None:
+        log.debug("Keeping existing buy order", market=market, token=order['token'],
+                  price=kept['price'], size=kept['size'])
         return  # Don't place new order if existing one is fine
 
     # Calculate minimum acceptable price based on market spread
@@ -47,60 +95,49 @@ def send_buy_order(order):
     if trade:
         # Only place orders with prices between 0.1 and 0.9 to avoid extreme positions
         if order['price'] >= 0.1 and order['price'] < 0.9:
-            print(f'Creating new order for {order["size"]} at {order["price"]}')
-            print(order['token'], 'BUY', order['price'], order['size'])
-            client.create_order(
-                order['token'], 
-                'BUY', 
-                order['price'], 
-                order['size'], 
-                True if order['neg_risk'] == 'TRUE' else False
-            )
+            log.info("Creating buy order", market=market, token=order['token'],
+                     price=order['price'], size=order['size'])
+            neg_risk = True if order['neg_risk'] == 'TRUE' else False
+            presign_around(order, 'BUY')
+            await post_order(order['token'], 'BUY', order['price'], order['size'], neg_risk, batch)
         else:
-            print("Not creating buy order because its outside acceptable price range (0.1-0.9)")
+            log.info("Not creating buy order outside the 0.1-0.9 price range", market=market,
+                     token=order['token'], price=order['price'])
     else:
-        print(f'Not creating new order because order price of {order["price"]} is less than incentive start price of {incentive_start}. Mid price is {order["mid_price"]}')
+        log.info("Not creating buy order below the incentive start price", market=market, token=order['token'],
+                 price=order['price'], incentive_start=incentive_start, mid_price=order['mid_price'])
 
 
-def send_sell_order(order):
+async def send_sell_order(order, lane=None, batch=None):
     """
     Create a SELL order for a specific token.
-    
+
     This function:
-    1. Cancels any existing orders for the token
-    2. Creates a new sell order with the specified parameters
-    
+    1. Diffs the resting sell orders against the new quote, keeping one that is
+       close enough and cancelling the others. Buy orders are left alone.
+    2. Creates a new sell order if none was kept
+
     Args:
         order (dict): Order details including token, price, size, and market parameters
+        lane (str, optional): Order gateway lane for both calls, e.g. 'risk_off' for
+            stop-loss sells. Defaults to the cancel and quote lanes.
+        batch (OrderBatch, optional): Add the cancels and order to this batch instead of
+            sending them right away
     """
-    client = global_state.client
-
-    # Only cancel existing orders if we need to make significant changes
-    existing_sell_size = order['orders']['sell']['size']
-    existing_sell_price = order['orders']['sell']['price']
-    
-    # Cancel orders if price changed significantly or size needs major adjustment
-    price_diff = abs(existing_sell_price - order['price']) if existing_sell_price > 0 else float('inf')
-    size_diff = abs(existing_sell_size - order['size']) if existing_sell_size > 0 else float('inf')
-    
-    should_cancel = (
-        price_diff > 0.005 or  # Cancel if price diff > 0.5 cents
-        size_diff > order['size'] * 0.1 or  # Cancel if size diff > 10%
-        existing_sell_size == 0  # Cancel if no existing sell order
-    )
-    
-    if should_cancel and (existing_sell_size > 0 or order['orders']['buy']['size'] > 0):
-        print(f"Cancelling sell orders - price diff: {price_diff:.4f}, size diff: {size_diff:.1f}")
-        client.cancel_all_asset(order['token'])
-    elif not should_cancel:
-        print(f"Keeping existing sell orders - minor changes: price diff: {price_diff:.4f}, size diff: {size_diff:.1f}")
+    market = order['row']['condition_id']
+    kept, cancel_ids = diff_side(get_orders(order['token'], 'sell'), order['price'], order['size'])
+
+    if cancel_ids:
+        log.info("Cancelling sell orders", market=market, token=order['token'], orders=len(cancel_ids))
+        await cancel_orders(cancel_ids, batch, lane)
+
+    if kept is not None:
+        log.debug("Keeping existing sell order", market=market, token=order['token'],
+                  price=kept['price'], size=kept['size'])
         return  # Don't place new order if existing one is fine
 
-    print(f'Creating new order for {order["size"]} at {order["price"]}')
-    client.create_order(
-        order['token'],
-        'SELL',
-        order['price'],
-        order['size'],
-        True if order['neg_risk'] == 'TRUE' else False
-    )
+    log.info("Creating sell order", market=market, token=order['token'], price=order['price'],
+             size=order['size'], sample=lane != 'risk_off')
+    neg_risk = True if order['neg_risk'] == 'TRUE' else False
+    presign_around(order, 'SELL')
+    await post_order(order['token'], 'SELL', order['price'], order['size'], neg_risk, batch, lane)